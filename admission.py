@@ -0,0 +1,152 @@
+"""
+Admission control for the Flask server
+Requests are sorted into priority classes, each with its own concurrency
+limit and queueing time, under one limit for all of them. A class only runs
+when no higher-priority class is queued, and lower classes can't take the
+slots kept for the classes above them, so under overload fall and bed-exit
+readings go first and dashboard polls or report exports are turned away
+with 503 instead of piling up.
+"""
+
+import threading
+import time
+
+import metrics
+
+CRITICAL = 'critical'          # sensor readings that may raise a fall/bed-exit alert
+INGEST = 'ingest'              # other sensor readings
+INTERACTIVE = 'interactive'    # pages, dashboard APIs and user actions
+BACKGROUND = 'background'      # charts, exports and other reporting
+
+CLASSES = (CRITICAL, INGEST, INTERACTIVE, BACKGROUND)   # highest priority first
+
+TOTAL = 'total'                # requests of all classes together
+
+# Requests of a class (and of all classes) allowed to run at once
+LIMITS = {TOTAL: 32, CRITICAL: 32, INGEST: 16, INTERACTIVE: 8, BACKGROUND: 2}
+
+# A class only starts a request while fewer than this share of the total
+# slots are in use; the rest is kept for the classes above it
+SHARE = {CRITICAL: 1.0, INGEST: 0.75, INTERACTIVE: 0.5, BACKGROUND: 0.25}
+
+# Seconds a request may queue for a slot before it gets a 503
+MAX_WAIT = {CRITICAL: 30.0, INGEST: 10.0, INTERACTIVE: 2.0, BACKGROUND: 0.5}
+
+# Readings that look like a fall (close to the sensor) or an exit (moving)
+FALL_DISTANCE_CM = 20.0
+
+BACKGROUND_PATHS = ('/api/charts/', '/api/logs/export', '/api/export/')
+EXEMPT_PATHS = ('/static/', '/metrics')
+
+admission_wait = metrics.histogram('pms_admission_wait_seconds', 'Time queued for an admission slot',
+                                   ('class',))
+admission_rejected = metrics.counter('pms_admission_rejected_total', 'Requests shed with 503', ('class',))
+admission_active = metrics.gauge('pms_admission_active', 'Requests running', ('class',))
+
+
+def is_urgent(reading):
+    """True if a raw sensor payload could be a fall or a bed exit"""
+    try:
+        return int(reading.get('motion') or 0) == 1 or float(reading.get('distance_cm')) < FALL_DISTANCE_CM
+    except (AttributeError, TypeError, ValueError):
+        return False
+
+
+def classify(path, data=None):
+    """Priority class for a request, or None if it bypasses admission control"""
+    if path.startswith(EXEMPT_PATHS):
+        return None
+    if path == '/api/data':
+        readings = data.get('readings') if isinstance(data, dict) and 'readings' in data else data
+        if not isinstance(readings, list):
+            readings = [readings]
+        return CRITICAL if any(is_urgent(r) for r in readings) else INGEST
+    if path.startswith(BACKGROUND_PATHS):
+        return BACKGROUND
+    return INTERACTIVE
+
+
+def parse_limits(text):
+    """Overrides like 'interactive=4,background=1,total=24' (PMS_ADMISSION_LIMITS)"""
+    limits = dict(LIMITS)
+    for item in filter(None, (part.strip() for part in (text or '').split(','))):
+        name, _, value = item.partition('=')
+        if name.strip() not in limits:
+            raise ValueError(f'Unknown admission class: {name}')
+        limits[name.strip()] = int(value)
+    return limits
+
+
+class Ticket:
+    """An admitted request's slot; release() is safe to call more than once"""
+
+    def __init__(self, controller, cls):
+        self.controller = controller
+        self.cls = cls
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller.release(self.cls)
+
+
+def release_after(iterable, ticket):
+    """Wrap a streamed response body so its slot is held until it is sent or closed"""
+    try:
+        yield from iterable
+    finally:
+        ticket.release()
+
+
+class AdmissionController:
+    """Per-class and total concurrency limits with strict priority between classes"""
+
+    def __init__(self, limits=None, max_wait=None):
+        self.limits = dict(LIMITS, **(limits or {}))
+        self.max_wait = dict(max_wait or MAX_WAIT)
+        # Total slots in use above which a class has to wait
+        self.ceiling = {cls: max(1, int(self.limits[TOTAL] * SHARE[cls])) for cls in CLASSES}
+        self.active = dict.fromkeys(CLASSES, 0)
+        self.waiting = dict.fromkeys(CLASSES, 0)
+        self.running = 0
+        self.cond = threading.Condition()
+
+    def _can_run(self, cls):
+        if self.active[cls] >= self.limits[cls] or self.running >= self.ceiling[cls]:
+            return False
+        # Yield to any higher-priority class that is queued
+        for other in CLASSES[:CLASSES.index(cls)]:
+            if self.waiting[other]:
+                return False
+        return True
+
+    def acquire(self, cls):
+        """Wait for a slot; returns a Ticket, or None if the request should be shed"""
+        start = time.monotonic()
+        deadline = start + self.max_wait[cls]
+        with self.cond:
+            self.waiting[cls] += 1
+            try:
+                while not self._can_run(cls):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        admission_rejected.inc(1, cls)
+                        return None
+                    self.cond.wait(remaining)
+                self.active[cls] += 1
+                self.running += 1
+            finally:
+                self.waiting[cls] -= 1
+                # A lower class may have been held back by this one
+                self.cond.notify_all()
+        admission_wait.observe(time.monotonic() - start, cls)
+        admission_active.set(self.active[cls], cls)
+        return Ticket(self, cls)
+
+    def release(self, cls):
+        with self.cond:
+            self.active[cls] -= 1
+            self.running -= 1
+            self.cond.notify_all()
+        admission_active.set(self.active[cls], cls)
@@ -0,0 +1,161 @@
+"""
+Scatter-gather aggregator for sharded Patient Monitoring deployments
+Beds are split across several server.py instances (shards), e.g. one per
+ward, each with its own database and a disjoint bed id range
+(PMS_BED_ID_START). An instance started with PMS_SHARDS answers the admin
+dashboard endpoints by querying every shard in parallel and merging the
+results; nurses and sensor nodes talk to their own ward's shard directly.
+"""
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.parse import urlencode, urlsplit
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+SHARD_TIMEOUT = 3.0   # seconds per shard request
+
+logger = logging.getLogger(__name__)
+
+class ShardError(Exception):
+    """A shard could not be reached or returned an error"""
+
+
+class Shard:
+    """One server.py instance, accessed with a service account session"""
+
+    def __init__(self, name, url, username, password, timeout=SHARD_TIMEOUT):
+        self.name = name
+        self.url = url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+        self.login_lock = threading.Lock()
+
+    def _login(self):
+        data = urlencode({'username': self.username, 'password': self.password}).encode()
+        with self.opener.open(Request(f'{self.url}/login', data=data), timeout=self.timeout) as resp:
+            if urlsplit(resp.geturl()).path == '/login':
+                raise ShardError(f'{self.name}: login as {self.username} failed')
+
+    def get_json(self, path, params=None):
+        """GET a JSON endpoint, logging in again if the session has expired"""
+        url = f'{self.url}{path}' + (f'?{urlencode(params)}' if params else '')
+        for attempt in range(2):
+            try:
+                with self.opener.open(url, timeout=self.timeout) as resp:
+                    # login_required redirects to the login page
+                    if urlsplit(resp.geturl()).path != '/login':
+                        return json.loads(resp.read())
+                if attempt == 0:
+                    with self.login_lock:
+                        self._login()
+            except ShardError:
+                raise
+            except Exception as e:
+                raise ShardError(f'{self.name}: {e}') from e
+        raise ShardError(f'{self.name}: not authenticated')
+
+
+# ==================== MERGING ====================
+
+def merge_latest_readings(results):
+    """Concatenate per-bed rows, tagged with their shard, in bed name order"""
+    rows = []
+    for shard, data in results:
+        for row in data:
+            row['shard'] = shard.name
+            rows.append(row)
+    rows.sort(key=lambda r: (r.get('bed_name') or '', r.get('bed_id') or 0))
+    return rows
+
+def merge_stats(results):
+    """Sum the counters; average temperature weighted by each shard's beds"""
+    merged = {}
+    weighted, weight = 0.0, 0
+    for _, data in results:
+        for key, value in data.items():
+            if key == 'avg_temperature':
+                continue
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[key] = merged.get(key, 0) + value
+        if data.get('avg_temperature') is not None:
+            beds = data.get('monitored_beds') or 1
+            weighted += data['avg_temperature'] * beds
+            weight += beds
+    merged['avg_temperature'] = round(weighted / weight, 1) if weight else None
+    merged['shards'] = len(results)
+    return merged
+
+def merge_temperature_chart(results):
+    pairs = []
+    for _, data in results:
+        pairs.extend(zip(data.get('labels', []), data.get('temperatures', [])))
+    pairs.sort(key=lambda p: p[0])
+    return {'labels': [p[0] for p in pairs], 'temperatures': [p[1] for p in pairs]}
+
+def merge_alert_chart(results):
+    counts = {}
+    for _, data in results:
+        for label, count in zip(data.get('labels', []), data.get('counts', [])):
+            counts[label] = counts.get(label, 0) + count
+    ordered = sorted(counts.items(), key=lambda item: -item[1])
+    return {'labels': [k for k, _ in ordered], 'counts': [v for _, v in ordered]}
+
+# Admin dashboard endpoints served by scatter-gather, with extra shard query args
+ROUTES = {
+    '/api/stats/overview': (merge_stats, {}),
+    '/api/latest_readings': (merge_latest_readings, {}),
+    '/api/charts/temperature': (merge_temperature_chart, {'sample': '0'}),
+    '/api/charts/alerts': (merge_alert_chart, {'sample': '0'}),
+}
+
+
+# ==================== AGGREGATOR ====================
+
+class Aggregator:
+    """Fan requests out to all shards in parallel and merge the answers"""
+
+    def __init__(self, shards):
+        self.shards = shards
+        self.executor = ThreadPoolExecutor(max_workers=max(4, len(shards)),
+                                           thread_name_prefix='shard')
+
+    def gather(self, path, params=None):
+        """Returns ([(shard, data)], [failed shard names]); slow or down shards are skipped"""
+        futures = [(shard, self.executor.submit(shard.get_json, path, params)) for shard in self.shards]
+        results, failed = [], []
+        for shard, future in futures:
+            try:
+                results.append((shard, future.result()))
+            except Exception as e:
+                logger.warning(f'Shard request {path} failed: {e}')
+                failed.append(shard.name)
+        return results, failed
+
+    def handle(self, path, args):
+        """Merged response for one of ROUTES"""
+        merge, extra = ROUTES[path]
+        params = dict(args)
+        params.update(extra)
+        results, failed = self.gather(path, params)
+        return merge(results), failed
+
+
+def load_shards(config, username=None, password=None):
+    """
+    Build shards from JSON (inline or a file path):
+    [{"name": "ward-a", "url": "http://ward-a:5000"}, ...]
+    Entries may override the service account with "username"/"password".
+    """
+    if os.path.exists(config):
+        with open(config) as f:
+            config = f.read()
+    return [
+        Shard(s.get('name') or s['url'], s['url'], s.get('username', username), s.get('password', password))
+        for s in json.loads(config)
+    ]
@@ -0,0 +1,188 @@
+"""
+Incrementally maintained alert counts for Patient Monitoring System
+alert_counters keeps one row per (hour, bed, alert_type, status): how many
+alerts created in that hour are currently in that status. Creating,
+resolving and clearing alerts adjust the rows in the same transaction, so
+the dashboard stats and alert chart add up a handful of buckets instead of
+scanning the alerts table. Alert types are grouped into categories, stored
+(and indexed) on both tables instead of matched with LIKE.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+FALL_RISK = 'fall_risk'
+ENVIRONMENTAL = 'environmental'
+BEHAVIORAL = 'behavioral'
+OTHER = 'other'
+
+CATEGORIES = {
+    'bed_exit': FALL_RISK,
+    'possible_fall': FALL_RISK,
+    'temp_out_of_range': ENVIRONMENTAL,
+    'humidity_out_of_range': ENVIRONMENTAL,
+    'low_humidity_danger': ENVIRONMENTAL,
+    'high_humidity_danger': ENVIRONMENTAL,
+    'long_inactivity': BEHAVIORAL,
+    'restlessness_night': BEHAVIORAL,
+}
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Hour bucket of a timestamp column (translated to date_trunc for PostgreSQL)
+HOUR_SQL = "strftime('%Y-%m-%d %H:00:00', {})"
+
+_UPSERT = '''
+    INSERT INTO alert_counters (hour, bed_id, alert_type, category, status, count)
+    {}
+    ON CONFLICT (hour, bed_id, alert_type, status) DO UPDATE SET count = alert_counters.count + excluded.count
+'''
+
+# Alerts on the counts: alerts from before the counters existed are counted
+# (and given a category) by migration 5; until then changes leave the counts alone
+_COUNTED = 'created_at IS NOT NULL AND category IS NOT NULL'
+
+def category(alert_type):
+    """Category of an alert type; unknown types that mention a fall or exit count as fall risk"""
+    if alert_type in CATEGORIES:
+        return CATEGORIES[alert_type]
+    name = (alert_type or '').lower()
+    return FALL_RISK if 'fall' in name or 'exit' in name else OTHER
+
+def now():
+    return datetime.now(timezone.utc).strftime(TIME_FORMAT)
+
+def hour_of(timestamp):
+    """'YYYY-MM-DD HH:00:00' bucket of a 'YYYY-MM-DD HH:MM:SS' timestamp"""
+    return timestamp[:13] + ':00:00'
+
+def hours_ago(hours):
+    """
+    First bucket of a window covering the last `hours` hours. Buckets are
+    whole hours, so the window reaches back between `hours` and `hours` + 1
+    hours (the oldest bucket counts from the start of its hour).
+    """
+    return hour_of((datetime.now(timezone.utc) - timedelta(hours=hours)).strftime(TIME_FORMAT))
+
+# ==================== UPDATES ====================
+
+def record_created(db, bed_id, alert_type, created_at):
+    """Count a newly inserted alert (call in the INSERT's transaction)"""
+    db.execute(_UPSERT.format('VALUES (?, ?, ?, ?, ?, 1)'),
+               (hour_of(created_at), bed_id, alert_type, category(alert_type), 'new'))
+
+def set_status(db, where, params, status):
+    """
+    Move the alerts matching `where` (SQL over alerts, with `params`) to
+    `status` and their counts with them; returns the number of alerts changed.
+    The caller commits.
+    """
+    where = f'({where}) AND status != ?'
+    params = (*params, status)
+    hour = HOUR_SQL.format('created_at')
+    # Add to the new status first, then take the same counts from the old ones
+    db.execute(_UPSERT.format(f'''
+        SELECT {hour}, bed_id, alert_type, category, ?, COUNT(*)
+        FROM alerts WHERE {where} AND {_COUNTED}
+        GROUP BY {hour}, bed_id, alert_type, category
+    '''), (status, *params))
+    db.execute(_UPSERT.format(f'''
+        SELECT {hour}, bed_id, alert_type, category, status, -COUNT(*)
+        FROM alerts WHERE {where} AND {_COUNTED}
+        GROUP BY {hour}, bed_id, alert_type, category, status
+    '''), params)
+    resolved_at = ', resolved_at = CURRENT_TIMESTAMP' if status == 'resolved' else ''
+    return db.execute(f'UPDATE alerts SET status = ?{resolved_at} WHERE {where}',
+                      (status, *params)).rowcount
+
+def delete(db, where, params):
+    """Delete the alerts matching `where` and take them off the counts; returns how many. The caller commits."""
+    hour = HOUR_SQL.format('created_at')
+    db.execute(_UPSERT.format(f'''
+        SELECT {hour}, bed_id, alert_type, category, status, -COUNT(*)
+        FROM alerts WHERE ({where}) AND {_COUNTED}
+        GROUP BY {hour}, bed_id, alert_type, category, status
+    '''), params)
+    return db.execute(f'DELETE FROM alerts WHERE {where}', params).rowcount
+
+def remove_bed(db, bed_id):
+    """Drop a deleted bed's counts"""
+    db.execute('DELETE FROM alert_counters WHERE bed_id = ?', (bed_id,))
+
+# ==================== QUERIES ====================
+
+def _filters(since, status=None, category=None, nurse_id=None):
+    where, params = ['hour >= ?'], [since]
+    if status:
+        where.append('status = ?')
+        params.append(status)
+    if category:
+        where.append('category = ?')
+        params.append(category)
+    if nurse_id:
+        where.append('bed_id IN (SELECT bed_id FROM nurse_assignments WHERE nurse_id = ?)')
+        params.append(nurse_id)
+    return ' AND '.join(where), params
+
+def count(db, since, status=None, category=None, nurse_id=None):
+    """Alerts created since the hour bucket `since`, optionally by status, category and nurse"""
+    where, params = _filters(since, status, category, nurse_id)
+    row = db.execute(f'SELECT SUM(count) AS cnt FROM alert_counters WHERE {where}', params).fetchone()
+    return row['cnt'] or 0
+
+def counts_by_type(db, since, status=None, nurse_id=None):
+    """[(alert_type, count)] of alerts created since `since`, largest first"""
+    where, params = _filters(since, status, None, nurse_id)
+    rows = db.execute(f'''
+        SELECT alert_type, SUM(count) AS total FROM alert_counters
+        WHERE {where}
+        GROUP BY alert_type
+        HAVING SUM(count) > 0
+        ORDER BY total DESC, alert_type
+    ''', params).fetchall()
+    return [(row['alert_type'], row['total']) for row in rows]
+
+# ==================== MAINTENANCE ====================
+
+def category_sql(column='alert_type'):
+    """CASE expression giving the category of `column` (for backfills)"""
+    cases = ' '.join(f"WHEN '{t}' THEN '{c}'" for t, c in CATEGORIES.items())
+    return (f"CASE {column} {cases} ELSE CASE WHEN {column} LIKE '%fall%' OR {column} LIKE '%exit%' "
+            f"THEN '{FALL_RISK}' ELSE '{OTHER}' END END")
+
+def add_category_column(conn):
+    """Add alerts.category to a SQLite alerts table created before it existed"""
+    columns = [r[1] for r in conn.execute("PRAGMA table_info('alerts')")]
+    if columns and 'category' not in columns:
+        conn.execute('ALTER TABLE alerts ADD COLUMN category TEXT')
+        conn.commit()
+
+def rebuild(db):
+    """Recount every bucket from the alerts table (alerts need not be categorized yet)"""
+    hour = HOUR_SQL.format('created_at')
+    db.execute('DELETE FROM alert_counters')
+    db.execute(_UPSERT.format(f'''
+        SELECT {hour}, bed_id, alert_type, COALESCE(category, {category_sql()}), status, COUNT(*)
+        FROM alerts WHERE created_at IS NOT NULL
+        GROUP BY {hour}, bed_id, alert_type, COALESCE(category, {category_sql()}), status
+    '''))
+    db.commit()
+
+def count_alerts(db, where, params):
+    """Add the alerts matching `where` to the counts, in their current status (for backfills). The caller commits."""
+    hour = HOUR_SQL.format('created_at')
+    db.execute(_UPSERT.format(f'''
+        SELECT {hour}, bed_id, alert_type, category, status, COUNT(*)
+        FROM alerts WHERE ({where}) AND {_COUNTED}
+        GROUP BY {hour}, bed_id, alert_type, category, status
+    '''), params)
+
+def backfill(db):
+    """Count and categorize the alerts from before the counters existed (all at once; see migrations.py)"""
+    hour = HOUR_SQL.format('created_at')
+    db.execute(_UPSERT.format(f'''
+        SELECT {hour}, bed_id, alert_type, {category_sql()}, status, COUNT(*)
+        FROM alerts WHERE category IS NULL AND created_at IS NOT NULL
+        GROUP BY {hour}, bed_id, alert_type, {category_sql()}, status
+    '''))
+    db.execute(f'UPDATE alerts SET category = {category_sql()} WHERE category IS NULL')
+    db.commit()
@@ -0,0 +1,340 @@
+"""
+Cold-history archive for Patient Monitoring System
+Readings older than a cutoff are moved out of the database into one file per
+bed and month: a NumPy structured array (fixed-width timestamp, id and
+sensor columns) sorted by time, saved as .npy. Reads memory-map the files
+and slice them by binary search on the timestamp, so long-range history
+stays fast without keeping it in the live database.
+
+Archive everything older than 90 days:
+    python archive.py --days 90
+"""
+
+import argparse
+import calendar
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import database
+import reading_chunks
+from database import get_db, get_read_db
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency: pip install numpy
+    np = None
+
+# Archive location (default: <DATABASE>-archive/ next to the database)
+ARCHIVE_DIR = os.environ.get('PMS_ARCHIVE_DIR') or None
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+BATCH_SIZE = 10000       # rows fetched (and deleted) per query while archiving
+MISSING_MOTION = -1      # NULL motion; NULL floats are stored as NaN
+
+if np is not None:
+    DTYPE = np.dtype([
+        ('timestamp', '<i8'),     # seconds since the epoch, UTC
+        ('id', '<i8'),
+        ('temperature', '<f8'),
+        ('humidity', '<f8'),
+        ('motion', '<i1'),
+        ('distance_cm', '<f8'),
+    ])
+
+# ==================== FILES ====================
+
+def archive_dir():
+    return Path(ARCHIVE_DIR or f'{database.DATABASE}-archive')
+
+def bed_month_path(bed_id, month):
+    """File holding a bed's archived readings of `month` ('YYYYMM')"""
+    return archive_dir() / f'bed_{bed_id}' / f'{month}.npy'
+
+def archived_before():
+    """Timestamp before which readings may be archived (None = nothing archived)"""
+    try:
+        manifest = json.loads((archive_dir() / 'manifest.json').read_text())
+    except FileNotFoundError:
+        return None
+    if np is None:
+        raise RuntimeError('Archived readings need numpy (pip install numpy)')
+    return manifest['cutoff']
+
+def live_start(start):
+    """Where reads of live and sealed rows start: rows before the cutoff are read from the archive only"""
+    cutoff = archived_before()
+    return max(start, cutoff) if cutoff else start
+
+def _epoch(text):
+    text = text[:19]
+    return calendar.timegm(time.strptime(text, TIME_FORMAT if len(text) > 10 else '%Y-%m-%d'))
+
+def _months(bed_id, start, end):
+    """Archived 'YYYYMM' months of a bed overlapping [start, end)"""
+    first, last = start[:7].replace('-', ''), end[:7].replace('-', '')
+    return sorted(path.stem for path in (archive_dir() / f'bed_{bed_id}').glob('*.npy')
+                  if first <= path.stem <= last)
+
+def _month_range(month):
+    """('YYYY-MM-01 00:00:00', first of the next month) for 'YYYYMM'"""
+    start = f'{month[:4]}-{month[4:]}-01 00:00:00'
+    end = (datetime.strptime(start, TIME_FORMAT) + timedelta(days=32)).strftime('%Y-%m-01 00:00:00')
+    return start, end
+
+def _load(path):
+    try:
+        return np.load(path, mmap_mode='r')
+    except FileNotFoundError:
+        return None
+
+# ==================== READING ====================
+
+def read_range(bed_id, start, end):
+    """Archived rows of a bed with start <= timestamp < end, as one structured array"""
+    cutoff = archived_before()
+    if cutoff is None or start >= cutoff:
+        return None
+    end = min(end, cutoff)
+    lo, hi = _epoch(start), _epoch(end)
+    slices = []
+    for month in _months(bed_id, start, end):
+        data = _load(bed_month_path(bed_id, month))
+        if data is None:
+            continue
+        times = data['timestamp']
+        # Zero-copy view of the matching rows (the file is sorted by time)
+        slices.append(data[np.searchsorted(times, lo, 'left'):np.searchsorted(times, hi, 'left')])
+    if not slices:
+        return None
+    return slices[0] if len(slices) == 1 else np.concatenate(slices)
+
+def to_rows(data, bed_id):
+    """Reading dicts (same keys as SELECT * FROM readings) for archived rows"""
+    if data is None or not len(data):
+        return []
+    columns = {name: data[name].tolist() for name in DTYPE.names}
+    rows = []
+    for i in range(len(data)):
+        motion = columns['motion'][i]
+        rows.append({
+            'id': columns['id'][i],
+            'bed_id': bed_id,
+            'timestamp': time.strftime(TIME_FORMAT, time.gmtime(columns['timestamp'][i])),
+            'temperature': _value(columns['temperature'][i]),
+            'humidity': _value(columns['humidity'][i]),
+            'motion': None if motion == MISSING_MOTION else motion,
+            'distance_cm': _value(columns['distance_cm'][i]),
+        })
+    return rows
+
+def _value(x):
+    return None if x != x else x   # NaN -> NULL
+
+def read_readings(bed_id, start, limit=None):
+    """Archived readings of a bed at or after `start`, newest first"""
+    cutoff = archived_before()
+    data = read_range(bed_id, start, cutoff) if cutoff else None
+    if data is None:
+        return []
+    if limit:
+        data = data[-limit:]
+    return to_rows(data, bed_id)[::-1]
+
+def iter_readings(bed_id, start, end):
+    """Archived readings of a bed with start <= timestamp < end, in time order, a month at a time"""
+    cutoff = archived_before()
+    if cutoff is None or start >= cutoff:
+        return
+    for month in _months(bed_id, start, min(end, cutoff)):
+        month_start, month_end = _month_range(month)
+        data = read_range(bed_id, max(start, month_start), min(end, month_end))
+        for i in range(0, 0 if data is None else len(data), BATCH_SIZE):
+            yield from to_rows(data[i:i + BATCH_SIZE], bed_id)
+
+def temperature_sums(since, bed_ids):
+    """{bed_id: (temp_sum, temp_count)} of archived readings at or after `since`"""
+    sums = {}
+    cutoff = archived_before()
+    if cutoff is None or since >= cutoff:
+        return sums
+    for bed_id in bed_ids:
+        data = read_range(bed_id, since, cutoff)
+        if data is not None and len(data):
+            temps = data['temperature']
+            count = int(np.count_nonzero(~np.isnan(temps)))
+            if count:
+                sums[bed_id] = (float(np.nansum(temps)), count)
+    return sums
+
+# ==================== ARCHIVING ====================
+
+def _live_batches(bed_id, start, end):
+    after_id = 0
+    while True:
+        db = get_read_db()
+        try:
+            rows = db.execute('''
+                SELECT id, timestamp, temperature, humidity, motion, distance_cm FROM readings
+                WHERE bed_id = ? AND timestamp >= ? AND timestamp < ? AND id > ?
+                ORDER BY id LIMIT ?
+            ''', (bed_id, start, end, after_id, BATCH_SIZE)).fetchall()
+        finally:
+            db.close()
+        if not rows:
+            return
+        yield [tuple(r) for r in rows]
+        after_id = rows[-1]['id']
+
+def _to_array(rows):
+    data = np.empty(len(rows), dtype=DTYPE)
+    data['id'] = [r[0] for r in rows]
+    data['timestamp'] = [_epoch(r[1]) for r in rows]
+    for name, index in (('temperature', 2), ('humidity', 3), ('distance_cm', 5)):
+        data[name] = [np.nan if r[index] is None else r[index] for r in rows]
+    data['motion'] = [MISSING_MOTION if r[4] is None else r[4] for r in rows]
+    return data
+
+def _archive_bed_month(bed_id, month, cutoff, keep_id):
+    """
+    Save a bed-month's rows before `cutoff` to its archive file; returns the
+    readings and chunk ids to delete once the manifest covers the cutoff,
+    and the number of sealed readings in those chunks
+    """
+    start, end = _month_range(month)
+    end = min(end, cutoff)
+    parts, live_ids = [], []
+    for rows in _live_batches(bed_id, start, end):
+        parts.append(_to_array(rows))
+        # The kept latest reading is archived too (readers skip live rows before the cutoff)
+        live_ids.extend(r[0] for r in rows if r[0] != keep_id)
+    db = get_read_db()
+    try:
+        chunk_ids = [r['id'] for r in db.execute('''
+            SELECT id FROM reading_chunks WHERE bed_id = ? AND start_time >= ? AND end_time < ?
+        ''', (bed_id, start, end))]
+    finally:
+        db.close()
+    sealed = [(r['id'], r['timestamp'], r['temperature'], r['humidity'], r['motion'], r['distance_cm'])
+              for r in reading_chunks.iter_sealed_readings(bed_id, start, end)]
+    if sealed:
+        parts.append(_to_array(sealed))
+    if not parts:
+        return [], [], 0
+
+    path = bed_month_path(bed_id, month)
+    existing = _load(path)
+    data = np.concatenate(parts)
+    if existing is not None and np.isin(data['id'], existing['id']).all():
+        return live_ids, chunk_ids, len(sealed)   # already archived (only the kept reading is left)
+    if existing is not None:
+        data = np.concatenate([np.array(existing), data])
+    # Sort by time; drop ids archived twice by an interrupted earlier run
+    data = data[np.lexsort((data['id'], data['timestamp']))]
+    _, first = np.unique(data['id'], return_index=True)
+    data = data[np.sort(first)]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        np.save(f, data)
+    os.replace(tmp, path)
+    return live_ids, chunk_ids, len(sealed)
+
+def _delete_archived(live_ids, chunk_ids):
+    """Remove archived rows from the database, in short transactions"""
+    db = get_db()
+    try:
+        for table, ids in (('readings', live_ids), ('reading_chunks', chunk_ids)):
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                db.execute(f"DELETE FROM {table} WHERE id IN ({','.join(['?'] * len(batch))})", batch)
+                db.commit()
+    finally:
+        db.close()
+
+def remove_bed(bed_id):
+    """Delete a bed's archived readings"""
+    shutil.rmtree(archive_dir() / f'bed_{bed_id}', ignore_errors=True)
+
+def purge(before):
+    """Delete archived readings older than `before` (UTC 'YYYY-MM-DD HH:MM:SS'); returns rows deleted"""
+    if np is None or archived_before() is None:
+        return 0
+    deleted = 0
+    for path in archive_dir().glob('bed_*/*.npy'):
+        month_start, month_end = _month_range(path.stem)
+        if month_start >= before:
+            continue
+        data = _load(path)
+        if data is None:
+            continue
+        keep = np.searchsorted(data['timestamp'], _epoch(before), 'left')
+        if month_end <= before or keep == len(data):
+            deleted += len(data)
+            path.unlink()
+            continue
+        # Month straddling `before`: keep its newer rows
+        if keep:
+            deleted += int(keep)
+            tmp = path.with_name(path.name + '.tmp')
+            with open(tmp, 'wb') as f:
+                np.save(f, np.array(data[keep:]))
+            del data
+            os.replace(tmp, path)
+    return deleted
+
+def archive_readings(cutoff):
+    """Move readings older than `cutoff` (UTC 'YYYY-MM-DD[ HH:MM:SS]') into the archive; returns rows moved"""
+    if np is None:
+        raise RuntimeError('Archiving needs numpy (pip install numpy)')
+    # Whole hours, so sealed chunks are never split
+    cutoff = time.strftime('%Y-%m-%d %H:00:00', time.gmtime(_epoch(cutoff)))
+    db = get_read_db()
+    try:
+        months = db.execute('''
+            SELECT bed_id, substr(timestamp, 1, 7) AS month FROM readings WHERE timestamp < ?
+            GROUP BY bed_id, month
+            UNION
+            SELECT bed_id, substr(start_time, 1, 7) AS month FROM reading_chunks WHERE end_time < ?
+            GROUP BY bed_id, month
+        ''', (cutoff, cutoff)).fetchall()
+        # Each bed's latest reading stays live for the dashboards
+        latest = {r['id']: r['latest'] for r in db.execute(
+            f'SELECT b.id, {database.latest_reading_id(db, "b.id")} AS latest FROM beds b')}
+    finally:
+        db.close()
+
+    # Save every file first: until the manifest moves, readers take rows
+    # past the old cutoff from the database only
+    live_ids, chunk_ids, sealed = [], [], 0
+    for row in months:
+        readings, chunks, count = _archive_bed_month(row['bed_id'], row['month'].replace('-', ''), cutoff,
+                                                     latest.get(row['bed_id']))
+        live_ids.extend(readings)
+        chunk_ids.extend(chunks)
+        sealed += count
+
+    # From now on readers take everything before the cutoff from the archive
+    # only, so the rows still in the database are never read twice
+    previous = archived_before()
+    manifest = archive_dir() / 'manifest.json'
+    manifest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = manifest.with_name(manifest.name + '.tmp')
+    tmp.write_text(json.dumps({'cutoff': max(cutoff, previous or cutoff)}))
+    os.replace(tmp, manifest)
+
+    _delete_archived(live_ids, chunk_ids)
+    return len(live_ids) + sealed
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive old readings to memory-mapped files')
+    parser.add_argument('--days', type=int, default=90, help='archive readings older than this many days')
+    args = parser.parse_args()
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=args.days)).strftime(TIME_FORMAT)
+    print(f"Archived {archive_readings(cutoff)} readings older than {cutoff} to {archive_dir()}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,453 @@
+"""
+Async ingest server for Patient Monitoring System
+Serves POST /api/data on an asyncio event loop so one process can hold
+thousands of keep-alive sensor connections. Database writes and detection
+run on a dedicated single-thread executor (SQLite allows one writer).
+
+Optionally also accepts compact binary readings over UDP (sensor_protocol.py).
+
+Run standalone:  python async_server.py --port 5001 [--udp-port 5002]
+Or under an ASGI server:  uvicorn async_server:asgi_app --port 5001
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import init_db
+import ingest
+import metrics
+import models
+import sensor_protocol
+
+logger = logging.getLogger(__name__)
+
+# ==================== CONFIGURATION ====================
+
+MAX_CONNECTIONS = 10000       # open sockets accepted at once
+MAX_PENDING_WRITES = 1000     # readings queued for the DB executor
+MAX_HEADER_BYTES = 8192       # request line + headers
+MAX_BODY_BYTES = 65536        # a reading is ~100 bytes, batches up to ~500
+KEEPALIVE_TIMEOUT = 75        # seconds an idle connection is kept open
+DEVICE_REFRESH_SECONDS = 30   # least time between reloads of the known UDP devices
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+# ==================== INGEST CORE ====================
+
+class IngestService:
+    """Runs the shared ingest pipeline on a dedicated DB executor"""
+
+    def __init__(self, max_pending=MAX_PENDING_WRITES):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest-db')
+        self.max_pending = max_pending
+        self.pending = 0
+
+    async def handle_payload(self, body, ip=None):
+        """Decode a JSON body and ingest it; returns (status, response dict)"""
+        try:
+            data = json.loads(body) if body else None
+            if ingest.is_batch(data):
+                return await self.submit_batch(ingest.parse_batch(data), ip)
+            reading = ingest.parse_payload(data)
+        except ingest.PayloadError as e:
+            return 400, {'error': str(e)}
+        except (ValueError, TypeError) as e:
+            return 400, {'error': str(e)}
+        return await self.submit(reading, ip)
+
+    async def submit_batch(self, readings, ip=None):
+        """Queue a batch of parsed readings for the DB executor"""
+        if self.pending >= self.max_pending:
+            return 503, {'error': 'Ingest queue full, retry later'}
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, ingest.process_batch, readings, ip)
+            return 200, {'status': 'ok', 'accepted': result['accepted'],
+                         'duplicates': result['duplicates']}
+        except Exception as e:
+            return 500, {'error': str(e)}
+        finally:
+            self.pending -= 1
+
+    async def submit(self, reading, ip=None):
+        """Queue a parsed reading for the DB executor; returns (status, response dict)"""
+        # Shed load instead of queueing without bound
+        if self.pending >= self.max_pending:
+            return 503, {'error': 'Ingest queue full, retry later'}
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            raised = await loop.run_in_executor(self.executor, ingest.process_reading, reading, ip)
+            if raised is None:
+                return 200, {'status': 'ok', 'duplicate': True}
+            return 200, {'status': 'ok'}
+        except Exception as e:
+            return 500, {'error': str(e)}
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        """Wait for queued writes to finish"""
+        self.executor.shutdown(wait=True)
+
+
+# ==================== HTTP/1.1 SERVER ====================
+
+class IngestServer:
+    """Minimal keep-alive HTTP/1.1 server accepting only sensor ingest"""
+
+    def __init__(self, service=None, max_connections=MAX_CONNECTIONS,
+                 keepalive_timeout=KEEPALIVE_TIMEOUT):
+        self.service = service or IngestService()
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.connections = 0
+        self.server = None
+        self.udp = None
+
+    async def start(self, host='0.0.0.0', port=5001):
+        self.server = await asyncio.start_server(
+            self.handle_connection, host, port, limit=MAX_HEADER_BYTES
+        )
+        return self.server
+
+    async def serve_forever(self, host='0.0.0.0', port=5001, udp_port=None):
+        await self.start(host, port)
+        logger.info(f"Async ingest server listening on {host}:{port}")
+        if udp_port:
+            _, self.udp = await start_udp(self.service, host, udp_port)
+            logger.info(f"Binary UDP ingest listening on {host}:{udp_port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        if self.connections >= self.max_connections:
+            await self.send(writer, 503, {'error': 'Too many connections'}, keep_alive=False)
+            writer.close()
+            return
+
+        self.connections += 1
+        peer = writer.get_extra_info('peername')
+        ip = peer[0] if peer else None
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b'\r\n\r\n'), self.keepalive_timeout
+                    )
+                except asyncio.LimitOverrunError:
+                    await self.send(writer, 431, {'error': 'Headers too large'}, keep_alive=False)
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+
+                request = self.parse_head(head)
+                if request is None:
+                    await self.send(writer, 400, {'error': 'Malformed request'}, keep_alive=False)
+                    break
+                method, path, version, headers = request
+
+                keep_alive = version == 'HTTP/1.1'
+                connection = headers.get('connection', '').lower()
+                if connection == 'close':
+                    keep_alive = False
+                elif connection == 'keep-alive':
+                    keep_alive = True
+
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    length = -1
+                if length < 0 or length > MAX_BODY_BYTES:
+                    await self.send(writer, 413, {'error': 'Invalid body length'}, keep_alive=False)
+                    break
+
+                try:
+                    body = await reader.readexactly(length) if length else b''
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                status, payload = await self.route(method, path, body, ip, headers)
+                await self.send(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            self.connections -= 1
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def route(self, method, path, body, ip, headers=None):
+        path = path.split('?', 1)[0]
+        if path == '/api/data':
+            if method != 'POST':
+                return 405, {'error': 'Method not allowed'}
+            return await self.service.handle_payload(body, ip)
+        if path == '/health':
+            health = {'status': 'ok', 'connections': self.connections,
+                      'pending_writes': self.service.pending}
+            if self.udp:
+                health['udp'] = self.udp.stats()
+            return 200, health
+        if path == '/metrics':
+            # No sessions here: only scrapers with the metrics token
+            if not metrics.token_ok((headers or {}).get('authorization')):
+                return 401, {'error': 'Metrics token required'}
+            return 200, metrics.render()
+        return 404, {'error': 'Not found'}
+
+    @staticmethod
+    def parse_head(head):
+        try:
+            lines = head.decode('latin-1').split('\r\n')
+            method, path, version = lines[0].split(' ', 2)
+        except ValueError:
+            return None
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        return method, path, version, headers
+
+    @staticmethod
+    async def send(writer, status, payload, keep_alive=True):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload).encode(), 'application/json'
+        head = (
+            f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+            '\r\n'
+        ).encode()
+        try:
+            writer.write(head + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+# ==================== UDP BINARY INGEST ====================
+
+class UdpIngestProtocol(asyncio.DatagramProtocol):
+    """Receives fixed-layout binary readings (see sensor_protocol.py)"""
+
+    def __init__(self, service, device_names=None):
+        self.service = service
+        self.tracker = sensor_protocol.SequenceTracker()
+        self.device_names = dict(device_names or {})   # esp_id hash -> esp_id
+        self.refreshed_at = time.monotonic()
+        self.refreshing = False
+        self.malformed = 0
+        self.dropped = 0
+        self.unknown = 0
+        self.tasks = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            packet = sensor_protocol.decode_reading(data)
+        except sensor_protocol.ProtocolError:
+            self.malformed += 1
+            return
+
+        esp_hash = packet['esp_hash']
+        esp_id = self.device_names.get(esp_hash)
+        if esp_id is None:
+            # Only registered devices may send datagrams; look for new ones now and then
+            self.unknown += 1
+            self.refresh_devices()
+            return
+
+        lost = self.tracker.observe(
+            esp_hash, packet['seq'], reboot=bool(packet['flags'] & sensor_protocol.FLAG_BOOT)
+        )
+        if lost:
+            logger.warning(f"Device {esp_hash:08x} (bed {packet['bed_id']}): {lost} datagram(s) lost")
+
+        if self.service.pending >= self.service.max_pending:
+            self.dropped += 1
+            return
+
+        reading = {
+            'bed_id': packet['bed_id'],
+            'temperature': packet['temperature'],
+            'humidity': packet['humidity'],
+            'motion': packet['motion'],
+            'distance_cm': packet['distance_cm'],
+            'esp_id': esp_id,
+            'seq': packet['seq'],
+            'reset': bool(packet['flags'] & sensor_protocol.FLAG_BOOT),
+            'timestamp': None,
+        }
+        task = asyncio.ensure_future(self.service.submit(reading, addr[0]))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def refresh_devices(self):
+        """Reload the known devices on the DB executor, at most every DEVICE_REFRESH_SECONDS"""
+        if self.refreshing or time.monotonic() - self.refreshed_at < DEVICE_REFRESH_SECONDS:
+            return
+        self.refreshing = True
+        task = asyncio.ensure_future(self._refresh_devices())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _refresh_devices(self):
+        try:
+            loop = asyncio.get_running_loop()
+            self.device_names = await loop.run_in_executor(self.service.executor, _device_names)
+        except Exception as e:
+            logger.error(f"Reloading UDP devices failed: {e}")
+        finally:
+            self.refreshed_at = time.monotonic()
+            self.refreshing = False
+
+    def stats(self):
+        stats = self.tracker.snapshot()
+        stats['malformed'] = self.malformed
+        stats['dropped'] = self.dropped
+        stats['unknown_devices'] = self.unknown
+        return stats
+
+
+def _device_names():
+    """{esp_id hash: esp_id} of the known devices"""
+    return {sensor_protocol.esp_id_hash(d['esp_id']): d['esp_id'] for d in models.list_devices()}
+
+
+async def start_udp(service, host='0.0.0.0', port=5002):
+    """Start the UDP listener; returns (transport, protocol)"""
+    loop = asyncio.get_running_loop()
+    # Map hashes of already known devices back to their esp_id, on the DB executor
+    device_names = await loop.run_in_executor(service.executor, _device_names)
+    return await loop.create_datagram_endpoint(
+        lambda: UdpIngestProtocol(service, device_names), local_addr=(host, port)
+    )
+
+
+# ==================== ASGI ENTRY POINT ====================
+
+_asgi_service = None
+_asgi_ready = None    # init_db() on the service's executor, awaited by every request until done
+
+async def _asgi_startup():
+    """Create the service and the schema once: at lifespan startup, or on the first
+    request when the ASGI server doesn't send lifespan events"""
+    global _asgi_service, _asgi_ready
+    if _asgi_ready is None:
+        _asgi_service = IngestService()
+        _asgi_ready = asyncio.get_running_loop().run_in_executor(_asgi_service.executor, init_db)
+    ready = _asgi_ready
+    try:
+        await ready
+    except Exception:
+        if _asgi_ready is ready:   # let the next request try again
+            _asgi_service.shutdown()
+            _asgi_ready = None
+        raise
+
+async def asgi_app(scope, receive, send):
+    """ASGI application exposing the same /api/data ingest endpoint"""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await _asgi_startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if _asgi_service:
+                    _asgi_service.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] != 'http':
+        return
+    await _asgi_startup()
+
+    if scope['path'] != '/api/data':
+        status, payload = 404, {'error': 'Not found'}
+    elif scope['method'] != 'POST':
+        status, payload = 405, {'error': 'Method not allowed'}
+    else:
+        body = b''
+        more = True
+        while more:
+            message = await receive()
+            body += message.get('body', b'')
+            more = message.get('more_body', False)
+            if len(body) > MAX_BODY_BYTES:
+                status, payload = 413, {'error': 'Invalid body length'}
+                break
+        else:
+            client = scope.get('client')
+            status, payload = await _asgi_service.handle_payload(body, client[0] if client else None)
+
+    data = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(data)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': data})
+
+
+# ==================== MAIN ====================
+
+def main():
+    parser = argparse.ArgumentParser(description='Async sensor ingest server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS)
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING_WRITES)
+    parser.add_argument('--udp-port', type=int, default=None,
+                        help='also accept binary readings on this UDP port')
+    parser.add_argument('--register-device', metavar='ESP_ID', action='append',
+                        help='register a UDP-only device (its MAC address) and exit')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    if args.register_device:
+        for esp_id in args.register_device:
+            models.update_device_status(esp_id)
+            print(f"Registered device {esp_id}")
+        return
+    service = IngestService(max_pending=args.max_pending)
+    server = IngestServer(service, max_connections=args.max_connections)
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port, args.udp_port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Buffered audit log writer for Patient Monitoring System
+Audit events are queued in memory and written in batches by a background
+thread, so logins and admin actions don't each take the SQLite write lock
+that sensor ingest needs.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import database
+from database import get_db
+import metrics
+
+FLUSH_INTERVAL = 1.0   # max seconds an event waits before it is committed (0 = write synchronously)
+MAX_BATCH = 500        # flush early once this many events are queued
+MAX_PENDING = 50000    # queue bound; beyond it log() writes through synchronously
+
+logger = logging.getLogger(__name__)
+
+INSERT_SQL = '''
+    INSERT INTO audit_logs (user_id, username, action, target_type, target_id, details, ip_address, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+audit_events = metrics.counter('pms_audit_events_total', 'Audit events written')
+audit_batch_size = metrics.histogram('pms_audit_flush_batch_size', 'Audit events per flush',
+                                     buckets=metrics.COUNT_BUCKETS)
+
+class AuditWriter:
+    """Queue audit rows and commit them in batches from a background thread"""
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.pending = []
+        self.lock = threading.Lock()         # guards pending
+        self.write_lock = threading.Lock()   # keeps flushes (and id order) serial
+        self.wake = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.closed = False
+
+    def log(self, user_id, username, action, target_type=None, target_id=None, details=None,
+            ip_address=None):
+        """Queue one event; timestamped now, committed within flush_interval"""
+        self.log_many([(user_id, username, action, target_type, target_id, details, ip_address)])
+
+    def log_many(self, events):
+        """Queue several events at once, each a tuple of log()'s arguments"""
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        rows = [(*event, timestamp) for event in events]
+        if not rows:
+            return
+        if not self.flush_interval or self.closed:
+            self._write(rows)
+            return
+        with self.lock:
+            overflow = len(self.pending) + len(rows) > MAX_PENDING
+            if not overflow:
+                self.pending.extend(rows)
+                full = len(self.pending) >= self.max_batch
+        if overflow:
+            self._write(rows)
+            return
+        self._ensure_thread()
+        if full:
+            self.wake.set()
+
+    def flush(self):
+        """Commit everything queued so far (called by the thread, readers and at exit)"""
+        with self.write_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+            if not batch:
+                return
+            try:
+                self._write(batch)
+                return
+            except database.OperationalError as e:
+                self._requeue(batch, e)
+                return
+            except Exception:
+                logger.exception(f'Audit flush of {len(batch)} events failed, writing them one by one')
+            # A row the database rejects (e.g. a constraint error) must not
+            # lose the whole batch: only the rows that fail on their own are dropped
+            for i, row in enumerate(batch):
+                try:
+                    self._write([row])
+                except database.OperationalError as e:
+                    self._requeue(batch[i:], e)
+                    return
+                except Exception:
+                    logger.exception(f'Dropped audit event that could not be stored: {row}')
+
+    def _requeue(self, rows, error):
+        # Database busy/locked: keep the events for the next flush
+        logger.warning(f'Audit flush of {len(rows)} events failed, will retry: {error}')
+        with self.lock:
+            self.pending[:0] = rows
+
+    def close(self):
+        """Stop the background thread and flush what is left"""
+        self.closed = True
+        self.wake.set()
+        if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+            self.thread.join(timeout=5)
+        self.flush()
+
+    def _write(self, rows):
+        db = get_db()
+        try:
+            db.executemany(INSERT_SQL, rows)
+            db.commit()
+        except Exception:
+            # Don't leave the failed batch's write lock behind for the retry
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        audit_events.inc(len(rows))
+        audit_batch_size.observe(len(rows))
+
+    def _ensure_thread(self):
+        # Started lazily, and again in a forked worker that didn't inherit it
+        if self.thread is not None and self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.thread is not None and self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while not self.closed:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Audit flush failed')
+                time.sleep(self.flush_interval)
+
+
+writer = AuditWriter()
+atexit.register(writer.close)
@@ -3,155 +3,146 @@ Abnormal Behavior Detection Module
 Detects various patient behaviors using sensor data combinations
 """
 
+import heapq
 import logging
 from datetime import datetime, timedelta
-from database import get_db
-import models
+import rules
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Track state per bed
-bed_state = {}
-
-def initialize_bed_state(bed_id):
-    """Initialize state tracking for a bed"""
-    if bed_id not in bed_state:
-        bed_state[bed_id] = {
-            'last_motion_time': None,
-            'last_distance': None,
-            'motion_count_night': 0,
-            'night_start': None,
-            'last_humidity': None
-        }
-
-def detect_abnormal_behaviors(bed_id, temperature, humidity, motion, distance_cm):
+# Live rule state per bed; the rules themselves are in rules.py
+detector = rules.Detector()
+
+def detect_abnormal_behaviors(bed_id, temperature, humidity, motion, distance_cm,
+                              event_time=None, update_state=True):
     """
     Detect abnormal behaviors and return list of detected behaviors
     Returns list of tuples: (alert_type, message, severity)
+
+    `event_time` is the (local) time the sample was taken; defaults to now.
+    With `update_state=False` only the rules that need no per-bed history
+    are evaluated, which is used for samples arriving too late to reorder.
     """
-    behaviors = []
-    settings = models.get_all_settings()
-    
-    # Initialize bed state if needed
-    initialize_bed_state(bed_id)
-    state = bed_state[bed_id]
-    current_time = datetime.now()
-    
-    # Get recent readings for comparison
-    recent_readings = models.get_readings_for_bed(bed_id, hours=1, limit=20)
-    
-    # 1. Patient trying to get off bed (distance + motion)
-    # Already handled in server.py as 'bed_exit', but we'll enhance it
-    if motion == 1 and distance_cm > float(settings.get('distance_bed_exit_cm', 50.0)):
-        behaviors.append((
-            'bed_exit',
-            f'Patient attempting to get off bed: Motion detected with distance {distance_cm:.1f}cm',
-            'critical'
-        ))
-    
-    # 2. Possible fall (sudden large drop in distance)
-    if state['last_distance'] is not None and distance_cm > 0 and state['last_distance'] > 0:
-        distance_drop = state['last_distance'] - distance_cm
-        fall_threshold = float(settings.get('fall_drop_threshold_cm', 30.0))
-        
-        if distance_drop > fall_threshold and distance_cm < 20:  # Fell close to sensor
-            behaviors.append((
-                'possible_fall',
-                f'Possible fall detected: Distance dropped from {state["last_distance"]:.1f}cm to {distance_cm:.1f}cm (drop: {distance_drop:.1f}cm)',
-                'critical'
-            ))
-    
-    # Update last distance
-    if distance_cm > 0:
-        state['last_distance'] = distance_cm
-    
-    # 3. Long inactivity (no motion for X minutes)
-    no_motion_timeout = float(settings.get('no_motion_timeout_minutes', 30))
-    
-    if motion == 1:
-        state['last_motion_time'] = current_time
-    elif state['last_motion_time'] is not None:
-        inactivity_duration = (current_time - state['last_motion_time']).total_seconds() / 60
-        
-        if inactivity_duration > no_motion_timeout:
-            # Check if we haven't already alerted for this inactivity period
-            last_alert_time = state.get('last_inactivity_alert_time')
-            if last_alert_time is None or (current_time - last_alert_time).total_seconds() > 300:  # Alert every 5 min max
-                behaviors.append((
-                    'long_inactivity',
-                    f'No motion detected for {inactivity_duration:.1f} minutes (threshold: {no_motion_timeout} min)',
-                    'warning'
-                ))
-                state['last_inactivity_alert_time'] = current_time
-    
-    # 4. Restlessness at night (frequent motion) - only during configured time window
-    current_hour = current_time.hour
-    current_minute = current_time.minute
-    current_time_str = f"{current_hour:02d}:{current_minute:02d}"
-    
-    # Get time window settings
-    start_time_str = settings.get('restlessness_start_time', '22:00')
-    end_time_str = settings.get('restlessness_end_time', '06:00')
-    
-    # Check if current time is within restlessness detection window
-    is_in_window = False
-    if start_time_str < end_time_str:  # Normal case: 8:00 to 17:00
-        is_in_window = start_time_str <= current_time_str < end_time_str
-    else:  # Overnight case: 22:00 to 06:00
-        is_in_window = current_time_str >= start_time_str or current_time_str < end_time_str
-    
-    if is_in_window:
-        if state['night_start'] is None:
-            state['night_start'] = current_time
-            state['motion_count_night'] = 0
-        
-        # Reset if new period
-        if (current_time - state['night_start']).total_seconds() > 28800:  # 8 hours
-            state['night_start'] = current_time
-            state['motion_count_night'] = 0
-        
-        if motion == 1:
-            state['motion_count_night'] += 1
-        
-        # Check for restlessness (more than threshold motions in 1 hour)
-        night_duration = (current_time - state['night_start']).total_seconds() / 3600  # hours
-        if night_duration > 0:
-            motion_rate = state['motion_count_night'] / night_duration
-            restlessness_threshold = float(settings.get('restlessness_motions_per_hour', 20.0))
-            
-            if motion_rate > restlessness_threshold:
-                behaviors.append((
-                    'restlessness_night',
-                    f'Restlessness detected: {state["motion_count_night"]} motions in {night_duration:.1f} hours (rate: {motion_rate:.1f}/hr, threshold: {restlessness_threshold}/hr)',
-                    'warning'
-                ))
-    else:
-        # Reset tracking outside detection window
-        state['night_start'] = None
-        state['motion_count_night'] = 0
-    
-    # 5. Dangerous room humidity (breathing issues)
-    # Low humidity (dry air) - can cause breathing issues
-    low_humidity_threshold = float(settings.get('low_humidity_danger', 30.0))
-    if humidity < low_humidity_threshold:
-        behaviors.append((
-            'low_humidity_danger',
-            f'Dangerously low humidity: {humidity:.1f}% - May cause breathing discomfort (threshold: {low_humidity_threshold}%)',
-            'warning'
-        ))
-    
-    # Very high humidity - can cause breathing issues
-    high_humidity_threshold = float(settings.get('high_humidity_danger', 70.0))
-    if humidity > high_humidity_threshold:
-        behaviors.append((
-            'high_humidity_danger',
-            f'Dangerously high humidity: {humidity:.1f}% - May cause breathing issues (threshold: {high_humidity_threshold}%)',
-            'warning'
-        ))
-    
-    return behaviors
+    return detector.evaluate(rules.BEHAVIOR, bed_id, temperature, humidity, motion, distance_cm,
+                             event_time=event_time, update_state=update_state)
+
+def check_reading(bed_id, temperature, humidity, motion, distance_cm):
+    """Range checks run on every reading as it arrives; same tuples as detect_abnormal_behaviors"""
+    return detector.evaluate(rules.READING, bed_id, temperature, humidity, motion, distance_cm)
+
+# ==================== EVENT-TIME ORDERING ====================
+
+REALTIME_LAG_SECONDS = 15      # samples this fresh are processed immediately
+REORDER_WINDOW_SECONDS = 30    # how long delayed samples wait for older ones
+CLOCK_WINDOW_SECONDS = 300     # live samples over which a device's clock offset is estimated
+
+class EventTimeOrderer:
+    """
+    Releases per-bed samples to the detector in event-time order
+
+    Real-time samples bypass the buffer (after anything older still waiting),
+    so live latency is unchanged. Delayed samples from buffered or batched
+    uploads are held in a small heap and released once the bed's watermark
+    (newest delayed sample minus the reorder window) passes them, or once
+    they have waited the reorder window (flush_stale() releases those even if
+    the bed sends nothing more). Samples older than the last released event
+    time are reported as late.
+
+    A live sample's device clock may run behind: when even the freshest live
+    samples of a bed lag more than the real-time lag, the clock is taken to
+    be that far behind and the samples are moved forward by it (to about
+    their arrival time) instead of waiting in the buffer.
+    """
+
+    def __init__(self, realtime_lag=REALTIME_LAG_SECONDS, reorder_window=REORDER_WINDOW_SECONDS,
+                 clock_window=CLOCK_WINDOW_SECONDS):
+        self.realtime_lag = timedelta(seconds=realtime_lag)
+        self.reorder_window = timedelta(seconds=reorder_window)
+        self.clock_window = timedelta(seconds=clock_window)
+        self.streams = {}
+        self.late_count = 0
+
+    def _stream(self, bed_id):
+        stream = self.streams.get(bed_id)
+        if stream is None:
+            stream = {'heap': [], 'watermark': None, 'newest': None, 'counter': 0,
+                      'lag': None, 'previous_lag': None, 'lag_since': None}
+            self.streams[bed_id] = stream
+        return stream
+
+    def _clock_offset(self, stream, lag, now):
+        """How far the bed's device clock runs behind: the smallest live lag of the last 1-2 windows"""
+        if stream['lag_since'] is None or now - stream['lag_since'] >= self.clock_window:
+            stream['previous_lag'], stream['lag'], stream['lag_since'] = stream['lag'], lag, now
+        elif lag < stream['lag']:
+            stream['lag'] = lag
+        offset = stream['lag'] if stream['previous_lag'] is None else min(stream['lag'], stream['previous_lag'])
+        return offset if offset > self.realtime_lag else None
+
+    def push(self, bed_id, event_time, item, now=None, live=True):
+        """
+        Offer a sample; returns (ready, late)
+        `ready` is a list of (event_time, item) to process in order, `late`
+        is True when this sample is older than what was already released.
+        `live` samples were sent as they were taken (not a buffered upload),
+        so their lag tells how far the device clock runs behind.
+        """
+        now = now or datetime.now()
+        stream = self._stream(bed_id)
+        if live:
+            offset = self._clock_offset(stream, now - event_time, now)
+            if offset is not None:
+                event_time = min(event_time + offset, now)
+        if stream['watermark'] is not None and event_time < stream['watermark']:
+            self.late_count += 1
+            return [], True
+
+        if now - event_time <= self.realtime_lag:
+            ready = self._release(stream, event_time)
+            ready.append((event_time, item))
+            stream['watermark'] = event_time
+            return ready, False
+
+        stream['counter'] += 1
+        heapq.heappush(stream['heap'], (event_time, stream['counter'], now, item))
+        if stream['newest'] is None or event_time > stream['newest']:
+            stream['newest'] = event_time
+
+        cutoff = stream['newest'] - self.reorder_window
+        for buffered_time, _, arrived, _ in stream['heap']:
+            if now - arrived >= self.reorder_window and buffered_time > cutoff:
+                cutoff = buffered_time
+        return self._release(stream, cutoff), False
+
+    def flush(self, bed_id):
+        """Release everything buffered for a bed (end of a batch upload)"""
+        stream = self.streams.get(bed_id)
+        if not stream or not stream['heap']:
+            return []
+        return self._release(stream, max(entry[0] for entry in stream['heap']))
+
+    def flush_stale(self, now=None):
+        """Release, for every bed, the samples that have waited the reorder window (and older ones)"""
+        now = now or datetime.now()
+        ready = []
+        for stream in self.streams.values():
+            stale = [entry[0] for entry in stream['heap'] if now - entry[2] >= self.reorder_window]
+            if stale:
+                ready.extend(self._release(stream, max(stale)))
+        return ready
+
+    def _release(self, stream, up_to):
+        heap = stream['heap']
+        ready = []
+        while heap and heap[0][0] <= up_to:
+            event_time, _, _, item = heapq.heappop(heap)
+            ready.append((event_time, item))
+            stream['watermark'] = event_time
+        if not heap:
+            stream['newest'] = None
+        return ready
 
 def log_behavior_detection(bed_id, behavior_type, message, severity):
     """Log behavior detection to file"""
@@ -0,0 +1,386 @@
+"""
+Load generator for Patient Monitoring System
+Simulates N beds of ESP8266 nodes posting to /api/data while M dashboard
+clients poll the read endpoints, then reports ingest throughput, latency
+percentiles per endpoint and database growth.
+
+In-process against a temporary SQLite file (default):
+    python benchmarks/load_test.py --beds 50 --duration 60
+
+Against a running server:
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 \\
+        --username admin --password admin123 --beds 50
+"""
+
+import argparse
+import http.cookiejar
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+DASHBOARD_ENDPOINTS = [
+    '/api/latest_readings',
+    '/api/stats/overview',
+    '/api/charts/temperature',
+    '/api/charts/alerts',
+    '/api/alerts?status=new',
+]
+
+# ==================== SENSOR SIMULATION ====================
+
+class SimulatedDevice:
+    """Generates plausible readings for one bed sensor node"""
+
+    def __init__(self, bed_id, esp_id, rng, fall_rate, temp_excursion_rate):
+        self.bed_id = bed_id
+        self.esp_id = esp_id
+        self.rng = rng
+        self.fall_rate = fall_rate
+        self.temp_excursion_rate = temp_excursion_rate
+        self.seq = 0
+        self.temperature = rng.uniform(20.0, 22.5)
+        self.humidity = rng.uniform(42.0, 58.0)
+        self.distance = rng.uniform(70.0, 90.0)
+        self.burst_left = 0
+        self.fallen_left = 0
+        self.excursion_left = 0
+
+    def next_payload(self):
+        rng = self.rng
+        self.seq += 1
+
+        # Slow environmental drift, occasionally out of range (e.g. heater fault)
+        self.temperature += rng.gauss(0, 0.05)
+        self.humidity += rng.gauss(0, 0.2)
+        if self.excursion_left == 0 and rng.random() < self.temp_excursion_rate:
+            self.excursion_left = rng.randint(5, 30)
+        temperature = self.temperature
+        if self.excursion_left:
+            self.excursion_left -= 1
+            temperature += 6.0
+
+        # Motion comes in bursts (patient turning, getting up)
+        if self.burst_left == 0 and rng.random() < 0.02:
+            self.burst_left = rng.randint(3, 15)
+        motion = 1 if self.burst_left else 0
+        if self.burst_left:
+            self.burst_left -= 1
+
+        # Falls: distance drops sharply close to the sensor for a while
+        if self.fallen_left == 0 and rng.random() < self.fall_rate:
+            self.fallen_left = rng.randint(3, 10)
+        if self.fallen_left:
+            self.fallen_left -= 1
+            distance = rng.uniform(5.0, 15.0)
+            motion = 1
+        else:
+            self.distance = min(120.0, max(40.0, self.distance + rng.gauss(0, 1.0)))
+            distance = self.distance
+
+        return {
+            'bed_id': self.bed_id,
+            'temperature': round(temperature, 1),
+            'humidity': round(self.humidity, 1),
+            'motion': motion,
+            'distance_cm': round(distance, 1),
+            'esp_id': self.esp_id,
+            'seq': self.seq,
+        }
+
+
+# ==================== CLIENTS ====================
+
+class TestClientTarget:
+    """Drives the Flask app in-process via its test client"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def sensor_client(self):
+        client = self.app.test_client()
+
+        def post(payload):
+            resp = client.post('/api/data', json=payload)
+            return resp.status_code
+        return post
+
+    def dashboard_client(self, username, password):
+        client = self.app.test_client()
+        client.post('/login', data={'username': username, 'password': password})
+
+        def get(path):
+            return client.get(path).status_code
+        return get
+
+
+class HttpTarget:
+    """Drives a running server over HTTP"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def sensor_client(self):
+        url = self.base_url + '/api/data'
+
+        def post(payload):
+            req = urllib.request.Request(
+                url, data=json.dumps(payload).encode(),
+                headers={'Content-Type': 'application/json'}, method='POST'
+            )
+            try:
+                with urllib.request.urlopen(req, timeout=10) as resp:
+                    resp.read()
+                    return resp.status
+            except urllib.error.HTTPError as e:
+                return e.code
+        return post
+
+    def dashboard_client(self, username, password):
+        opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        form = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+        opener.open(self.base_url + '/login', data=form, timeout=10).read()
+
+        def get(path):
+            try:
+                with opener.open(self.base_url + path, timeout=10) as resp:
+                    resp.read()
+                    return resp.status
+            except urllib.error.HTTPError as e:
+                return e.code
+        return get
+
+
+# ==================== RECORDING ====================
+
+class Recorder:
+    """Collects latencies per endpoint from many threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, name, seconds, status):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            if status >= 400:
+                self.errors[name] += 1
+
+    def summary(self, elapsed):
+        result = {}
+        with self.lock:
+            for name, values in sorted(self.latencies.items()):
+                values = sorted(values)
+                result[name] = {
+                    'requests': len(values),
+                    'errors': self.errors[name],
+                    'throughput_per_s': round(len(values) / elapsed, 2) if elapsed else 0.0,
+                    'p50_ms': round(percentile(values, 50) * 1000, 3),
+                    'p95_ms': round(percentile(values, 95) * 1000, 3),
+                    'p99_ms': round(percentile(values, 99) * 1000, 3),
+                    'max_ms': round(values[-1] * 1000, 3) if values else 0.0,
+                }
+        return result
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def db_size(path):
+    """Size of a SQLite database including its WAL file"""
+    if not path:
+        return None
+    total = 0
+    for suffix in ('', '-wal'):
+        p = Path(str(path) + suffix)
+        if p.exists():
+            total += p.stat().st_size
+    return total
+
+
+# ==================== WORKERS ====================
+
+def sensor_worker(target, devices, interval, stop, recorder):
+    post = target.sensor_client()
+    next_due = [time.monotonic() + random.uniform(0, interval) for _ in devices]
+    while not stop.is_set():
+        i = min(range(len(devices)), key=next_due.__getitem__)
+        delay = next_due[i] - time.monotonic()
+        if delay > 0 and stop.wait(delay):
+            break
+        start = time.perf_counter()
+        status = post(devices[i].next_payload())
+        recorder.record('POST /api/data', time.perf_counter() - start, status)
+        next_due[i] += interval
+
+
+def dashboard_worker(target, username, password, interval, stop, recorder):
+    get = target.dashboard_client(username, password)
+    while not stop.is_set():
+        for path in DASHBOARD_ENDPOINTS:
+            start = time.perf_counter()
+            status = get(path)
+            recorder.record('GET ' + path.split('?')[0], time.perf_counter() - start, status)
+        if interval and stop.wait(interval):
+            break
+
+
+# ==================== MAIN ====================
+
+def setup_local(beds):
+    """Point the app at a temp database, create an admin and beds"""
+    tmpdir = tempfile.mkdtemp(prefix='pms-bench-')
+    db_path = os.path.join(tmpdir, 'bench.db')
+
+    import database
+    database.DATABASE = db_path
+    import server
+    import models
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    models.create_user('bench_admin', 'bench_admin', 'admin')
+    bed_ids = [models.create_bed(f'Bed {i + 1}', f'{100 + i // 4}') for i in range(beds)]
+    return server.app, db_path, bed_ids
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    if args.url:
+        target = HttpTarget(args.url)
+        db_path = args.db_path
+        bed_ids = list(range(1, args.beds + 1))
+        username, password = args.username, args.password
+    else:
+        app, db_path, bed_ids = setup_local(args.beds)
+        target = TestClientTarget(app)
+        username = password = 'bench_admin'
+
+    devices = [
+        SimulatedDevice(bed_id, f'bench-{bed_id}-{d}', random.Random(rng.random()),
+                        args.fall_rate, args.temp_excursion_rate)
+        for bed_id in bed_ids for d in range(args.devices_per_bed)
+    ]
+    interval = args.interval / args.speedup
+
+    recorder = Recorder()
+    stop = threading.Event()
+    size_before = db_size(db_path)
+
+    threads = []
+    per_thread = max(1, (len(devices) + args.sensor_threads - 1) // args.sensor_threads)
+    for i in range(0, len(devices), per_thread):
+        threads.append(threading.Thread(
+            target=sensor_worker, args=(target, devices[i:i + per_thread], interval, stop, recorder),
+            daemon=True
+        ))
+    for _ in range(args.dashboards):
+        threads.append(threading.Thread(
+            target=dashboard_worker,
+            args=(target, username, password, args.dashboard_interval / args.speedup, stop, recorder),
+            daemon=True
+        ))
+
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    try:
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+    stop.set()
+    for t in threads:
+        t.join(timeout=30)
+    elapsed = time.perf_counter() - started
+
+    endpoints = recorder.summary(elapsed)
+    ingest = endpoints.get('POST /api/data', {})
+    size_after = db_size(db_path)
+    report = {
+        'config': {
+            'beds': len(bed_ids),
+            'devices': len(devices),
+            'interval_s': args.interval,
+            'speedup': args.speedup,
+            'dashboards': args.dashboards,
+            'duration_s': round(elapsed, 2),
+            'target': args.url or 'flask-test-client',
+        },
+        'ingest_throughput_per_s': ingest.get('throughput_per_s', 0.0),
+        'offered_rate_per_s': round(len(devices) / interval, 2),
+        'endpoints': endpoints,
+        'db': {
+            'path': db_path,
+            'bytes_before': size_before,
+            'bytes_after': size_after,
+            'bytes_per_reading': round((size_after - size_before) / ingest['requests'], 1)
+            if size_after is not None and size_before is not None and ingest.get('requests') else None,
+        },
+    }
+    return report
+
+
+def print_report(report):
+    cfg = report['config']
+    print(f"\n{cfg['devices']} devices on {cfg['beds']} beds, {cfg['dashboards']} dashboards, "
+          f"{cfg['duration_s']}s against {cfg['target']}")
+    print(f"Ingest: {report['ingest_throughput_per_s']}/s (offered {report['offered_rate_per_s']}/s)\n")
+    print(f"{'endpoint':34} {'reqs':>7} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, s in report['endpoints'].items():
+        print(f"{name:34} {s['requests']:>7} {s['errors']:>5} {s['p50_ms']:>9} "
+              f"{s['p95_ms']:>9} {s['p99_ms']:>9} {s['max_ms']:>9}")
+    db = report['db']
+    if db['bytes_after'] is not None:
+        print(f"\nDB: {db['bytes_before']} -> {db['bytes_after']} bytes "
+              f"({db['bytes_per_reading']} bytes/reading)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Patient Monitoring System load generator')
+    parser.add_argument('--beds', type=int, default=20)
+    parser.add_argument('--devices-per-bed', type=int, default=1)
+    parser.add_argument('--interval', type=float, default=2.0, help='seconds between samples per device')
+    parser.add_argument('--speedup', type=float, default=1.0, help='divide all intervals by this factor')
+    parser.add_argument('--dashboards', type=int, default=2)
+    parser.add_argument('--dashboard-interval', type=float, default=5.0, help='seconds between dashboard refreshes')
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--sensor-threads', type=int, default=8)
+    parser.add_argument('--fall-rate', type=float, default=0.001, help='per-sample probability of a fall')
+    parser.add_argument('--temp-excursion-rate', type=float, default=0.002)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--url', help='benchmark a running server instead of the in-process app')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--db-path', help='server database file, to report growth with --url')
+    parser.add_argument('--json', help='write the report to this file')
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
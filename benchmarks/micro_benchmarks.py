@@ -0,0 +1,224 @@
+"""
+Micro-benchmarks for hot functions in models.py and behavior_detection.py
+Times each function at growing readings-table sizes against a temporary
+SQLite file and stores the results as JSON so runs can be compared.
+
+    python benchmarks/micro_benchmarks.py --sizes 10000,1000000,10000000 --out bench.json
+    python benchmarks/micro_benchmarks.py --compare before.json after.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+ALERT_TYPES = ['bed_exit', 'possible_fall', 'temp_out_of_range', 'humidity_out_of_range',
+               'long_inactivity', 'restlessness_night', 'low_humidity_danger']
+
+# ==================== DATA GENERATION ====================
+
+def populate(db_path, beds, start_count, target_count, history_days, alerts_per_reading, seed):
+    """Append readings (and proportional alerts) until the table holds target_count rows"""
+    import alert_counters
+    rng = random.Random(seed + start_count)
+    conn = sqlite3.connect(db_path)
+    now = datetime.utcnow()
+    span = history_days * 86400
+    batch = 50000
+    try:
+        for offset in range(start_count, target_count, batch):
+            n = min(batch, target_count - offset)
+            readings = []
+            alerts = []
+            for _ in range(n):
+                bed_id = rng.randint(1, beds)
+                ts = (now - timedelta(seconds=rng.random() * span)).strftime('%Y-%m-%d %H:%M:%S')
+                readings.append((bed_id, ts, round(rng.uniform(18, 26), 1), round(rng.uniform(30, 70), 1),
+                                 1 if rng.random() < 0.2 else 0, round(rng.uniform(5, 120), 1)))
+                if rng.random() < alerts_per_reading:
+                    alert_type = rng.choice(ALERT_TYPES)
+                    alerts.append((bed_id, alert_type, alert_counters.category(alert_type), 'benchmark alert',
+                                   'new' if rng.random() < 0.3 else 'resolved', ts))
+            conn.executemany(
+                'INSERT INTO readings (bed_id, timestamp, temperature, humidity, motion, distance_cm) '
+                'VALUES (?, ?, ?, ?, ?, ?)', readings)
+            conn.executemany(
+                'INSERT INTO alerts (bed_id, alert_type, category, message, status, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                alerts)
+            conn.commit()
+        # Alerts were inserted directly: recount the dashboard counters
+        alert_counters.rebuild(conn)
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+
+
+# ==================== TIMING ====================
+
+def time_call(fn, repeat, number=1):
+    """Run fn `number` times per sample, `repeat` samples; returns per-call seconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return {
+        'min_ms': round(min(samples) * 1000, 4),
+        'median_ms': round(statistics.median(samples) * 1000, 4),
+        'mean_ms': round(statistics.mean(samples) * 1000, 4),
+        'repeat': repeat,
+        'number': number,
+    }
+
+
+def benchmark_size(models, behavior_detection, beds, nurse_id, repeat, rng):
+    """Time all hot functions against the current database"""
+    results = {}
+
+    def detect():
+        bed_id = rng.randint(1, beds)
+        behavior_detection.detect_abnormal_behaviors(
+            bed_id, rng.uniform(18, 26), rng.uniform(30, 70), rng.randint(0, 1), rng.uniform(5, 120)
+        )
+
+    results['detect_abnormal_behaviors'] = time_call(detect, repeat, number=50)
+    results['get_all_settings'] = time_call(models.get_all_settings, repeat, number=50)
+    results['get_latest_readings_per_bed'] = time_call(models.get_latest_readings_per_bed, repeat)
+    results['get_all_alerts'] = time_call(lambda: models.get_all_alerts(), repeat)
+    results['get_all_alerts[new,nurse]'] = time_call(
+        lambda: models.get_all_alerts(status='new', nurse_id=nurse_id), repeat)
+    results['get_stats_overview'] = time_call(models.get_stats_overview, repeat)
+    results['get_stats_overview[nurse]'] = time_call(
+        lambda: models.get_stats_overview(nurse_id=nurse_id), repeat)
+    results['get_readings_for_bed[24h]'] = time_call(
+        lambda: models.get_readings_for_bed(rng.randint(1, beds), hours=24), repeat)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    tmpdir = tempfile.mkdtemp(prefix='pms-micro-')
+    db_path = os.path.join(tmpdir, 'micro.db')
+
+    import database
+    database.DATABASE = db_path
+    database.init_db()
+    import models
+    import behavior_detection
+    logging.getLogger().setLevel(logging.WARNING)
+
+    for i in range(args.beds):
+        models.create_bed(f'Bed {i + 1}', str(100 + i // 4))
+    nurse_id = models.create_user('bench_nurse', 'bench_nurse', 'nurse')
+    for bed_id in range(1, args.beds // 4 + 2):
+        models.assign_nurse_to_bed(nurse_id, bed_id)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'beds': args.beds,
+            'history_days': args.history_days,
+        },
+        'sizes': {},
+    }
+
+    rng = random.Random(args.seed)
+    count = 0
+    for size in args.sizes:
+        start = time.perf_counter()
+        populate(db_path, args.beds, count, size, args.history_days, args.alerts_per_reading, args.seed)
+        count = size
+        print(f'Populated {size} readings in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+
+        results = benchmark_size(models, behavior_detection, args.beds, nurse_id, args.repeat, rng)
+        results['_db_bytes'] = os.path.getsize(db_path)
+        report['sizes'][str(size)] = results
+        print_results(size, results)
+
+    return report
+
+
+# ==================== REPORTING ====================
+
+def print_results(size, results):
+    print(f'\n{size} readings ({results["_db_bytes"] / 1e6:.1f} MB)')
+    for name, r in results.items():
+        if name.startswith('_'):
+            continue
+        print(f'  {name:34} median {r["median_ms"]:>10.4f} ms   min {r["min_ms"]:>10.4f} ms')
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f'{before["meta"].get("commit")} -> {after["meta"].get("commit")}')
+    for size, results in after['sizes'].items():
+        old = before['sizes'].get(size)
+        if not old:
+            continue
+        print(f'\n{size} readings')
+        for name, r in results.items():
+            if name.startswith('_') or name not in old:
+                continue
+            ratio = r['median_ms'] / old[name]['median_ms'] if old[name]['median_ms'] else float('inf')
+            print(f'  {name:34} {old[name]["median_ms"]:>10.4f} -> {r["median_ms"]:>10.4f} ms  x{ratio:.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Patient Monitoring System micro-benchmarks')
+    parser.add_argument('--sizes', default='10000,1000000,10000000',
+                        help='comma separated readings-table sizes to benchmark at')
+    parser.add_argument('--beds', type=int, default=50)
+    parser.add_argument('--history-days', type=float, default=30.0,
+                        help='spread generated readings over this many days')
+    parser.add_argument('--alerts-per-reading', type=float, default=0.01)
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', help='write results JSON to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='compare two result files instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    args.sizes = sorted(int(s) for s in args.sizes.split(','))
+    report = run(args)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nResults written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+/*
+ * ESP8266 Patient Monitoring Sensor Node (binary UDP protocol)
+ * Sends fixed-layout 21-byte datagrams instead of JSON over HTTP.
+ * Layout must match sensor_protocol.py on the server.
+ *
+ * Server side:  python async_server.py --port 5001 --udp-port 5002
+ * Register the node first (the server drops datagrams from unknown devices):
+ *               python async_server.py --register-device <Device ID printed at boot>
+ *
+ * Sensors:
+ * - DHT22 (Temperature & Humidity)
+ * - PIR Motion Sensor
+ * - HC-SR04 Ultrasonic Sensor
+ */
+
+#include <ESP8266WiFi.h>
+#include <WiFiUdp.h>
+#include <DHT.h>
+
+#define DHTPIN D4
+#define DHTTYPE DHT22
+
+#define PIR_PIN D0
+#define TRIG_PIN D5
+#define ECHO_PIN D6
+
+// ==== CONFIGURE THESE ====
+const char* ssid       = "YOUR_WIFI_SSID";
+const char* password   = "YOUR_WIFI_PASSWORD";
+const char* serverHost = "192.168.1.100";
+const uint16_t serverPort = 5002;    // --udp-port of async_server.py
+const uint16_t BED_ID = 1;           // unique ID per bed
+const int SEND_INTERVAL = 2000;      // milliseconds between sends
+// =========================
+
+// ==== PROTOCOL ====
+const uint8_t PROTOCOL_VERSION = 1;
+const uint8_t FLAG_BOOT = 0x01;
+const size_t PACKET_SIZE = 21;
+
+DHT dht(DHTPIN, DHTTYPE);
+WiFiUDP udp;
+uint32_t espHash = 0;     // FNV-1a hash of the MAC address
+uint32_t sequence = 0;    // incremented per datagram, server reports gaps as loss
+bool firstPacket = true;
+unsigned long lastSendTime = 0;
+
+// 32-bit FNV-1a, same as sensor_protocol.esp_id_hash()
+uint32_t fnv1a(const String& s) {
+  uint32_t h = 0x811c9dc5;
+  for (unsigned int i = 0; i < s.length(); i++) {
+    h ^= (uint8_t)s[i];
+    h *= 0x01000193;
+  }
+  return h;
+}
+
+// Get MAC address as unique device ID (same format as the HTTP node)
+String getMacAddress() {
+  byte mac[6];
+  WiFi.macAddress(mac);
+  String result = "";
+  for (int i = 0; i < 6; i++) {
+    if (mac[i] < 16) result += "0";
+    result += String(mac[i], HEX);
+    if (i < 5) result += ":";
+  }
+  return result;
+}
+
+// Measure distance using ultrasonic sensor HC-SR04
+long measureDistanceCm() {
+  digitalWrite(TRIG_PIN, LOW);
+  delayMicroseconds(2);
+  digitalWrite(TRIG_PIN, HIGH);
+  delayMicroseconds(10);
+  digitalWrite(TRIG_PIN, LOW);
+  long duration = pulseIn(ECHO_PIN, HIGH, 30000); // timeout 30 ms
+  long distance = duration * 0.034 / 2;
+  if (distance == 0 || distance > 400) {
+    distance = -1;  // invalid
+  }
+  return distance;
+}
+
+// Little-endian writers (avoid struct padding/alignment issues)
+void put16(uint8_t* buf, size_t off, uint16_t v) {
+  buf[off] = v & 0xff;
+  buf[off + 1] = (v >> 8) & 0xff;
+}
+
+void put32(uint8_t* buf, size_t off, uint32_t v) {
+  for (int i = 0; i < 4; i++) buf[off + i] = (v >> (8 * i)) & 0xff;
+}
+
+void setup() {
+  Serial.begin(115200);
+  delay(1000);
+
+  Serial.println("\n\n=== Patient Monitor Node (UDP) ===");
+  pinMode(PIR_PIN, INPUT);
+  pinMode(TRIG_PIN, OUTPUT);
+  pinMode(ECHO_PIN, INPUT);
+  digitalWrite(TRIG_PIN, LOW);
+  dht.begin();
+
+  WiFi.begin(ssid, password);
+  while (WiFi.status() != WL_CONNECTED) {
+    delay(500);
+    Serial.print(".");
+  }
+  Serial.println("\nWiFi connected!");
+
+  String espId = getMacAddress();
+  espHash = fnv1a(espId);
+  Serial.printf("Device ID (MAC): %s hash: %08x\n", espId.c_str(), espHash);
+
+  udp.begin(0);
+}
+
+void loop() {
+  if (WiFi.status() != WL_CONNECTED) {
+    WiFi.reconnect();
+    delay(2000);
+    return;
+  }
+
+  unsigned long currentTime = millis();
+  if (currentTime - lastSendTime < SEND_INTERVAL) {
+    delay(20);
+    return;
+  }
+  lastSendTime = currentTime;
+
+  float humidity = dht.readHumidity();
+  float temperature = dht.readTemperature();
+  int motion = digitalRead(PIR_PIN);
+  long distance = measureDistanceCm();
+
+  if (isnan(humidity) || isnan(temperature)) {
+    Serial.println("Failed to read from DHT sensor!");
+    return;
+  }
+
+  uint8_t packet[PACKET_SIZE];
+  packet[0] = 'P';
+  packet[1] = 'M';
+  packet[2] = PROTOCOL_VERSION;
+  packet[3] = firstPacket ? FLAG_BOOT : 0;
+  put16(packet, 4, BED_ID);
+  put32(packet, 6, espHash);
+  put32(packet, 10, sequence);
+  put16(packet, 14, (uint16_t)(int16_t)lroundf(temperature * 100));
+  put16(packet, 16, (uint16_t)lroundf(humidity * 100));
+  put16(packet, 18, (uint16_t)(int16_t)(distance < 0 ? -10 : distance * 10));
+  packet[20] = motion ? 1 : 0;
+
+  udp.beginPacket(serverHost, serverPort);
+  udp.write(packet, PACKET_SIZE);
+  udp.endPacket();
+
+  sequence++;
+  firstPacket = false;
+}
@@ -0,0 +1,160 @@
+"""
+Streaming export of readings and alerts for Patient Monitoring System
+Rows come from keyset-paginated iterators (models.iter_readings /
+models.iter_alerts) and are encoded chunk by chunk, so memory use does not
+grow with the time range. Used by the /api/export/* endpoints and from the
+command line:
+
+    python export.py readings --beds 1,2 --start 2026-01-01 --end 2026-02-01 \\
+        --format parquet -o january.parquet
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+
+import models
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency: pip install pyarrow
+    pa = None
+
+FORMATS = ('csv', 'ndjson', 'parquet')
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+READING_COLUMNS = ['id', 'bed_id', 'timestamp', 'temperature', 'humidity', 'motion', 'distance_cm']
+ALERT_COLUMNS = ['id', 'bed_id', 'bed_name', 'room_no', 'alert_type', 'message', 'status',
+                 'created_at', 'resolved_at']
+
+CHUNK_BYTES = 65536      # text output is yielded in pieces of about this size
+ROW_GROUP_SIZE = 50000   # rows per Parquet row group
+
+if pa is not None:
+    ARROW_TYPES = {
+        'id': pa.int64(), 'bed_id': pa.int64(), 'timestamp': pa.string(),
+        'temperature': pa.float64(), 'humidity': pa.float64(), 'motion': pa.int64(),
+        'distance_cm': pa.float64(), 'created_at': pa.string(), 'resolved_at': pa.string(),
+    }
+
+DATASETS = {
+    'readings': (models.iter_readings, READING_COLUMNS),
+    'alerts': (models.iter_alerts, ALERT_COLUMNS),
+}
+
+# ==================== ENCODERS ====================
+
+def csv_chunks(rows, columns):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([row[c] for c in columns])
+        if buf.tell() > CHUNK_BYTES:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def ndjson_chunks(rows, columns):
+    chunk, size = [], 0
+    for row in rows:
+        line = json.dumps({c: row[c] for c in columns}) + '\n'
+        chunk.append(line)
+        size += len(line)
+        if size > CHUNK_BYTES:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    yield ''.join(chunk)
+
+
+class _Sink:
+    """Write-only file object whose contents are drained after each row group"""
+
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def parquet_chunks(rows, columns, row_group_size=ROW_GROUP_SIZE):
+    """Parquet file written one row group at a time"""
+    if pa is None:
+        raise RuntimeError('Parquet export needs pyarrow (pip install pyarrow)')
+    schema = pa.schema([(c, ARROW_TYPES.get(c, pa.string())) for c in columns])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    batch = {c: [] for c in columns}
+    count = 0
+    for row in rows:
+        for c in columns:
+            batch[c].append(row[c])
+        count += 1
+        if count >= row_group_size:
+            writer.write_table(pa.table(batch, schema=schema))
+            yield sink.drain()
+            batch = {c: [] for c in columns}
+            count = 0
+    if count:
+        writer.write_table(pa.table(batch, schema=schema))
+    writer.close()
+    yield sink.drain()
+
+ENCODERS = {'csv': csv_chunks, 'ndjson': ndjson_chunks, 'parquet': parquet_chunks}
+
+def stream(dataset, fmt, bed_ids, start=None, end=None):
+    """Encoded chunks (str for text formats, bytes for parquet) of an export"""
+    if fmt not in ENCODERS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt == 'parquet' and pa is None:
+        raise ValueError('Parquet export needs pyarrow (pip install pyarrow)')
+    source, columns = DATASETS[dataset]
+    return ENCODERS[fmt](source(bed_ids, start, end), columns)
+
+# ==================== COMMAND LINE ====================
+
+def main():
+    parser = argparse.ArgumentParser(description='Export readings or alerts')
+    parser.add_argument('dataset', choices=sorted(DATASETS))
+    parser.add_argument('--beds', help='comma-separated bed ids (default: all beds)')
+    parser.add_argument('--start', help="first timestamp, UTC 'YYYY-MM-DD[ HH:MM:SS]'")
+    parser.add_argument('--end', help='end timestamp (exclusive)')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args()
+
+    bed_ids = ([int(b) for b in args.beds.split(',')] if args.beds
+               else [b['id'] for b in models.list_beds()])
+    chunks = stream(args.dataset, args.format, bed_ids, args.start, args.end)
+    binary = args.format == 'parquet'
+    if args.output:
+        out = open(args.output, 'wb') if binary else open(args.output, 'w', newline='')
+    else:
+        out = sys.stdout.buffer if binary else sys.stdout
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+if __name__ == '__main__':
+    main()
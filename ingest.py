@@ -0,0 +1,301 @@
+"""
+Sensor ingest pipeline shared by the Flask app and the async ingest server
+Validates a sensor payload, stores the reading and runs alert detection
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import models
+import metrics
+import behavior_detection
+from sensor_protocol import SEQ_MOD
+
+REQUIRED_FIELDS = ['bed_id', 'temperature', 'humidity', 'motion', 'distance_cm', 'esp_id']
+
+SEQ_WINDOW = 1024                        # sequence numbers remembered per device
+MAX_CLOCK_SKEW = timedelta(minutes=5)    # device clocks further ahead are ignored
+MIN_SAMPLE_TIME = datetime(2020, 1, 1)   # unsynced device clocks report ~1970
+MAX_BATCH_SIZE = 500                     # readings per batched upload
+
+
+class PayloadError(ValueError):
+    """Raised when a sensor payload is missing required fields"""
+
+
+def parse_payload(data):
+    """
+    Validate and convert a decoded JSON payload from a sensor node
+    Returns dict with typed values, raises PayloadError on bad input
+    """
+    if not data:
+        raise PayloadError('No JSON data provided')
+
+    for field in REQUIRED_FIELDS:
+        if field not in data:
+            raise PayloadError(f'Missing field: {field}')
+
+    seq = data.get('seq')
+    return {
+        'bed_id': int(data['bed_id']),
+        'temperature': float(data.get('temperature', 0)),
+        'humidity': float(data.get('humidity', 0)),
+        'motion': int(data.get('motion', 0)),
+        'distance_cm': float(data.get('distance_cm', 0)),
+        'esp_id': data['esp_id'],
+        'seq': int(seq) if seq is not None else None,
+        'timestamp': parse_sample_time(data.get('timestamp')),
+    }
+
+
+def is_batch(data):
+    """True if a decoded payload carries several readings"""
+    return isinstance(data, list) or (isinstance(data, dict) and 'readings' in data)
+
+
+def parse_batch(data):
+    """Validate a batch payload: a JSON list or {"readings": [...]}"""
+    items = data['readings'] if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise PayloadError('No readings provided')
+    if len(items) > MAX_BATCH_SIZE:
+        raise PayloadError(f'Too many readings in batch (max {MAX_BATCH_SIZE})')
+    return [parse_payload(item) for item in items]
+
+
+def parse_sample_time(value):
+    """
+    Convert a device sample time (epoch seconds or ISO 8601) to naive UTC
+    Returns None when absent or implausible so the server time is used
+    """
+    if value is None or value == '':
+        return None
+    try:
+        if isinstance(value, (int, float)):
+            ts = datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+        else:
+            ts = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+            if ts.tzinfo is not None:
+                ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    except (ValueError, OverflowError, OSError):
+        raise PayloadError(f'Invalid timestamp: {value}')
+
+    if ts < MIN_SAMPLE_TIME or ts > datetime.now(timezone.utc).replace(tzinfo=None) + MAX_CLOCK_SKEW:
+        return None
+    return ts
+
+
+class SequenceWindow:
+    """
+    Per-device sliding window of seen sequence numbers
+    Keeps a high-water mark and a bitmap of the last `size` numbers so
+    retried samples are dropped and late ones accepted, both in O(1)
+    """
+
+    def __init__(self, size=SEQ_WINDOW):
+        self.size = size
+        self.mask = (1 << size) - 1
+        self.devices = {}
+        self.lock = threading.Lock()
+
+    def accept(self, device, seq, reset=False):
+        """Return True if seq was not seen before for this device"""
+        seq %= SEQ_MOD
+        with self.lock:
+            entry = self.devices.get(device)
+            if entry is None or reset:
+                self.devices[device] = [seq, 1]
+                return True
+
+            top, bits = entry
+            ahead = (seq - top) % SEQ_MOD
+            if 0 < ahead < SEQ_MOD // 2:
+                entry[0] = seq
+                entry[1] = ((bits << ahead) | 1) & self.mask if ahead < self.size else 1
+                return True
+
+            behind = (top - seq) % SEQ_MOD
+            if behind >= self.size:
+                # Far behind the window: the device restarted its counter
+                self.devices[device] = [seq, 1]
+                return True
+
+            bit = 1 << behind
+            if bits & bit:
+                return False
+            entry[1] = bits | bit
+            return True
+
+    def forget(self, device, seq):
+        """Clear a sequence number so a retry of a failed sample is accepted"""
+        seq %= SEQ_MOD
+        with self.lock:
+            entry = self.devices.get(device)
+            if entry is not None:
+                behind = (entry[0] - seq) % SEQ_MOD
+                if behind < self.size:
+                    entry[1] &= ~(1 << behind)
+
+
+sequence_window = SequenceWindow()
+event_orderer = behavior_detection.EventTimeOrderer()
+detection_lock = threading.Lock()   # held from push to detection, so each bed's samples run in order
+
+STALE_FLUSH_INTERVAL = 5.0   # seconds between releases of samples left waiting in the reorder buffer
+_flusher = None              # (pid, thread)
+
+
+def process_reading(reading, ip=None):
+    """
+    Store a parsed reading, update device status and create alerts
+    Returns list of alert types that were raised, or None for a duplicate
+    """
+    if not _accept(reading):
+        return None
+
+    try:
+        models.insert_reading(
+            reading['bed_id'], reading['temperature'], reading['humidity'],
+            reading['motion'], reading['distance_cm'], timestamp=reading.get('timestamp')
+        )
+        models.update_device_status(reading['esp_id'], ip)
+    except Exception:
+        _forget(reading)
+        raise
+
+    return _detect(reading)
+
+
+def process_batch(readings, ip=None):
+    """
+    Store a batch of parsed readings (e.g. a node's offline buffer) in one
+    transaction and run detection over them in event-time order
+    Returns dict with accepted/duplicate counts and raised alert types
+    """
+    fresh = [r for r in readings if _accept(r)]
+    fresh.sort(key=lambda r: r.get('timestamp') or datetime.min)
+
+    try:
+        models.insert_readings(fresh)
+        for esp_id in {r['esp_id'] for r in fresh}:
+            models.update_device_status(esp_id, ip)
+    except Exception:
+        for r in fresh:
+            _forget(r)
+        raise
+
+    raised = []
+    for reading in fresh:
+        raised.extend(_detect(reading, live=False))
+
+    # The batch is complete, nothing older is coming for these beds
+    for bed_id in {r['bed_id'] for r in fresh}:
+        with detection_lock:
+            detected = _run_behaviors(event_orderer.flush(bed_id))
+        raised.extend(_create_behavior_alerts(detected))
+
+    return {'accepted': len(fresh), 'duplicates': len(readings) - len(fresh), 'alerts': raised}
+
+
+def _accept(reading):
+    seq = reading.get('seq')
+    if seq is None:
+        return True
+    return sequence_window.accept(reading['esp_id'], seq, reading.get('reset', False))
+
+
+def _forget(reading):
+    if reading.get('seq') is not None:
+        sequence_window.forget(reading['esp_id'], reading['seq'])
+
+
+def _local_time(timestamp):
+    """Convert a stored naive UTC sample time to the local clock used by the detector"""
+    if timestamp is None:
+        return datetime.now()
+    return timestamp.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+
+def _detect(reading, live=True):
+    """Run threshold checks and (event-time ordered) behavior detection"""
+    bed_id = reading['bed_id']
+    temperature = reading['temperature']
+    humidity = reading['humidity']
+    raised = []
+
+    # Range checks on every reading as it arrives (rules.READING)
+    for alert_type, message, _ in behavior_detection.check_reading(
+            bed_id, temperature, humidity, reading['motion'], reading['distance_cm']):
+        models.create_alert(bed_id, alert_type, message)
+        raised.append(alert_type)
+
+    # Advanced behavior detection, in event-time order per bed: releasing
+    # samples and running them through the detector happen under one hold
+    # of the lock, so concurrent requests can't interleave a bed's samples
+    _ensure_flusher()
+    event_time = _local_time(reading.get('timestamp'))
+    with detection_lock:
+        ready, late = event_orderer.push(bed_id, event_time, reading, live=live)
+        detected = []
+        if late:
+            # Too late to reorder: only rules without per-bed history apply
+            detected = _run_behaviors([(event_time, reading)], update_state=False)
+        detected += _run_behaviors(ready)
+    raised.extend(_create_behavior_alerts(detected))
+    return raised
+
+
+def _run_behaviors(ready, update_state=True):
+    """Run the behavior detector over released samples (call with detection_lock held)"""
+    detected = []
+    for event_time, item in ready:
+        start = time.perf_counter()
+        detected.extend((item['bed_id'], *behavior) for behavior in behavior_detection.detect_abnormal_behaviors(
+            item['bed_id'], item['temperature'], item['humidity'], item['motion'], item['distance_cm'],
+            event_time=event_time, update_state=update_state
+        ))
+        metrics.detector_duration.observe(time.perf_counter() - start)
+    return detected
+
+
+def _create_behavior_alerts(detected):
+    """Create alerts for (bed_id, alert_type, message, severity) behaviors; returns their types"""
+    raised = []
+    for bed_id, alert_type, message, severity in detected:
+        behavior_detection.log_behavior_detection(bed_id, alert_type, message, severity)
+        models.create_alert(bed_id, alert_type, message)
+        logging.info(f"Behavior detected - Bed {bed_id}: {alert_type} - {message}")
+        raised.append(alert_type)
+    return raised
+
+
+def flush_stale():
+    """Run detection over samples that waited out the reorder window (e.g. a bed gone quiet)"""
+    with detection_lock:
+        detected = _run_behaviors(event_orderer.flush_stale())
+    return _create_behavior_alerts(detected)
+
+
+def _ensure_flusher():
+    # Started lazily, and again in a forked worker that didn't inherit it
+    global _flusher
+    if _flusher is not None and _flusher[0] == os.getpid():
+        return
+    with detection_lock:
+        if _flusher is not None and _flusher[0] == os.getpid():
+            return
+        thread = threading.Thread(target=_flush_loop, name='reorder-flusher', daemon=True)
+        _flusher = (os.getpid(), thread)
+    thread.start()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(STALE_FLUSH_INTERVAL)
+        try:
+            flush_stale()
+        except Exception:
+            logging.exception('Flushing the reorder buffer failed')
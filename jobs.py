@@ -0,0 +1,324 @@
+"""
+Background jobs for heavy admin operations
+Deleting a bed's history, clearing very many alerts and purging old data
+run as jobs instead of inside an HTTP request. A job works through its
+stages in small batches, each its own short transaction, and pauses
+whenever its time slice is used up, so sensor ingest keeps getting the
+write lock. Stage and progress are saved in the jobs table after every
+batch: jobs can be cancelled, and a job interrupted by a restart is picked
+up again by the next worker.
+
+Run a worker outside the server, or queue a purge of old data:
+    python jobs.py
+    python jobs.py purge --days 365
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import alert_counters
+import archive
+import models
+from database import get_db, get_read_db, init_db
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+BATCH_SIZE = 500       # rows per batch (one transaction)
+SLICE_SECONDS = 0.1    # work this long...
+PAUSE_SECONDS = 0.05   # ...then leave the database to other writers this long
+POLL_INTERVAL = 5.0    # seconds between checks for queued jobs
+STALE_AFTER = 60       # seconds without progress before a running job is taken over
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+logger = logging.getLogger(__name__)
+
+def _now(offset=0):
+    return (datetime.now(timezone.utc) + timedelta(seconds=offset)).strftime(TIME_FORMAT)
+
+# ==================== JOB KINDS ====================
+# Each stage handles one batch and returns the number of rows it processed;
+# a stage is finished once a batch comes back smaller than BATCH_SIZE.
+# Batches must be safe to repeat: after a crash the last one may run again.
+
+def _delete_batch(db, table, where, params):
+    # Select ids first: the partitioned readings view deletes by id
+    ids = [r['id'] for r in db.execute(f'SELECT id FROM {table} WHERE {where} LIMIT ?', (*params, BATCH_SIZE))]
+    if ids:
+        db.execute(f"DELETE FROM {table} WHERE id IN ({','.join(['?'] * len(ids))})", ids)
+    return len(ids)
+
+def _resolve_alerts(db, params):
+    # New alerts up to max_id, optionally only the given ids or those of a bed, type or nurse
+    where, args = models.new_alerts_filter(params.get('ids'), params.get('bed_id'), params.get('alert_type'),
+                                           params.get('nurse_id'))
+    ids = [r['id'] for r in db.execute(
+        f'SELECT id FROM alerts WHERE {where} AND id <= ? ORDER BY id LIMIT ?',
+        (*args, params['max_id'], BATCH_SIZE))]
+    if ids:
+        alert_counters.set_status(db, f"id IN ({','.join(['?'] * len(ids))})", ids, 'resolved')
+        if params.get('user_id'):
+            # Audit each resolved alert, as a synchronous bulk resolve does
+            models.log_events([
+                (params['user_id'], params['username'], 'RESOLVE_ALERT', 'alert', alert_id,
+                 f"Resolved alert ID: {alert_id} (bulk)", params.get('ip_address'))
+                for alert_id in ids
+            ])
+    return len(ids)
+
+def _purge_alerts(db, params):
+    ids = [r['id'] for r in db.execute(
+        "SELECT id FROM alerts WHERE status = 'resolved' AND created_at < ? LIMIT ?",
+        (params['before'], BATCH_SIZE))]
+    if ids:
+        alert_counters.delete(db, f"id IN ({','.join(['?'] * len(ids))})", ids)
+    return len(ids)
+
+def _remove_archive(db, params):
+    archive.remove_bed(params['bed_id'])
+    return 0
+
+def _purge_archive(db, params):
+    archive.purge(params['before'])
+    return 0
+
+# kind -> [(stage name, batch function(db, params))], or a function(params)
+# returning that list; batches may keep their position in params, which is
+# saved with every batch. 'migrate' is added by migrations.py.
+KINDS = {
+    # The bed row, assignments and alert counts are removed by the request itself
+    'delete_bed': [
+        ('readings', lambda db, p: _delete_batch(db, 'readings', 'bed_id = ?', (p['bed_id'],))),
+        ('reading_chunks', lambda db, p: _delete_batch(db, 'reading_chunks', 'bed_id = ?', (p['bed_id'],))),
+        ('alerts', lambda db, p: _delete_batch(db, 'alerts', 'bed_id = ?', (p['bed_id'],))),
+        ('archive', _remove_archive),
+    ],
+    'clear_alerts': [
+        ('alerts', _resolve_alerts),
+    ],
+    'purge': [
+        ('readings', lambda db, p: _delete_batch(db, 'readings', 'timestamp < ?', (p['before'],))),
+        ('reading_chunks', lambda db, p: _delete_batch(db, 'reading_chunks', 'end_time < ?', (p['before'],))),
+        ('alerts', _purge_alerts),
+        ('archive', _purge_archive),
+    ],
+}
+
+# ==================== QUEUE ====================
+
+def enqueue(kind, params, user_id=None):
+    """Queue a job; returns its id"""
+    if kind not in KINDS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    db = get_db()
+    try:
+        cursor = db.execute('INSERT INTO jobs (kind, params, status, created_by) VALUES (?, ?, ?, ?)',
+                            (kind, json.dumps(params), QUEUED, user_id))
+        db.commit()
+        job_id = cursor.lastrowid
+    finally:
+        db.close()
+    if worker is not None:
+        worker.wake.set()
+    return job_id
+
+def enqueue_purge(days, user_id=None):
+    """Queue deletion of readings (live, sealed and archived) and resolved alerts older than `days` days"""
+    return enqueue('purge', {'before': _now(-days * 86400)}, user_id)
+
+def _stages(kind, params):
+    stages = KINDS.get(kind, [])
+    return stages(params) if callable(stages) else stages
+
+def _describe(row):
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    stages = _stages(job['kind'], job['params'])
+    job['stage'] = stages[job['stage']][0] if job['stage'] < len(stages) else None
+    return job
+
+def get_job(job_id):
+    """A job with its status, current stage name and rows processed, or None"""
+    db = get_read_db()
+    try:
+        row = db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return _describe(row) if row else None
+    finally:
+        db.close()
+
+def list_jobs(limit=50):
+    """Most recent jobs, newest first"""
+    db = get_read_db()
+    try:
+        return [_describe(r) for r in db.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,))]
+    finally:
+        db.close()
+
+def cancel(job_id):
+    """Cancel a queued or running job (a running one stops after its current batch)"""
+    db = get_db()
+    try:
+        changed = db.execute(
+            'UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)',
+            (CANCELLED, _now(), job_id, QUEUED, RUNNING)).rowcount
+        db.commit()
+        return changed > 0
+    finally:
+        db.close()
+
+def requeue(job_id, params):
+    """Queue a failed or cancelled job again with new params (batch positions kept in them carry over)"""
+    db = get_db()
+    try:
+        changed = db.execute('''
+            UPDATE jobs SET status = ?, params = ?, stage = 0, worker = NULL, error = NULL, finished_at = NULL
+            WHERE id = ? AND status IN (?, ?)
+        ''', (QUEUED, json.dumps(params), job_id, FAILED, CANCELLED)).rowcount
+        db.commit()
+    finally:
+        db.close()
+    if changed and worker is not None:
+        worker.wake.set()
+    return changed > 0
+
+# ==================== RUNNING ====================
+
+def claim(worker_id):
+    """Take the oldest queued job, or a running one whose worker stopped; returns it or None"""
+    stale = _now(-STALE_AFTER)
+    db = get_db()
+    try:
+        candidates = db.execute('''
+            SELECT id FROM jobs
+            WHERE status = ? OR (status = ? AND heartbeat < ?)
+            ORDER BY id LIMIT 5
+        ''', (QUEUED, RUNNING, stale)).fetchall()
+        for row in candidates:
+            # Only one worker wins a job
+            claimed = db.execute('''
+                UPDATE jobs SET status = ?, worker = ?, heartbeat = ?
+                WHERE id = ? AND (status = ? OR (status = ? AND heartbeat < ?))
+            ''', (RUNNING, worker_id, _now(), row['id'], QUEUED, RUNNING, stale)).rowcount
+            db.commit()
+            if claimed:
+                return dict(db.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone())
+        return None
+    finally:
+        db.close()
+
+def run(job, worker_id):
+    """Work through a claimed job's remaining stages; returns its final status"""
+    params = json.loads(job['params'])
+    stages = _stages(job['kind'], params)
+    stage = job['stage']
+    slice_start = time.monotonic()
+    db = get_db()
+    try:
+        while stage < len(stages):
+            name, batch = stages[stage]
+            try:
+                count = batch(db, params)
+            except Exception as e:
+                db.rollback()
+                logger.exception(f"Job {job['id']} ({job['kind']}) failed in stage {name}")
+                db.execute('UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND worker = ?',
+                           (FAILED, str(e), _now(), job['id'], worker_id))
+                db.commit()
+                return FAILED
+            if count < BATCH_SIZE:
+                stage += 1
+            # Saving progress also tells us whether the job was cancelled meanwhile
+            still_ours = db.execute('''
+                UPDATE jobs SET stage = ?, params = ?, progress = progress + ?, heartbeat = ?
+                WHERE id = ? AND status = ? AND worker = ?
+            ''', (stage, json.dumps(params), count, _now(), job['id'], RUNNING, worker_id)).rowcount
+            db.commit()
+            if not still_ours:
+                return CANCELLED
+            if time.monotonic() - slice_start >= SLICE_SECONDS:
+                time.sleep(PAUSE_SECONDS)
+                slice_start = time.monotonic()
+        db.execute('UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ? AND worker = ?',
+                   (DONE, _now(), job['id'], RUNNING, worker_id))
+        db.commit()
+        return DONE
+    finally:
+        db.close()
+
+def run_pending(worker_id=None):
+    """Run queued jobs until none are left; returns how many ran"""
+    worker_id = worker_id or f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+    ran = 0
+    while True:
+        job = claim(worker_id)
+        if job is None:
+            return ran
+        status = run(job, worker_id)
+        logger.info(f"Job {job['id']} ({job['kind']}) {status}")
+        ran += 1
+
+
+class Worker:
+    """Daemon thread that runs queued jobs one at a time"""
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.worker_id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.wake = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='job-worker', daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                run_pending(self.worker_id)
+            except Exception:
+                logger.exception('Job worker failed')
+            self.wake.wait(self.poll_interval)
+            self.wake.clear()
+
+
+worker = None
+
+def start_worker(poll_interval=POLL_INTERVAL):
+    """Run jobs from a daemon thread in this process (enqueue() wakes it)"""
+    global worker
+    if worker is None:
+        worker = Worker(poll_interval).start()
+    return worker
+
+# ==================== COMMAND LINE ====================
+
+def main():
+    parser = argparse.ArgumentParser(description='Run background jobs or queue a purge')
+    sub = parser.add_subparsers(dest='command')
+    purge = sub.add_parser('purge', help='delete readings and resolved alerts older than --days')
+    purge.add_argument('--days', type=int, required=True)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+
+    if args.command == 'purge':
+        job_id = enqueue_purge(args.days)
+        print(f"Queued purge job {job_id}; run 'python jobs.py' or the server to process it")
+        return
+    while True:
+        run_pending()
+        time.sleep(POLL_INTERVAL)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Lightweight in-process metrics for Patient Monitoring System
+Thread-safe counters and histograms rendered in Prometheus text format,
+plus per-request accounting of database work (queries, rows, commits).
+"""
+
+import hmac
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds (0.1 ms .. 10 s)
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+# Scrapers send this as "Authorization: Bearer <token>" to read /metrics
+# without an admin session (unset = only admins can read server.py's /metrics)
+TOKEN = os.environ.get('PMS_METRICS_TOKEN') or None
+
+# ==================== METRIC TYPES ====================
+
+class _Child:
+    __slots__ = ('lock', 'value', 'counts', 'sum', 'count')
+
+
+class Metric:
+    """A named metric family with optional labels"""
+
+    def __init__(self, name, help_text, kind, labelnames=(), buckets=None):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if buckets else None
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def _child(self, labelvalues):
+        child = self.children.get(labelvalues)
+        if child is None:
+            with self.lock:
+                child = self.children.get(labelvalues)
+                if child is None:
+                    child = _Child()
+                    child.lock = threading.Lock()
+                    child.value = 0.0
+                    child.counts = [0] * (len(self.buckets) + 1) if self.buckets else None
+                    child.sum = 0.0
+                    child.count = 0
+                    self.children[labelvalues] = child
+        return child
+
+    def inc(self, amount=1, *labelvalues):
+        child = self._child(labelvalues)
+        with child.lock:
+            child.value += amount
+
+    def set(self, value, *labelvalues):
+        child = self._child(labelvalues)
+        with child.lock:
+            child.value = value
+
+    def observe(self, value, *labelvalues):
+        child = self._child(labelvalues)
+        i = bisect_left(self.buckets, value)
+        with child.lock:
+            child.counts[i] += 1
+            child.sum += value
+            child.count += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for labelvalues, child in sorted(self.children.items()):
+            labels = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labelvalues))
+            with child.lock:
+                if self.kind == 'histogram':
+                    counts, total, count = list(child.counts), child.sum, child.count
+                else:
+                    value = child.value
+            if self.kind != 'histogram':
+                lines.append(f'{self.name}{{{labels}}} {value}' if labels else f'{self.name} {value}')
+                continue
+            sep = ',' if labels else ''
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {count}')
+            suffix = f'{{{labels}}}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {total}')
+            lines.append(f'{self.name}_count{suffix} {count}')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REGISTRY = []
+
+def counter(name, help_text, labelnames=()):
+    metric = Metric(name, help_text, 'counter', labelnames)
+    REGISTRY.append(metric)
+    return metric
+
+def gauge(name, help_text, labelnames=()):
+    metric = Metric(name, help_text, 'gauge', labelnames)
+    REGISTRY.append(metric)
+    return metric
+
+def histogram(name, help_text, labelnames=(), buckets=TIME_BUCKETS):
+    metric = Metric(name, help_text, 'histogram', labelnames, buckets)
+    REGISTRY.append(metric)
+    return metric
+
+def render():
+    """All metrics in Prometheus text exposition format"""
+    return '\n'.join(m.render() for m in REGISTRY if m.children) + '\n'
+
+
+# ==================== METRICS ====================
+
+http_requests = counter('pms_http_requests_total', 'HTTP requests handled', ('route', 'method', 'status'))
+http_duration = histogram('pms_http_request_duration_seconds', 'HTTP request latency', ('route',))
+request_queries = histogram('pms_db_queries_per_request', 'SQL statements executed per request',
+                            ('route',), COUNT_BUCKETS)
+request_query_time = histogram('pms_db_query_seconds_per_request', 'Time spent in SQL per request', ('route',))
+request_rows = histogram('pms_db_rows_per_request', 'Rows fetched per request', ('route',), ROW_BUCKETS)
+request_commit_time = histogram('pms_db_commit_seconds_per_request', 'Time spent committing per request',
+                                ('route',))
+
+db_queries = counter('pms_db_queries_total', 'SQL statements executed', ('kind',))
+db_query_duration = histogram('pms_db_query_duration_seconds', 'SQL statement latency', ('kind',))
+db_rows = counter('pms_db_rows_returned_total', 'Rows fetched from SQL queries')
+db_commits = counter('pms_db_commits_total', 'Transactions committed')
+db_commit_duration = histogram('pms_db_commit_duration_seconds', 'Commit (fsync) latency')
+db_connections = counter('pms_db_connections_total', 'Database connections opened')
+
+detector_duration = histogram('pms_detector_duration_seconds', 'Behavior detection time per sample')
+alerts_created = counter('pms_alerts_created_total', 'Alerts created', ('alert_type',))
+
+
+# ==================== PER-REQUEST ACCOUNTING ====================
+
+_local = threading.local()
+
+def begin_request():
+    """Start collecting database work for the current thread's request"""
+    _local.stats = [0, 0.0, 0, 0.0]   # queries, query seconds, rows, commit seconds
+    _local.started = time.perf_counter()
+
+def end_request(route, method, status):
+    """Record request metrics; returns the request's stats dict"""
+    stats = getattr(_local, 'stats', None)
+    started = getattr(_local, 'started', None)
+    _local.stats = None
+    if stats is None or started is None:
+        return None
+    elapsed = time.perf_counter() - started
+    http_requests.inc(1, route, method, str(status))
+    http_duration.observe(elapsed, route)
+    request_queries.observe(stats[0], route)
+    request_query_time.observe(stats[1], route)
+    request_rows.observe(stats[2], route)
+    request_commit_time.observe(stats[3], route)
+    return {'queries': stats[0], 'query_seconds': stats[1], 'rows': stats[2],
+            'commit_seconds': stats[3], 'seconds': elapsed}
+
+def statement_kind(sql):
+    """First keyword of a statement, lowercased (select/insert/update/...)"""
+    head = sql.lstrip()[:8].split(None, 1)
+    return head[0].lower() if head else 'other'
+
+def token_ok(authorization):
+    """True when an Authorization header value carries the configured metrics token"""
+    if not TOKEN:
+        return False
+    return hmac.compare_digest((authorization or '').encode(), f'Bearer {TOKEN}'.encode())
+
+def record_query(kind, seconds):
+    db_queries.inc(1, kind)
+    db_query_duration.observe(seconds, kind)
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += seconds
+
+def record_fetch(rows, seconds):
+    if rows:
+        db_rows.inc(rows)
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats[1] += seconds
+        stats[2] += rows
+
+def record_commit(seconds):
+    db_commits.inc()
+    db_commit_duration.observe(seconds)
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats[3] += seconds
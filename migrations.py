@@ -0,0 +1,332 @@
+"""
+Versioned schema migrations for Patient Monitoring System
+Every schema change is a numbered migration, recorded in a schema_migrations
+table once applied (in the telemetry file for telemetry migrations when
+PMS_TELEMETRY_DB is set). Startup reads the recorded versions and returns
+at once when nothing is pending. Pending migrations run in order under a
+lock, so several processes starting together migrate only once.
+
+Online migrations (backfills of big tables) don't run at startup: they
+are queued as a background 'migrate' job (see jobs.py) that works in
+batches and records the migration with its last batch. Index builds are a
+single statement holding the write lock, so they run at startup.
+
+Show migration status, or apply pending migrations now (online ones included):
+    python migrations.py
+    python migrations.py --run
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+from pathlib import Path
+
+import alert_counters
+import database
+import jobs
+import postgres_backend
+
+try:
+    import fcntl
+except ImportError:  # Windows: startup migrations are not locked against each other
+    fcntl = None
+
+MAIN = 'main'
+TELEMETRY = 'telemetry'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS {prefix}schema_migrations (
+    id {id},
+    version INTEGER NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    applied_at {timestamp}
+)
+'''
+SQLITE_COLUMNS = {'id': 'INTEGER PRIMARY KEY AUTOINCREMENT', 'timestamp': 'DATETIME DEFAULT CURRENT_TIMESTAMP'}
+POSTGRES_COLUMNS = {'id': 'SERIAL PRIMARY KEY', 'timestamp': 'TIMESTAMP DEFAULT LOCALTIMESTAMP'}
+
+POSTGRES_LOCK = 7240481   # pg_advisory_lock key held while migrating
+
+# What reading a schema_migrations table that doesn't exist yet raises
+MISSING_TABLE_ERRORS = (sqlite3.OperationalError,) + postgres_backend.PROGRAMMING_ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+class Migration:
+    """
+    One schema change. apply(db) makes it (and must be safe to repeat);
+    an online migration's apply(db, state) does one batch and returns the
+    number of rows it handled, keeping its position in `state`.
+    """
+
+    def __init__(self, version, name, target, apply, online=False, table=None, sqlite_only=False):
+        self.version = version
+        self.name = name
+        self.target = target
+        self.apply = apply
+        self.online = online
+        self.table = table          # online: run at startup anyway while this table is empty
+        self.sqlite_only = sqlite_only
+
+# ==================== MIGRATIONS ====================
+
+def _main_schema(db):
+    if database.DATABASE_URL:
+        # schema_postgres.sql has the telemetry tables too
+        database.get_backend().init_schema(database.BED_ID_START)
+        return
+    db.executescript((Path(__file__).parent / 'schema.sql').read_text())
+    if database.BED_ID_START > 1:
+        db.execute(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT 'beds', ? "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'beds')",
+            (database.BED_ID_START - 1,)
+        )
+
+def _user_security_columns(db):
+    # Replaces update_security_schema.py
+    columns = [r['name'] for r in db.execute("PRAGMA main.table_info('users')")]
+    for name, kind in (('menu_permissions', 'TEXT'), ('failed_login_attempts', 'INTEGER DEFAULT 0'),
+                       ('locked_at', 'DATETIME'), ('last_login_attempt', 'DATETIME')):
+        if name not in columns:
+            db.execute(f'ALTER TABLE users ADD COLUMN {name} {kind}')
+
+def _audit_search(db):
+    # Without FTS5 the migration still counts as applied: audit search uses LIKE scans
+    database.init_audit_search(db)
+
+def _telemetry_schema(db):
+    if database.TELEMETRY_DATABASE:
+        database.init_telemetry()
+        return
+    alert_counters.add_category_column(db)
+    db.executescript((Path(__file__).parent / 'telemetry.sql').read_text())
+
+def _threshold_profiles(db):
+    _main_schema(db)   # creates the new tables; everything in the schema files is IF NOT EXISTS
+    if database.DATABASE_URL:
+        return
+    columns = [r['name'] for r in db.execute("PRAGMA main.table_info('beds')")]
+    if 'threshold_profile_id' not in columns:
+        db.execute('ALTER TABLE beds ADD COLUMN threshold_profile_id INTEGER REFERENCES threshold_profiles(id)')
+
+def _count_alerts(db, state):
+    # Alerts from before the counters existed have no category yet: categorize
+    # and count them a batch at a time (set_status and delete leave them alone)
+    ids = [r['id'] for r in db.execute('SELECT id FROM alerts WHERE id > ? AND category IS NULL ORDER BY id LIMIT ?',
+                                       (state.get('after', 0), jobs.BATCH_SIZE))]
+    if ids:
+        placeholders = ','.join(['?'] * len(ids))
+        db.execute(f"UPDATE alerts SET category = {alert_counters.category_sql()} WHERE id IN ({placeholders})", ids)
+        alert_counters.count_alerts(db, f'id IN ({placeholders})', ids)
+        state['after'] = ids[-1]
+    return len(ids)
+
+def _categorize_alerts(db, state):
+    ids = [r['id'] for r in db.execute('SELECT id FROM alerts WHERE id > ? ORDER BY id LIMIT ?',
+                                       (state.get('after', 0), jobs.BATCH_SIZE))]
+    if ids:
+        db.execute(f"UPDATE alerts SET category = {alert_counters.category_sql()} "
+                   f"WHERE category IS NULL AND id IN ({','.join(['?'] * len(ids))})", ids)
+        state['after'] = ids[-1]
+    return len(ids)
+
+def _alert_category_index(db):
+    # One statement: SQLite can't build an index in batches, so it runs at startup
+    db.execute(f'CREATE INDEX IF NOT EXISTS {_prefix(TELEMETRY)}idx_alerts_category_status '
+               f'ON alerts(category, status, created_at)')
+
+# Append new migrations at the end; never renumber or edit applied ones
+MIGRATIONS = [
+    Migration(1, 'main schema', MAIN, _main_schema),
+    Migration(2, 'user security columns', MAIN, _user_security_columns, sqlite_only=True),
+    Migration(3, 'audit log search', MAIN, _audit_search, sqlite_only=True),
+    Migration(4, 'telemetry schema', TELEMETRY, _telemetry_schema, sqlite_only=True),
+    Migration(5, 'count alerts', TELEMETRY, _count_alerts, online=True, table='alerts'),
+    Migration(6, 'categorize alerts', TELEMETRY, _categorize_alerts, online=True, table='alerts'),
+    Migration(7, 'alert category index', TELEMETRY, _alert_category_index),
+    Migration(8, 'threshold profiles', MAIN, _threshold_profiles),
+]
+
+# ==================== BOOKKEEPING ====================
+
+def _split():
+    return bool(database.TELEMETRY_DATABASE) and not database.DATABASE_URL
+
+def _prefix(target):
+    """Schema prefix of a target's tables on a get_db() connection"""
+    return 'telemetry.' if target == TELEMETRY and _split() else ''
+
+def _targets():
+    return (MAIN, TELEMETRY) if _split() else (MAIN,)
+
+def migrations():
+    """Migrations that apply to the configured backend, in order"""
+    return [m for m in MIGRATIONS if not (m.sqlite_only and database.DATABASE_URL)]
+
+def applied(db):
+    """{version} of the applied migrations (raises if a schema_migrations table is missing)"""
+    targets = {m.version: m.target for m in MIGRATIONS}
+    versions = set()
+    for target in _targets():
+        # After split_telemetry.py the main file still lists the telemetry migrations it had
+        versions.update(r['version'] for r in db.execute(f'SELECT version FROM {_prefix(target)}schema_migrations')
+                        if not _split() or targets.get(r['version']) == target)
+    return versions
+
+def _record(db, migration):
+    # Without a telemetry file, telemetry migrations are recorded in the main database
+    db.execute(f'INSERT OR IGNORE INTO {_prefix(migration.target)}schema_migrations '
+               f'(version, name) VALUES (?, ?)', (migration.version, migration.name))
+
+def _step(migration, db, params):
+    """One batch of an online migration, recorded with its last batch"""
+    state = params.setdefault('state', {}).setdefault(str(migration.version), {})
+    count = migration.apply(db, state)
+    if count < jobs.BATCH_SIZE:
+        _record(db, migration)
+    return count
+
+def job_stages(params):
+    """Stages of a 'migrate' job: one per online migration in params['versions']"""
+    by_version = {m.version: m for m in MIGRATIONS}
+    # Jobs queued by older versions may list migrations that now run at startup
+    return [(by_version[v].name, lambda db, p, m=by_version[v]: _step(m, db, p))
+            for v in params['versions'] if by_version[v].online]
+
+jobs.KINDS['migrate'] = job_stages
+
+def _apply_online(db, migration):
+    params = {}
+    while _step(migration, db, params) >= jobs.BATCH_SIZE:
+        db.commit()
+    db.commit()
+
+# ==================== STARTUP ====================
+
+class _Lock:
+    """Serializes migrations between processes sharing the database"""
+
+    def __init__(self, db):
+        self.db = db
+        self.file = None
+
+    def __enter__(self):
+        if database.DATABASE_URL:
+            self.db.execute('SELECT pg_advisory_lock(?)', (POSTGRES_LOCK,)).fetchall()
+        elif fcntl is not None:
+            self.file = open(f'{database.DATABASE}.migrate.lock', 'a')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if database.DATABASE_URL:
+            self.db.rollback()
+            self.db.execute('SELECT pg_advisory_unlock(?)', (POSTGRES_LOCK,)).fetchall()
+            self.db.commit()
+        elif self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+
+
+def _is_empty(db, table):
+    return db.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone() is None
+
+def _queue(db, versions):
+    """Make sure a 'migrate' job covers `versions`; returns its id"""
+    last = db.execute("SELECT id, status, params FROM jobs WHERE kind = 'migrate' ORDER BY id DESC LIMIT 1").fetchone()
+    if last and last['status'] in (jobs.QUEUED, jobs.RUNNING):
+        return last['id']
+    if last and last['status'] in (jobs.FAILED, jobs.CANCELLED):
+        # Resume where it stopped: batch positions are kept in its params
+        params = json.loads(last['params'])
+        params['versions'] = versions
+        jobs.requeue(last['id'], params)
+        return last['id']
+    return jobs.enqueue('migrate', {'versions': versions})
+
+def _migrate(db):
+    done = applied(db)
+    queued = []
+    for migration in migrations():
+        if migration.version in done:
+            continue
+        if migration.online and not (migration.table and _is_empty(db, migration.table)):
+            queued.append(migration.version)
+            continue
+        if migration.online:
+            _apply_online(db, migration)
+        else:
+            migration.apply(db)
+            _record(db, migration)
+            db.commit()
+        logger.info(f'Applied migration {migration.version}: {migration.name}')
+    if queued:
+        job_id = _queue(db, queued)
+        logger.info(f'Online migrations {queued} queued as job {job_id}')
+
+def migrate():
+    """Apply pending migrations; returns at once when the schema is current"""
+    db = database.get_db()
+    try:
+        if not database.DATABASE_URL:
+            db.execute(f'PRAGMA journal_mode = {database.JOURNAL_MODE}')
+        try:
+            current = {m.version for m in migrations()} <= applied(db)
+        except MISSING_TABLE_ERRORS:
+            db.rollback()
+            current = False
+        if not current:
+            with _Lock(db):
+                for target in _targets():
+                    db.execute(SCHEMA.format(prefix=_prefix(target), **(
+                        POSTGRES_COLUMNS if database.DATABASE_URL else SQLITE_COLUMNS)))
+                db.commit()
+                _migrate(db)
+        if not database.DATABASE_URL:
+            database.AUDIT_FTS = db.execute(
+                "SELECT 1 FROM main.sqlite_master WHERE name = 'audit_logs_fts'").fetchone() is not None
+    finally:
+        db.close()
+
+# ==================== COMMAND LINE ====================
+
+def status():
+    """[(version, name, target, applied, online)] of the configured backend's migrations"""
+    db = database.get_db()
+    try:
+        try:
+            done = applied(db)
+        except MISSING_TABLE_ERRORS:
+            done = set()
+        return [(m.version, m.name, m.target, m.version in done, m.online) for m in migrations()]
+    finally:
+        db.close()
+
+def run_online():
+    """Apply pending online migrations now, in this process; returns how many ran"""
+    db = database.get_db()
+    try:
+        pending = [m for m in migrations() if m.online and m.version not in applied(db)]
+        for migration in pending:
+            _apply_online(db, migration)
+            print(f"Applied migration {migration.version}: {migration.name}")
+        return len(pending)
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Show or apply schema migrations')
+    parser.add_argument('--run', action='store_true', help='apply pending migrations, online ones included')
+    args = parser.parse_args()
+    database.init_db()
+    if args.run:
+        run_online()
+    for version, name, target, done, online in status():
+        state = 'applied' if done else ('pending (background job)' if online else 'pending')
+        print(f"{version:4d}  {name:<24} {target:<10} {state}")
+
+if __name__ == '__main__':
+    main()
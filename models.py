@@ -2,12 +2,23 @@
 Data models and helper functions for Patient Monitoring System
 """
 
-import sqlite3
-from database import get_db
+import database
+from database import get_db, get_read_db
+import heapq
 import json
+import metrics
+import alert_counters
+import archive
+import audit
+import reading_chunks
+import thresholds
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 
+# Open bounds for timestamp range filters (valid on SQLite and PostgreSQL)
+MIN_TIMESTAMP = '0001-01-01 00:00:00'
+MAX_TIMESTAMP = '9999-12-31 23:59:59'
+
 # ==================== USER MANAGEMENT ====================
 
 def create_user(username, password, role='nurse', menu_permissions=None):
@@ -25,7 +36,7 @@ def create_user(username, password, role='nurse', menu_permissions=None):
         )
         db.commit()
         return cursor.lastrowid
-    except sqlite3.IntegrityError:
+    except database.IntegrityError:
         return None
     finally:
         db.close()
@@ -148,7 +159,7 @@ def update_user(user_id, username, role, menu_permissions=None):
                    (username, role, perms_json, user_id))
         db.commit()
         return True
-    except sqlite3.IntegrityError:
+    except database.IntegrityError:
         return False
     finally:
         db.close()
@@ -243,35 +254,61 @@ def get_nurse_beds(nurse_id):
 
 # ==================== READINGS ====================
 
-def insert_reading(bed_id, temperature=None, humidity=None, motion=None, distance_cm=None):
-    """Insert a new sensor reading"""
+def insert_reading(bed_id, temperature=None, humidity=None, motion=None, distance_cm=None, timestamp=None):
+    """Insert a new sensor reading
+
+    `timestamp` is the device sample time (naive UTC datetime); defaults to now.
+    """
     db = get_db()
     try:
-        cursor = db.execute('''
-            INSERT INTO readings (bed_id, temperature, humidity, motion, distance_cm)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (bed_id, temperature, humidity, motion, distance_cm))
+        if timestamp is None:
+            cursor = db.execute('''
+                INSERT INTO readings (bed_id, temperature, humidity, motion, distance_cm)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (bed_id, temperature, humidity, motion, distance_cm))
+        else:
+            cursor = db.execute('''
+                INSERT INTO readings (bed_id, timestamp, temperature, humidity, motion, distance_cm)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (bed_id, timestamp.strftime('%Y-%m-%d %H:%M:%S'), temperature, humidity, motion, distance_cm))
         db.commit()
         return cursor.lastrowid
     finally:
         db.close()
 
+def insert_readings(readings):
+    """Insert many parsed readings in a single transaction"""
+    if not readings:
+        return 0
+    db = get_db()
+    try:
+        rows = [
+            (r['bed_id'], (r.get('timestamp') or datetime.utcnow()).strftime('%Y-%m-%d %H:%M:%S'),
+             r['temperature'], r['humidity'], r['motion'], r['distance_cm'])
+            for r in readings
+        ]
+        db.executemany('''
+            INSERT INTO readings (bed_id, timestamp, temperature, humidity, motion, distance_cm)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+        db.commit()
+        return len(rows)
+    finally:
+        db.close()
+
 def get_latest_readings_per_bed():
     """Get latest reading for each bed with alert status"""
-    db = get_db()
+    db = get_read_db()
     try:
-        readings = db.execute('''
+        readings = db.execute(f'''
             SELECT r.*, b.bed_name, b.room_no,
                    (SELECT COUNT(*) FROM alerts a 
                     WHERE a.bed_id = r.bed_id AND a.status = 'new') as active_alert_count,
                    (SELECT alert_type FROM alerts a 
                     WHERE a.bed_id = r.bed_id AND a.status = 'new' 
                     ORDER BY a.created_at DESC LIMIT 1) as latest_alert_type
-            FROM readings r
-            INNER JOIN beds b ON r.bed_id = b.id
-            WHERE r.id IN (
-                SELECT MAX(id) FROM readings GROUP BY bed_id
-            )
+            FROM beds b
+            INNER JOIN readings r ON r.id = {database.latest_reading_id(db, 'b.id')}
             ORDER BY b.bed_name
         ''').fetchall()
         return [dict(r) for r in readings]
@@ -280,38 +317,109 @@ def get_latest_readings_per_bed():
 
 def get_readings_for_bed(bed_id, hours=24, limit=1000):
     """Get readings for a specific bed within time range"""
-    db = get_db()
+    db = get_read_db()
     try:
         cutoff = datetime.now() - timedelta(hours=hours)
         cutoff_str = cutoff.strftime('%Y-%m-%d %H:%M:%S')  # match DB timestamp format
+        live_start = archive.live_start(cutoff_str)
         readings = db.execute('''
             SELECT * FROM readings
             WHERE bed_id = ? AND timestamp >= ?
             ORDER BY timestamp DESC
             LIMIT ?
-        ''', (bed_id, cutoff_str, limit)).fetchall()
-        return [dict(r) for r in readings]
+        ''', (bed_id, live_start, limit)).fetchall()
+        readings = [dict(r) for r in readings]
+        # Older hours may have been sealed into compressed chunks or archived
+        older = reading_chunks.read_readings(db, bed_id, live_start, limit)
+        older += archive.read_readings(bed_id, cutoff_str, limit)
+        if older:
+            readings = sorted(readings + older, key=lambda r: (r['timestamp'], r['id']), reverse=True)[:limit]
+        return readings
     finally:
         db.close()
 
+def iter_readings(bed_ids, start=None, end=None, batch_size=1000):
+    """Yield readings of each bed (live, sealed and archived) in time order, one keyset page at a time
+
+    `start`/`end` bound the timestamp (UTC, 'YYYY-MM-DD[ HH:MM:SS]', end
+    exclusive). Memory stays constant however long the range is.
+    """
+    start = start or MIN_TIMESTAMP
+    end = end or MAX_TIMESTAMP
+    for bed_id in bed_ids:
+        live_start = archive.live_start(start)
+        live = _iter_live_readings(bed_id, live_start, end, batch_size)
+        sealed = reading_chunks.iter_sealed_readings(bed_id, live_start, end)
+        archived = archive.iter_readings(bed_id, start, end)
+        yield from heapq.merge(archived, live, sealed, key=lambda r: (r['timestamp'], r['id']))
+
+def _iter_live_readings(bed_id, start, end, batch_size):
+    after = None
+    while True:
+        query = 'SELECT * FROM readings WHERE bed_id = ? AND timestamp >= ? AND timestamp < ?'
+        params = [bed_id, start, end]
+        if after:
+            query += ' AND (timestamp > ? OR (timestamp = ? AND id > ?))'
+            params.extend([after[0], after[0], after[1]])
+        query += ' ORDER BY timestamp, id LIMIT ?'
+        params.append(batch_size)
+        db = get_read_db()
+        try:
+            page = [dict(r) for r in db.execute(query, params).fetchall()]
+        finally:
+            db.close()
+        yield from page
+        if len(page) < batch_size:
+            return
+        after = (page[-1]['timestamp'], page[-1]['id'])
+
+def get_temperature_sums(db, hours=24, bed_ids=None):
+    """{bed_id: (temp_sum, temp_count)} over the last `hours` of live, sealed and archived readings"""
+    if bed_ids is not None and not bed_ids:
+        return {}
+    since = (datetime.utcnow() - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
+    # Readings before the archive cutoff are summed from the archive only
+    sums = reading_chunks.temperature_sums_sql(f"'{archive.live_start(since)}'")
+    query = f'SELECT bed_id, SUM(temp_sum) AS temp_sum, SUM(temp_count) AS temp_count FROM ({sums}) t'
+    params = []
+    if bed_ids is not None:
+        query += f" WHERE bed_id IN ({','.join(['?'] * len(bed_ids))})"
+        params = list(bed_ids)
+    query += ' GROUP BY bed_id'
+    totals = {r['bed_id']: (r['temp_sum'] or 0.0, r['temp_count']) for r in db.execute(query, params)}
+
+    if bed_ids is None:
+        bed_ids = [r['id'] for r in db.execute('SELECT id FROM beds')]
+    for bed_id, (temp_sum, temp_count) in archive.temperature_sums(since, bed_ids).items():
+        live_sum, live_count = totals.get(bed_id, (0.0, 0))
+        totals[bed_id] = (live_sum + temp_sum, live_count + temp_count)
+    return totals
+
 # ==================== ALERTS ====================
 
 def create_alert(bed_id, alert_type, message):
     """Create a new alert"""
+    created_at = alert_counters.now()
     db = get_db()
     try:
         cursor = db.execute('''
-            INSERT INTO alerts (bed_id, alert_type, message, status)
-            VALUES (?, ?, ?, 'new')
-        ''', (bed_id, alert_type, message))
+            INSERT INTO alerts (bed_id, alert_type, category, message, status, created_at)
+            VALUES (?, ?, ?, ?, 'new', ?)
+        ''', (bed_id, alert_type, alert_counters.category(alert_type), message, created_at))
+        alert_counters.record_created(db, bed_id, alert_type, created_at)
         db.commit()
+        metrics.alerts_created.inc(1, alert_type)
         return cursor.lastrowid
     finally:
         db.close()
 
-def get_all_alerts(status=None, nurse_id=None, limit=100):
-    """Get all alerts, optionally filtered by status and nurse"""
-    db = get_db()
+def get_all_alerts(status=None, nurse_id=None, limit=100, before_id=None, since_id=None):
+    """Get alerts newest first, optionally filtered by status and nurse
+
+    Keyset pagination: `before_id` pages back into history and `since_id`
+    returns only alerts newer than one the client has already seen.
+    """
+    db = get_read_db()
     try:
         query = '''
             SELECT a.*, b.bed_name, b.room_no
@@ -329,7 +437,15 @@ def get_all_alerts(status=None, nurse_id=None, limit=100):
             query += ' AND EXISTS (SELECT 1 FROM nurse_assignments na WHERE na.bed_id = a.bed_id AND na.nurse_id = ?)'
             params.append(nurse_id)
         
-        query += ' ORDER BY a.created_at DESC LIMIT ?'
+        if before_id:
+            query += ' AND a.id < ?'
+            params.append(before_id)
+        
+        if since_id:
+            query += ' AND a.id > ?'
+            params.append(since_id)
+        
+        query += ' ORDER BY a.id DESC LIMIT ?'
         params.append(limit)
         
         alerts = db.execute(query, params).fetchall()
@@ -337,20 +453,95 @@ def get_all_alerts(status=None, nurse_id=None, limit=100):
     finally:
         db.close()
 
+def iter_alerts(bed_ids, start=None, end=None, batch_size=1000):
+    """Yield alerts of the given beds created in [start, end), oldest first, one keyset page at a time"""
+    if not bed_ids:
+        return
+    placeholders = ','.join(['?'] * len(bed_ids))
+    after_id = 0
+    while True:
+        db = get_read_db()
+        try:
+            page = [dict(a) for a in db.execute(f'''
+                SELECT a.*, b.bed_name, b.room_no
+                FROM alerts a
+                INNER JOIN beds b ON a.bed_id = b.id
+                WHERE a.bed_id IN ({placeholders}) AND a.created_at >= ? AND a.created_at < ? AND a.id > ?
+                ORDER BY a.id
+                LIMIT ?
+            ''', (*bed_ids, start or MIN_TIMESTAMP, end or MAX_TIMESTAMP, after_id, batch_size)).fetchall()]
+        finally:
+            db.close()
+        yield from page
+        if len(page) < batch_size:
+            return
+        after_id = page[-1]['id']
+
 def resolve_alert(alert_id):
     """Mark an alert as resolved"""
     db = get_db()
     try:
-        db.execute('''
-            UPDATE alerts 
-            SET status = 'resolved', resolved_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (alert_id,))
+        alert_counters.set_status(db, 'id = ?', (alert_id,), 'resolved')
         db.commit()
         return True
     finally:
         db.close()
 
+def new_alerts_filter(alert_ids=None, bed_id=None, alert_type=None, nurse_id=None):
+    """(where, params) over alerts selecting the new alerts that match every given filter
+
+    With `nurse_id`, alerts of beds not assigned to that nurse are left out.
+    """
+    where, params = ["status = 'new'"], []
+    if alert_ids:
+        where.append(f"id IN ({','.join(['?'] * len(alert_ids))})")
+        params.extend(alert_ids)
+    if bed_id:
+        where.append('bed_id = ?')
+        params.append(bed_id)
+    if alert_type:
+        where.append('alert_type = ?')
+        params.append(alert_type)
+    if nurse_id:
+        where.append('bed_id IN (SELECT bed_id FROM nurse_assignments WHERE nurse_id = ?)')
+        params.append(nurse_id)
+    return ' AND '.join(where), params
+
+def resolve_alerts(alert_ids=None, bed_id=None, alert_type=None, nurse_id=None, limit=None):
+    """Resolve all new alerts matching every given filter in one transaction; returns their ids
+
+    With `limit`, nothing is resolved and None is returned when more than
+    `limit` alerts match (the caller resolves them in batches instead).
+    """
+    where, params = new_alerts_filter(alert_ids, bed_id, alert_type, nurse_id)
+    query = f'SELECT id FROM alerts WHERE {where} ORDER BY id'
+    if limit:
+        query += f' LIMIT {int(limit) + 1}'
+    db = get_db()
+    try:
+        resolved = [r['id'] for r in db.execute(query, params)]
+        if limit and len(resolved) > limit:
+            return None
+        if resolved:
+            # Exactly the selected alerts: ones created meanwhile are left for the next request
+            alert_counters.set_status(db, f"id IN ({','.join(['?'] * len(resolved))})", resolved, 'resolved')
+            db.commit()
+        return resolved
+    finally:
+        db.close()
+
+def nurse_can_access_alert(nurse_id, alert_id):
+    """True if the alert's bed is assigned to the nurse (primary key + assignment index lookup)"""
+    db = get_read_db()
+    try:
+        return db.execute('''
+            SELECT 1 FROM alerts a
+            INNER JOIN nurse_assignments na ON na.bed_id = a.bed_id AND na.nurse_id = ?
+            WHERE a.id = ?
+        ''', (nurse_id, alert_id)).fetchone() is not None
+    finally:
+        db.close()
+
 # ==================== DEVICES ====================
 
 def update_device_status(esp_id, ip=None):
@@ -387,6 +578,15 @@ def update_device_status(esp_id, ip=None):
     finally:
         db.close()
 
+def list_devices():
+    """Get all registered devices"""
+    db = get_db()
+    try:
+        devices = db.execute('SELECT * FROM devices ORDER BY esp_id').fetchall()
+        return [dict(d) for d in devices]
+    finally:
+        db.close()
+
 # ==================== SETTINGS ====================
 
 def set_setting(key, value):
@@ -397,10 +597,14 @@ def set_setting(key, value):
             INSERT INTO settings (key, value) VALUES (?, ?)
             ON CONFLICT(key) DO UPDATE SET value = excluded.value
         ''', (key, str(value)))
+        if key in thresholds.KEYS:
+            thresholds.changed(db)
         db.commit()
-        return True
     finally:
         db.close()
+    if key in thresholds.KEYS:
+        thresholds.invalidate()
+    return True
 
 def get_all_settings():
     """Get all settings as a dictionary"""
@@ -429,7 +633,7 @@ def get_stats_overview(nurse_id=None):
 
     If `nurse_id` is provided, statistics are restricted to beds assigned to that nurse.
     """
-    db = get_db()
+    db = get_read_db()
     try:
         stats = {}
 
@@ -458,40 +662,24 @@ def get_stats_overview(nurse_id=None):
             active_movements = 0
         stats['active_movements'] = active_movements or 0
 
-        # Fall risk: count of new alerts of types indicating fall/exit in the last 24 hours
+        # Fall risk: new fall/exit alerts created in the last 24 hours, from the hourly counters
+        # (whole hours: the window starts at the top of the hour 24 hours ago, so it spans 24-25 hours)
         try:
-            if nurse_id:
-                fall_risk = db.execute("""
-                    SELECT COUNT(*) as cnt FROM alerts a
-                    WHERE a.status = 'new' AND (a.alert_type LIKE '%fall%' OR a.alert_type LIKE '%exit%')
-                    AND a.created_at >= datetime('now', '-24 hours')
-                    AND EXISTS (SELECT 1 FROM nurse_assignments na WHERE na.bed_id = a.bed_id AND na.nurse_id = ?)
-                """, (nurse_id,)).fetchone()['cnt']
-            else:
-                fall_risk = db.execute("""
-                    SELECT COUNT(*) as cnt FROM alerts
-                    WHERE status = 'new' AND (alert_type LIKE '%fall%' OR alert_type LIKE '%exit%')
-                    AND created_at >= datetime('now', '-24 hours')
-                """).fetchone()['cnt']
+            fall_risk = alert_counters.count(db, alert_counters.hours_ago(24), status='new',
+                                             category=alert_counters.FALL_RISK, nurse_id=nurse_id)
         except Exception:
             fall_risk = 0
         stats['fall_risk'] = fall_risk or 0
 
         # Average room temperature: average of readings in last 24 hours (optionally limited to nurse beds)
         try:
+            bed_ids = None
             if nurse_id:
-                avg_temp = db.execute("""
-                    SELECT ROUND(AVG(r.temperature), 1) as avg_temp FROM readings r
-                    WHERE r.temperature IS NOT NULL AND r.timestamp >= datetime('now', '-24 hours')
-                    AND EXISTS (SELECT 1 FROM nurse_assignments na WHERE na.bed_id = r.bed_id AND na.nurse_id = ?)
-                """, (nurse_id,)).fetchone()['avg_temp']
-            else:
-                avg_temp = db.execute("""
-                    SELECT ROUND(AVG(temperature), 1) as avg_temp FROM readings
-                    WHERE temperature IS NOT NULL AND timestamp >= datetime('now', '-24 hours')
-                """).fetchone()['avg_temp']
-
-            stats['avg_temperature'] = float(avg_temp) if avg_temp is not None else None
+                bed_ids = [r['bed_id'] for r in db.execute(
+                    'SELECT bed_id FROM nurse_assignments WHERE nurse_id = ?', (nurse_id,))]
+            totals = get_temperature_sums(db, 24, bed_ids).values()
+            temp_count = sum(n for _, n in totals)
+            stats['avg_temperature'] = round(sum(s for s, _ in totals) / temp_count, 1) if temp_count else None
         except Exception:
             stats['avg_temperature'] = None
 
@@ -503,33 +691,86 @@ def get_stats_overview(nurse_id=None):
 # ==================== AUDIT LOGGING ====================
 
 def log_event(user_id, username, action, target_type=None, target_id=None, details=None, ip_address=None):
-    """Log an audit event"""
-    db = get_db()
-    try:
-        db.execute('''
-            INSERT INTO audit_logs (user_id, username, action, target_type, target_id, details, ip_address)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, username, action, target_type, target_id, details, ip_address))
-        db.commit()
-    finally:
-        db.close()
-
-def get_audit_logs(limit=100, user_id=None, action_filter=None):
-    """Get audit logs with optional filters"""
-    db = get_db()
+    """Log an audit event (queued; see audit.AuditWriter)"""
+    audit.writer.log(user_id, username, action, target_type, target_id, details, ip_address)
+
+def log_events(events):
+    """Log several audit events at once, each a tuple of log_event()'s arguments"""
+    audit.writer.log_many(events)
+
+def audit_search_query(text):
+    """Turn free text into an FTS5 query: every word must match (as a prefix)"""
+    terms = [t.replace('"', '""') for t in text.split()]
+    return ' '.join(f'"{t}"*' for t in terms)
+
+def get_audit_logs(limit=100, user_id=None, action_filter=None, before_id=None, since_id=None,
+                   search=None, target_type=None, target_id=None, start=None, end=None):
+    """Get audit logs newest first with optional filters
+
+    Keyset pagination: `before_id` pages back into history and `since_id`
+    returns only entries newer than one the client has already seen.
+    `search` and `action_filter` use the full-text index when available;
+    `start`/`end` bound the timestamp (UTC, 'YYYY-MM-DD[ HH:MM:SS]').
+    """
+    # Make events queued by this process visible before reading
+    if audit.writer.pending:
+        audit.writer.flush()
+    db = get_read_db()
     try:
-        query = 'SELECT * FROM audit_logs WHERE 1=1'
+        query = 'SELECT a.* FROM audit_logs a WHERE 1=1'
         params = []
+        id_col = 'a.id'
+        
+        match = []
+        if search and search.split():
+            match.append(audit_search_query(search))
+        if action_filter and database.AUDIT_FTS:
+            match.append('action : ' + audit_search_query(action_filter))
+        elif action_filter:
+            query += ' AND a.action LIKE ?'
+            params.append(f'%{action_filter}%')
+        
+        if match and database.AUDIT_FTS:
+            query = ('SELECT a.* FROM audit_logs_fts f JOIN audit_logs a ON a.id = f.rowid '
+                     'WHERE audit_logs_fts MATCH ?')
+            params.insert(0, ' AND '.join(f'({m})' for m in match))
+            # Page on the FTS rowid so the index walks ids newest first
+            id_col = 'f.rowid'
+        elif search:
+            for term in search.split():
+                query += (' AND (a.action LIKE ? OR a.details LIKE ? OR a.username LIKE ?'
+                          ' OR a.target_type LIKE ?)')
+                params.extend([f'%{term}%'] * 4)
         
         if user_id:
-            query += ' AND user_id = ?'
+            query += ' AND a.user_id = ?'
             params.append(user_id)
         
-        if action_filter:
-            query += ' AND action LIKE ?'
-            params.append(f'%{action_filter}%')
+        if target_type:
+            query += ' AND a.target_type = ?'
+            params.append(target_type)
+        
+        if target_id is not None:
+            query += ' AND a.target_id = ?'
+            params.append(target_id)
+        
+        if start:
+            query += ' AND a.timestamp >= ?'
+            params.append(start)
+        
+        if end:
+            query += ' AND a.timestamp < ?'
+            params.append(end)
+        
+        if before_id:
+            query += f' AND {id_col} < ?'
+            params.append(before_id)
         
-        query += ' ORDER BY timestamp DESC LIMIT ?'
+        if since_id:
+            query += f' AND {id_col} > ?'
+            params.append(since_id)
+        
+        query += f' ORDER BY {id_col} DESC LIMIT ?'
         params.append(limit)
         
         logs = db.execute(query, params).fetchall()
@@ -537,3 +778,17 @@ def get_audit_logs(limit=100, user_id=None, action_filter=None):
     finally:
         db.close()
 
+def iter_audit_logs(batch_size=1000, **filters):
+    """Yield every matching audit log newest first, one keyset page at a time
+
+    Each page is a separate short query, so a long export never holds a read
+    transaction open against audit writes.
+    """
+    before_id = None
+    while True:
+        page = get_audit_logs(limit=batch_size, before_id=before_id, **filters)
+        yield from page
+        if len(page) < batch_size:
+            return
+        before_id = page[-1]['id']
+
@@ -0,0 +1,243 @@
+"""
+PostgreSQL storage backend for Patient Monitoring System
+Used instead of SQLite when PMS_DATABASE_URL is set (see database.py).
+Connections come from a thread-safe pool and offer the part of the sqlite3
+connection API that models.py uses: execute/executemany/commit/close,
+sqlite3.Row-style results and lastrowid. SQLite-specific SQL is translated
+on the way in, so models.py keeps a single set of queries.
+Works on plain PostgreSQL and on TimescaleDB, where readings becomes a
+hypertable.
+"""
+
+import re
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+
+import metrics
+
+try:
+    import psycopg2
+    from psycopg2.pool import ThreadedConnectionPool
+except ImportError:  # optional dependency: pip install psycopg2-binary
+    psycopg2 = None
+
+INTEGRITY_ERRORS = (psycopg2.IntegrityError,) if psycopg2 else ()
+OPERATIONAL_ERRORS = (psycopg2.OperationalError,) if psycopg2 else ()
+PROGRAMMING_ERRORS = (psycopg2.ProgrammingError,) if psycopg2 else ()
+
+POOL_MIN = 1
+POOL_MAX = 20
+POOL_TIMEOUT = 30   # seconds to wait for a free pooled connection
+
+# ==================== SQL TRANSLATION ====================
+
+_STRING = re.compile(r"('(?:[^']|'')*')")
+_DATETIME_NOW = re.compile(r"datetime\('now'(?:\s*,\s*'([+-]?\d+ \w+)')?\)", re.I)
+_DATE_NOW = re.compile(r"date\('now'\)", re.I)
+_DATE_OF = re.compile(r"\bdate\(([\w.]+)\)", re.I)
+_HOUR_OF = re.compile(r"strftime\('%Y-%m-%d %H:00:00',\s*([\w.]+)\)", re.I)
+_ROUND_AVG = re.compile(r"ROUND\((AVG\([^()]*\)),\s*(\d+)\)", re.I)
+_INSERT_OR_IGNORE = re.compile(r"INSERT\s+OR\s+IGNORE\s+INTO", re.I)
+_LIKE = re.compile(r"\bLIKE\b", re.I)
+
+@lru_cache(maxsize=1024)
+def translate(sql):
+    """Rewrite a SQLite statement (qmark params) for PostgreSQL (format params)"""
+    sql = _DATETIME_NOW.sub(
+        lambda m: f"(LOCALTIMESTAMP + INTERVAL '{m.group(1)}')" if m.group(1) else 'LOCALTIMESTAMP', sql)
+    sql = _DATE_NOW.sub('CURRENT_DATE', sql)
+    sql = _DATE_OF.sub(r'CAST(\1 AS DATE)', sql)
+    sql = _HOUR_OF.sub(r"date_trunc('hour', \1)", sql)
+    sql = _ROUND_AVG.sub(r'ROUND(CAST(\1 AS NUMERIC), \2)', sql)
+    sql = _LIKE.sub('ILIKE', sql)   # SQLite LIKE is case-insensitive
+    if _INSERT_OR_IGNORE.search(sql):
+        sql = _INSERT_OR_IGNORE.sub('INSERT INTO', sql).rstrip().rstrip(';') + ' ON CONFLICT DO NOTHING'
+    parts = _STRING.split(sql)
+    for i, part in enumerate(parts):
+        part = part.replace('%', '%%')
+        parts[i] = part if i % 2 else part.replace('?', '%s')
+    return ''.join(parts)
+
+def _value(value):
+    # Match what sqlite3 returns for the same columns
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+# ==================== CONNECTIONS ====================
+
+class Row:
+    """Result row addressable by column name or position, like sqlite3.Row"""
+
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def keys(self):
+        return list(self._index)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._values[self._index[key]]
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+
+class PgCursor:
+    """Cursor wrapper that translates SQL and reports to metrics"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.lastrowid = None
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def execute(self, sql, parameters=()):
+        text = translate(sql)
+        kind = metrics.statement_kind(sql)
+        returning = kind == 'insert' and 'RETURNING' not in text.upper()
+        if returning:
+            text += ' RETURNING id'
+        start = time.perf_counter()
+        try:
+            self.cursor.execute(text, tuple(parameters))
+        finally:
+            metrics.record_query(kind, time.perf_counter() - start)
+        if returning:
+            row = self.cursor.fetchone()
+            self.lastrowid = row[0] if row else None
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            self.cursor.executemany(translate(sql), [tuple(p) for p in seq_of_parameters])
+        finally:
+            metrics.record_query(metrics.statement_kind(sql), time.perf_counter() - start)
+        return self
+
+    def _rows(self, raw, start):
+        metrics.record_fetch(len(raw), time.perf_counter() - start)
+        if not raw:
+            return []
+        index = {col[0]: i for i, col in enumerate(self.cursor.description)}
+        return [Row(index, tuple(_value(v) for v in r)) for r in raw]
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def fetchmany(self, size=1):
+        start = time.perf_counter()
+        return self._rows(self.cursor.fetchmany(size) if self.cursor.description else [], start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        return self._rows(self.cursor.fetchall() if self.cursor.description else [], start)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+class PgConnection:
+    """A pooled connection; close() hands it back to the pool"""
+
+    def __init__(self, backend, conn):
+        self.backend = backend
+        self.conn = conn
+        self.row_factory = None
+
+    def cursor(self):
+        return PgCursor(self.conn.cursor())
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        with self.conn.cursor() as cur:
+            cur.execute(script)
+        self.commit()
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            self.conn.commit()
+        finally:
+            metrics.record_commit(time.perf_counter() - start)
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        self.backend.release(conn)
+
+
+class PostgresBackend:
+    """Connection pool for a PostgreSQL/TimescaleDB database"""
+
+    def __init__(self, url, minconn=POOL_MIN, maxconn=POOL_MAX):
+        if psycopg2 is None:
+            raise RuntimeError('PMS_DATABASE_URL needs psycopg2 (pip install psycopg2-binary)')
+        # Session time zone UTC: LOCALTIMESTAMP/CURRENT_TIMESTAMP match SQLite's UTC timestamps
+        self.pool = ThreadedConnectionPool(minconn, maxconn, url, options='-c timezone=UTC')
+        # The pool raises when exhausted; make callers wait for a free connection instead
+        self.slots = threading.BoundedSemaphore(maxconn)
+
+    def connect(self):
+        if not self.slots.acquire(timeout=POOL_TIMEOUT):
+            raise RuntimeError('Timed out waiting for a database connection')
+        try:
+            return PgConnection(self, self.pool.getconn())
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, conn):
+        try:
+            if not conn.closed:
+                conn.rollback()   # discard anything left uncommitted
+            self.pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self.slots.release()
+
+    def init_schema(self, bed_id_start=1):
+        """Create tables (readings as a hypertable when TimescaleDB is installed)"""
+        conn = self.connect()
+        try:
+            conn.executescript((Path(__file__).parent / 'schema_postgres.sql').read_text())
+            if bed_id_start > 1:
+                conn.execute("SELECT setval(pg_get_serial_sequence('beds', 'id'), ?, false) "
+                             "WHERE NOT EXISTS (SELECT 1 FROM beds)", (bed_id_start,)).fetchall()
+                conn.commit()
+            if conn.execute("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'").fetchone():
+                conn.execute("SELECT create_hypertable('readings', 'timestamp', "
+                             "if_not_exists => TRUE, migrate_data => TRUE)").fetchall()
+                conn.commit()
+        finally:
+            conn.close()
+
+    def close(self):
+        self.pool.closeall()
@@ -0,0 +1,99 @@
+"""
+Sampling profiler for the running Patient Monitoring server
+Periodically samples the stacks of all threads and aggregates them into
+collapsed-stack ("folded") text, which flamegraph.pl, speedscope and
+similar tools render as a flame graph.
+"""
+
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 0.005   # seconds between samples
+MAX_SECONDS = 120          # upper bound for a single capture
+
+_running = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a capture is already in progress"""
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    module = os.path.basename(code.co_filename)
+    return f'{code.co_name} ({module}:{frame.f_lineno})'
+
+
+def capture(seconds, interval=DEFAULT_INTERVAL):
+    """
+    Sample all threads (except the profiler's own) for `seconds`
+    Returns collapsed stacks: one 'root;caller;callee count' line per stack
+    """
+    seconds = max(0.1, min(float(seconds), MAX_SECONDS))
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy('A profile capture is already running')
+    try:
+        own = threading.get_ident()
+        names = {}
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                parts = []
+                while frame is not None:
+                    parts.append(_frame_label(frame))
+                    frame = frame.f_back
+                parts.append(names.get(ident, f'thread-{ident}'))
+                stacks[';'.join(reversed(parts))] += 1
+            time.sleep(interval)
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+    finally:
+        _running.release()
+
+
+def capture_to_file(seconds, directory='.', interval=DEFAULT_INTERVAL):
+    """Capture a profile and write it to a timestamped .folded file"""
+    path = os.path.join(
+        directory, f'profile-{os.getpid()}-{datetime.now().strftime("%Y%m%d-%H%M%S")}.folded'
+    )
+    folded = capture(seconds, interval)
+    with open(path, 'w') as f:
+        f.write(folded)
+    logger.warning(f'Profile written to {path}')
+    return path
+
+
+def install_signal_handler(seconds=30, directory='.', signum=None):
+    """
+    Capture a profile in the background whenever the process gets SIGUSR1
+    Returns False where signals are unavailable (Windows, non-main thread)
+    """
+    signum = signum or getattr(signal, 'SIGUSR1', None)
+    if signum is None:
+        return False
+
+    def handler(_signum, _frame):
+        def run():
+            try:
+                capture_to_file(seconds, directory)
+            except ProfilerBusy:
+                logger.warning('Profile requested while another capture is running')
+        threading.Thread(target=run, name='profiler', daemon=True).start()
+
+    try:
+        signal.signal(signum, handler)
+    except ValueError:
+        return False
+    return True
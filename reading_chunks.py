@@ -0,0 +1,226 @@
+"""
+Compressed storage of sealed sensor readings
+Once an hour has closed, each bed's readings for that hour are packed into
+one reading_chunks row: ids and timestamps delta-encoded, values as scaled
+integer deltas where that is exact, all zlib-compressed. Per-chunk
+temperature sums keep windowed averages cheap without decoding. The open
+hour, late samples and each bed's latest reading stay in `readings`.
+
+Seal from a background thread (PMS_READING_CHUNKS=1 in server.py) or once:
+    python reading_chunks.py
+"""
+
+import calendar
+import heapq
+import json
+import logging
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import database
+from database import get_db
+
+SEAL_DELAY = 600       # seconds after an hour closes before it is sealed (late samples)
+SEAL_INTERVAL = 300    # seconds between background sealing passes
+SCALES = (1, 10, 100, 1000)   # decimal scalings tried for exact integer encoding
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+VALUE_COLUMNS = ('temperature', 'humidity', 'motion', 'distance_cm')
+
+logger = logging.getLogger(__name__)
+
+# ==================== ENCODING ====================
+
+def _deltas(values):
+    out, previous = [], 0
+    for value in values:
+        out.append(value - previous)
+        previous = value
+    return out
+
+def _undelta(deltas):
+    out, total = [], 0
+    for delta in deltas:
+        total += delta
+        out.append(total)
+    return out
+
+def _encode_values(values):
+    # Scaled integer deltas when exact (e.g. 23.4 -> 234), else the raw list
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        for scale in SCALES:
+            scaled = [round(v * scale) for v in values]
+            if all(s / scale == v for s, v in zip(scaled, values)):
+                return {'scale': scale, 'd': _deltas(scaled)}
+    return values
+
+def _decode_values(encoded):
+    if isinstance(encoded, list):
+        return encoded
+    scale = encoded['scale']
+    values = _undelta(encoded['d'])
+    return values if scale == 1 else [v / scale for v in values]
+
+def _encode_times(values):
+    try:
+        seconds = [calendar.timegm(time.strptime(v, TIME_FORMAT)) for v in values]
+    except (TypeError, ValueError):
+        return values
+    return {'epoch': _deltas(seconds)}
+
+def _decode_times(encoded):
+    if isinstance(encoded, list):
+        return encoded
+    return [time.strftime(TIME_FORMAT, time.gmtime(t)) for t in _undelta(encoded['epoch'])]
+
+def encode(rows):
+    """Pack (id, timestamp, temperature, humidity, motion, distance_cm) rows into a blob"""
+    columns = list(zip(*rows))
+    doc = {'id': _deltas(columns[0]), 'timestamp': _encode_times(columns[1])}
+    for name, values in zip(VALUE_COLUMNS, columns[2:]):
+        doc[name] = _encode_values(values)
+    return zlib.compress(json.dumps(doc, separators=(',', ':')).encode(), 6)
+
+def decode(blob, bed_id):
+    """Unpack a chunk into reading dicts (same keys as SELECT * FROM readings)"""
+    doc = json.loads(zlib.decompress(bytes(blob)))
+    ids = _undelta(doc['id'])
+    timestamps = _decode_times(doc['timestamp'])
+    values = [_decode_values(doc[name]) for name in VALUE_COLUMNS]
+    return [
+        {'id': ids[i], 'bed_id': bed_id, 'timestamp': timestamps[i],
+         'temperature': values[0][i], 'humidity': values[1][i],
+         'motion': values[2][i], 'distance_cm': values[3][i]}
+        for i in range(len(ids))
+    ]
+
+# ==================== READING ====================
+
+def read_readings(db, bed_id, since, limit=None):
+    """
+    Sealed readings of a bed at or after `since` ('YYYY-MM-DD HH:MM:SS'),
+    newest first; with `limit`, stops decoding once older chunks can't matter
+    """
+    rows = []
+    chunks = db.execute('''
+        SELECT start_time, end_time, data FROM reading_chunks
+        WHERE bed_id = ? AND end_time >= ?
+        ORDER BY end_time DESC
+    ''', (bed_id, since))
+    for chunk in chunks:
+        if limit and len(rows) >= limit and chunk['end_time'] < rows[limit - 1]['timestamp']:
+            break
+        rows.extend(r for r in decode(chunk['data'], bed_id) if r['timestamp'] >= since)
+        rows.sort(key=lambda r: (r['timestamp'], r['id']), reverse=True)
+    return rows[:limit] if limit else rows
+
+def iter_sealed_readings(bed_id, start, end):
+    """
+    Sealed readings of a bed with start <= timestamp < end in (timestamp, id)
+    order, decoding one chunk at a time
+    """
+    db = database.get_read_db()
+    try:
+        chunks = db.execute('''
+            SELECT id, start_time FROM reading_chunks
+            WHERE bed_id = ? AND end_time >= ? AND start_time < ?
+            ORDER BY start_time, id
+        ''', (bed_id, start, end)).fetchall()
+    finally:
+        db.close()
+    pending = []   # heap of decoded rows; chunks of late samples may overlap
+    for chunk in chunks:
+        while pending and pending[0][0] < chunk['start_time']:
+            yield heapq.heappop(pending)[2]
+        db = database.get_read_db()
+        try:
+            data = db.execute('SELECT data FROM reading_chunks WHERE id = ?', (chunk['id'],)).fetchone()
+        finally:
+            db.close()
+        if data is None:   # bed deleted meanwhile
+            continue
+        for row in decode(data['data'], bed_id):
+            if start <= row['timestamp'] < end:
+                heapq.heappush(pending, (row['timestamp'], row['id'], row))
+    while pending:
+        yield heapq.heappop(pending)[2]
+
+def temperature_sums_sql(since):
+    """
+    Subquery of (bed_id, temp_sum, temp_count) over live and sealed readings
+    since the SQL expression `since`; sealed hours are counted whole
+    """
+    return f'''
+        SELECT bed_id, SUM(temperature) AS temp_sum, COUNT(temperature) AS temp_count
+        FROM readings WHERE timestamp >= {since} GROUP BY bed_id
+        UNION ALL
+        SELECT bed_id, temp_sum, temp_count FROM reading_chunks WHERE end_time >= {since}
+    '''
+
+# ==================== SEALING ====================
+
+def seal_readings(now=None):
+    """Seal every closed hour older than SEAL_DELAY; returns the number of chunks written"""
+    if database.DATABASE_URL:
+        raise RuntimeError('Chunked readings are SQLite-only (use TimescaleDB compression instead)')
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    boundary = (now - timedelta(seconds=SEAL_DELAY)).strftime('%Y-%m-%d %H:00:00')
+    written = 0
+    db = get_db()
+    try:
+        windows = db.execute('''
+            SELECT bed_id, substr(timestamp, 1, 13) AS hour FROM readings
+            WHERE timestamp < ? GROUP BY bed_id, hour
+        ''', (boundary,)).fetchall()
+        for window in windows:
+            start = window['hour'] + ':00:00'
+            end = (datetime.strptime(start, TIME_FORMAT) + timedelta(hours=1)).strftime(TIME_FORMAT)
+            # One short write transaction per chunk so ingest is never held up for long
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                # Each bed's latest reading stays live for the dashboards
+                bed_id = int(window['bed_id'])
+                latest = db.execute(f'SELECT {database.latest_reading_id(db, str(bed_id))}').fetchone()[0]
+                where = 'bed_id = ? AND timestamp >= ? AND timestamp < ? AND id IS NOT ?'
+                params = (bed_id, start, end, latest)
+                rows = db.execute(f'''
+                    SELECT id, timestamp, temperature, humidity, motion, distance_cm FROM readings
+                    WHERE {where} ORDER BY timestamp, id
+                ''', params).fetchall()
+                if rows:
+                    temps = [r['temperature'] for r in rows if r['temperature'] is not None]
+                    db.execute('''
+                        INSERT INTO reading_chunks (bed_id, start_time, end_time, count, temp_sum, temp_count, data)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (bed_id, rows[0]['timestamp'], rows[-1]['timestamp'], len(rows),
+                          sum(temps) if temps else None, len(temps), encode([tuple(r) for r in rows])))
+                    db.execute(f'DELETE FROM readings WHERE {where}', params)
+                    written += 1
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        return written
+    finally:
+        db.close()
+
+def start_sealer(interval=SEAL_INTERVAL):
+    """Seal closed hours every `interval` seconds from a daemon thread"""
+    def run():
+        while True:
+            try:
+                written = seal_readings()
+                if written:
+                    logger.info(f'Sealed {written} reading chunks')
+            except Exception:
+                logger.exception('Sealing readings failed')
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='reading-sealer', daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == '__main__':
+    print(f"Sealed {seal_readings()} reading chunks")
@@ -0,0 +1,278 @@
+"""
+Declarative alert rules for Patient Monitoring System
+Each rule names its alert type, severity, condition and message, plus the
+features it reads (values derived from the sample and per-bed history), an
+optional cooldown and the phase it runs in. The rules are compiled once into
+a Plan: per phase, the features the rules need, each computed once per
+sample and shared by every rule that reads it, then the rules in order.
+Thresholds come from the bed's compiled row (thresholds.py), so rules add
+no database query or settings lookup. Messages are only formatted for rules
+that fire.
+
+The same plan drives live ingest (behavior_detection.detector) and replays
+of stored readings, e.g. to try threshold changes against history:
+    python rules.py --beds 1,2 --start 2026-01-01 --end 2026-01-08
+"""
+
+import argparse
+import textwrap
+from datetime import datetime, timezone
+
+import thresholds
+
+READING = 'reading'     # every reading as it arrives (range checks)
+BEHAVIOR = 'behavior'   # per bed in event-time order (see behavior_detection.EventTimeOrderer)
+
+FALL_DISTANCE_CM = 20          # a fall ends this close to the sensor
+NIGHT_PERIOD_SECONDS = 28800   # restlessness is counted over at most 8 hours
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class BedState:
+    """History the rules keep per bed"""
+
+    __slots__ = ('last_distance', 'last_motion_time', 'night_start', 'motion_count_night', 'fired_at')
+
+    def __init__(self):
+        self.last_distance = None
+        self.last_motion_time = None
+        self.night_start = None
+        self.motion_count_night = 0
+        self.fired_at = {}    # alert_type -> last time it fired (for cooldowns)
+
+# ==================== FEATURES ====================
+# Rule conditions and messages are Python expressions over the sample
+# (bed_id, temperature, humidity, motion, distance_cm, now), the bed's
+# threshold row `limits` (indexed with the thresholds.py slot constants)
+# and the variables set by the features they use. A feature's `compute`
+# reads the bed's `state` as it was before this sample; its `commit` saves
+# what the next sample needs once every rule has run.
+
+class Feature:
+    """Values derived once per sample; `history` if they need earlier samples of the bed"""
+
+    def __init__(self, name, compute, commit=None, history=False):
+        self.name = name
+        self.compute = compute
+        self.commit = commit
+        self.history = history
+
+FEATURES = [
+    Feature('distance_drop', history=True, compute='''
+        last_distance = state.last_distance
+        distance_drop = (last_distance - distance_cm
+                         if last_distance is not None and last_distance > 0 and distance_cm > 0 else None)
+    ''', commit='''
+        if distance_cm > 0:
+            state.last_distance = distance_cm
+    '''),
+    Feature('inactivity', history=True, compute='''
+        last_motion_time = state.last_motion_time
+        inactive_minutes = ((now - last_motion_time).total_seconds() / 60
+                            if motion != 1 and last_motion_time is not None else None)
+    ''', commit='''
+        if motion == 1:
+            state.last_motion_time = now
+    '''),
+    # Motions counted during the night window (bounds in minutes after midnight; may wrap)
+    Feature('night', history=True, compute='''
+        minutes = now.hour * 60 + now.minute
+        start, end = limits[RESTLESSNESS_START], limits[RESTLESSNESS_END]
+        if (start <= minutes < end) if start < end else (minutes >= start or minutes < end):
+            night_start, night_count = state.night_start, state.motion_count_night
+            if night_start is None or (now - night_start).total_seconds() > NIGHT_PERIOD_SECONDS:
+                night_start, night_count = now, 0
+            if motion == 1:
+                night_count += 1
+            night_hours = (now - night_start).total_seconds() / 3600
+            motion_rate = night_count / night_hours if night_hours > 0 else None
+        else:
+            night_start, night_count, night_hours, motion_rate = None, 0, 0.0, None
+    ''', commit='''
+        state.night_start, state.motion_count_night = night_start, night_count
+    '''),
+]
+
+# ==================== RULES ====================
+
+class Rule:
+    """
+    An alert rule: fires `alert_type` when the expression `when` is true, at
+    most once per `cooldown` seconds per bed. `message` is the body of an
+    f-string, only formatted when the rule fires.
+    """
+
+    def __init__(self, alert_type, severity, when, message, uses=(), cooldown=None, phase=BEHAVIOR):
+        self.alert_type = alert_type
+        self.severity = severity
+        self.when = when
+        self.message = message
+        self.uses = tuple(uses)
+        self.cooldown = cooldown
+        self.phase = phase
+
+RULES = [
+    Rule('temp_out_of_range', 'warning', phase=READING,
+         when='temperature < limits[TEMP_MIN] or temperature > limits[TEMP_MAX]',
+         message='Temperature {temperature:.1f}°C is outside safe range ({limits[TEMP_MIN]}-{limits[TEMP_MAX]}°C)'),
+    Rule('humidity_out_of_range', 'warning', phase=READING,
+         when='humidity < limits[HUMIDITY_MIN] or humidity > limits[HUMIDITY_MAX]',
+         message='Humidity {humidity:.1f}% is outside safe range ({limits[HUMIDITY_MIN]}-{limits[HUMIDITY_MAX]}%)'),
+    # Patient trying to get off bed (distance + motion)
+    Rule('bed_exit', 'critical',
+         when='motion == 1 and distance_cm > limits[DISTANCE_BED_EXIT_CM]',
+         message='Patient attempting to get off bed: Motion detected with distance {distance_cm:.1f}cm'),
+    # Sudden large drop in distance, ending close to the sensor
+    Rule('possible_fall', 'critical', uses=('distance_drop',),
+         when='distance_drop is not None and distance_drop > limits[FALL_DROP_THRESHOLD_CM] '
+              'and distance_cm < FALL_DISTANCE_CM',
+         message='Possible fall detected: Distance dropped from {last_distance:.1f}cm to {distance_cm:.1f}cm '
+                 '(drop: {distance_drop:.1f}cm)'),
+    Rule('long_inactivity', 'warning', uses=('inactivity',), cooldown=300,
+         when='inactive_minutes is not None and inactive_minutes > limits[NO_MOTION_TIMEOUT_MINUTES]',
+         message='No motion detected for {inactive_minutes:.1f} minutes '
+                 '(threshold: {limits[NO_MOTION_TIMEOUT_MINUTES]} min)'),
+    # Frequent motion during the configured night window
+    Rule('restlessness_night', 'warning', uses=('night',),
+         when='motion_rate is not None and motion_rate > limits[RESTLESSNESS_MOTIONS_PER_HOUR]',
+         message='Restlessness detected: {night_count} motions in {night_hours:.1f} hours '
+                 '(rate: {motion_rate:.1f}/hr, threshold: {limits[RESTLESSNESS_MOTIONS_PER_HOUR]}/hr)'),
+    # Dangerous room humidity (breathing issues)
+    Rule('low_humidity_danger', 'warning',
+         when='humidity < limits[LOW_HUMIDITY_DANGER]',
+         message='Dangerously low humidity: {humidity:.1f}% - May cause breathing discomfort '
+                 '(threshold: {limits[LOW_HUMIDITY_DANGER]}%)'),
+    Rule('high_humidity_danger', 'warning',
+         when='humidity > limits[HIGH_HUMIDITY_DANGER]',
+         message='Dangerously high humidity: {humidity:.1f}% - May cause breathing issues '
+                 '(threshold: {limits[HIGH_HUMIDITY_DANGER]}%)'),
+]
+
+# ==================== COMPILATION ====================
+
+# Names the generated code can use besides the sample and feature variables
+NAMESPACE = {name: value for name, value in vars(thresholds).items() if name.isupper() and isinstance(value, int)}
+NAMESPACE.update(FALL_DISTANCE_CM=FALL_DISTANCE_CM, NIGHT_PERIOD_SECONDS=NIGHT_PERIOD_SECONDS)
+
+def _block(code, indent='    '):
+    return textwrap.indent(textwrap.dedent(code).strip('\n'), indent) + '\n'
+
+def _source(rules, features):
+    """One function evaluating `rules`: each used feature computed once, then every rule in order"""
+    used = {name for rule in rules for name in rule.uses}
+    features = [f for f in features if f.name in used]
+    code = 'def evaluate(bed_id, temperature, humidity, motion, distance_cm, now, limits, state):\n'
+    code += '    fired = []\n'
+    for feature in features:
+        code += _block(feature.compute)
+    for rule in rules:
+        fire = f"fired.append(({rule.alert_type!r}, f{rule.message!r}, {rule.severity!r}))"
+        code += f'    if {rule.when}:\n'
+        if rule.cooldown is None:
+            code += f'        {fire}\n'
+        else:
+            code += (f'        last = state.fired_at.get({rule.alert_type!r})\n'
+                     f'        if last is None or (now - last).total_seconds() > {rule.cooldown!r}:\n'
+                     f'            state.fired_at[{rule.alert_type!r}] = now\n'
+                     f'            {fire}\n')
+    for feature in features:
+        if feature.commit:
+            code += _block(feature.commit)
+    return code + '    return fired\n'
+
+
+class Plan:
+    """
+    The rules compiled into one Python function per phase. Samples without
+    per-bed history (late arrivals) get a second function with only the
+    rules that need none.
+    """
+
+    def __init__(self, rules=RULES, features=FEATURES):
+        by_name = {f.name: f for f in features}
+        for rule in rules:
+            unknown = [name for name in rule.uses if name not in by_name]
+            if unknown:
+                raise ValueError(f'Rule {rule.alert_type} uses unknown features: {unknown}')
+        self.source = {}
+        self.functions = {}
+        for phase in (READING, BEHAVIOR):
+            selected = [r for r in rules if r.phase == phase]
+            stateless = [r for r in selected
+                         if r.cooldown is None and not any(by_name[n].history for n in r.uses)]
+            for history, chosen in ((True, selected), (False, stateless)):
+                source = _source(chosen, features)
+                namespace = dict(NAMESPACE)
+                exec(compile(source, f'<rules {phase}>', 'exec'), namespace)
+                self.source[phase, history] = source
+                self.functions[phase, history] = namespace['evaluate']
+
+
+class Detector:
+    """Runs a plan over samples, keeping per-bed history (one for live ingest, a fresh one per replay)"""
+
+    def __init__(self, plan=None):
+        self.plan = plan or PLAN
+        self.states = {}
+
+    def evaluate(self, phase, bed_id, temperature, humidity, motion, distance_cm,
+                 event_time=None, update_state=True):
+        """
+        [(alert_type, message, severity)] fired by the `phase` rules for one sample
+        With `update_state=False` only rules that need no history run and
+        the bed's state is left alone.
+        """
+        state = None
+        if update_state:
+            state = self.states.get(bed_id)
+            if state is None:
+                state = self.states[bed_id] = BedState()
+        return self.plan.functions[phase, update_state](
+            bed_id, temperature, humidity, motion, distance_cm, event_time or datetime.now(),
+            thresholds.for_bed(bed_id), state)
+
+PLAN = Plan()
+
+# ==================== REPLAY ====================
+
+def _local_time(timestamp):
+    """Stored UTC 'YYYY-MM-DD HH:MM:SS' to the naive local time the detector uses"""
+    utc = datetime.strptime(timestamp[:19], TIME_FORMAT).replace(tzinfo=timezone.utc)
+    return utc.astimezone().replace(tzinfo=None)
+
+def replay(readings, plan=None):
+    """
+    Run the rules over stored readings (each bed's in time order) as live
+    ingest would have; yields (bed_id, timestamp, alert_type, message, severity).
+    Nothing is written: alerts are only reported.
+    """
+    detector = Detector(plan)
+    for r in readings:
+        if None in (r['temperature'], r['humidity'], r['motion'], r['distance_cm']):
+            continue
+        event_time = _local_time(r['timestamp'])
+        for phase in (READING, BEHAVIOR):
+            for alert_type, message, severity in detector.evaluate(
+                    phase, r['bed_id'], r['temperature'], r['humidity'], r['motion'], r['distance_cm'],
+                    event_time=event_time):
+                yield r['bed_id'], r['timestamp'], alert_type, message, severity
+
+def main():
+    import models
+    parser = argparse.ArgumentParser(description='Replay stored readings through the alert rules')
+    parser.add_argument('--beds', help='comma-separated bed ids (default: all beds)')
+    parser.add_argument('--start', help="first timestamp, UTC 'YYYY-MM-DD[ HH:MM:SS]'")
+    parser.add_argument('--end', help='end timestamp (exclusive)')
+    args = parser.parse_args()
+    bed_ids = ([int(b) for b in args.beds.split(',')] if args.beds
+               else [b['id'] for b in models.list_beds()])
+    counts = {}
+    for bed_id, timestamp, alert_type, message, severity in replay(
+            models.iter_readings(bed_ids, args.start, args.end)):
+        print(f"{timestamp}  bed {bed_id}  {severity:<8} {alert_type}: {message}")
+        counts[alert_type] = counts.get(alert_type, 0) + 1
+    print(', '.join(f'{t}: {n}' for t, n in sorted(counts.items())) or 'No alerts')
+
+if __name__ == '__main__':
+    main()
@@ -16,42 +16,38 @@ CREATE TABLE IF NOT EXISTS users (
 CREATE TABLE IF NOT EXISTS beds (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     bed_name TEXT NOT NULL,
-    room_no TEXT
+    room_no TEXT,
+    threshold_profile_id INTEGER REFERENCES threshold_profiles(id)
 );
 
-CREATE TABLE IF NOT EXISTS nurse_assignments (
+-- Per-bed threshold overrides (see thresholds.py): a bed's profile, then its own values,
+-- take precedence over the global settings
+CREATE TABLE IF NOT EXISTS threshold_profiles (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nurse_id INTEGER NOT NULL REFERENCES users(id),
-    bed_id INTEGER NOT NULL REFERENCES beds(id),
-    UNIQUE(nurse_id, bed_id)
+    name TEXT UNIQUE NOT NULL
 );
 
-CREATE TABLE IF NOT EXISTS readings (
+CREATE TABLE IF NOT EXISTS profile_thresholds (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    bed_id INTEGER NOT NULL REFERENCES beds(id),
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-    temperature REAL,
-    humidity REAL,
-    motion INTEGER,
-    distance_cm REAL
+    profile_id INTEGER NOT NULL REFERENCES threshold_profiles(id),
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    UNIQUE(profile_id, key)
 );
 
-CREATE TABLE IF NOT EXISTS alerts (
+CREATE TABLE IF NOT EXISTS bed_thresholds (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     bed_id INTEGER NOT NULL REFERENCES beds(id),
-    alert_type TEXT NOT NULL,
-    message TEXT NOT NULL,
-    status TEXT NOT NULL DEFAULT 'new',
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    resolved_at DATETIME
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    UNIQUE(bed_id, key)
 );
 
-CREATE TABLE IF NOT EXISTS devices (
+CREATE TABLE IF NOT EXISTS nurse_assignments (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    esp_id TEXT UNIQUE,
-    ip TEXT,
-    last_seen DATETIME,
-    status TEXT
+    nurse_id INTEGER NOT NULL REFERENCES users(id),
+    bed_id INTEGER NOT NULL REFERENCES beds(id),
+    UNIQUE(nurse_id, bed_id)
 );
 
 CREATE TABLE IF NOT EXISTS settings (
@@ -72,13 +68,30 @@ CREATE TABLE IF NOT EXISTS audit_logs (
     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Background jobs for heavy admin operations (see jobs.py)
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    stage INTEGER NOT NULL DEFAULT 0,
+    progress INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    error TEXT,
+    created_by INTEGER,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    heartbeat DATETIME,
+    finished_at DATETIME
+);
+
 -- Create indexes for better performance
-CREATE INDEX IF NOT EXISTS idx_readings_bed_timestamp ON readings(bed_id, timestamp);
-CREATE INDEX IF NOT EXISTS idx_alerts_bed_status ON alerts(bed_id, status);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id);
 CREATE INDEX IF NOT EXISTS idx_nurse_assignments_nurse ON nurse_assignments(nurse_id);
 CREATE INDEX IF NOT EXISTS idx_nurse_assignments_bed ON nurse_assignments(bed_id);
 CREATE INDEX IF NOT EXISTS idx_audit_logs_timestamp ON audit_logs(timestamp DESC);
 CREATE INDEX IF NOT EXISTS idx_audit_logs_user ON audit_logs(user_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_user_id ON audit_logs(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_target ON audit_logs(target_type, target_id, id);
 
 -- Insert default settings
 INSERT OR IGNORE INTO settings (key, value) VALUES 
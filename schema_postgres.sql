@@ -0,0 +1,176 @@
+-- Patient Room Environmental & Activity Monitoring System Database Schema
+-- PostgreSQL / TimescaleDB version of schema.sql + telemetry.sql
+-- Timestamps are UTC (the backend sets the session time zone to UTC)
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    role TEXT NOT NULL CHECK(role IN ('admin', 'nurse')),
+    menu_permissions TEXT,
+    status TEXT NOT NULL DEFAULT 'active',
+    failed_login_attempts INTEGER DEFAULT 0,
+    locked_at TIMESTAMP,
+    last_login_attempt TIMESTAMP,
+    created_at TIMESTAMP DEFAULT LOCALTIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS beds (
+    id SERIAL PRIMARY KEY,
+    bed_name TEXT NOT NULL,
+    room_no TEXT
+);
+
+-- Per-bed threshold overrides (see thresholds.py): a bed's profile, then its own values,
+-- take precedence over the global settings
+CREATE TABLE IF NOT EXISTS threshold_profiles (
+    id SERIAL PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS profile_thresholds (
+    id SERIAL PRIMARY KEY,
+    profile_id INTEGER NOT NULL REFERENCES threshold_profiles(id),
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    UNIQUE(profile_id, key)
+);
+
+CREATE TABLE IF NOT EXISTS bed_thresholds (
+    id SERIAL PRIMARY KEY,
+    bed_id INTEGER NOT NULL REFERENCES beds(id),
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    UNIQUE(bed_id, key)
+);
+
+ALTER TABLE beds ADD COLUMN IF NOT EXISTS threshold_profile_id INTEGER REFERENCES threshold_profiles(id);
+
+CREATE TABLE IF NOT EXISTS nurse_assignments (
+    id SERIAL PRIMARY KEY,
+    nurse_id INTEGER NOT NULL REFERENCES users(id),
+    bed_id INTEGER NOT NULL REFERENCES beds(id),
+    UNIQUE(nurse_id, bed_id)
+);
+
+-- Primary key includes the time column so TimescaleDB can partition it
+CREATE TABLE IF NOT EXISTS readings (
+    id BIGSERIAL,
+    bed_id INTEGER NOT NULL,
+    timestamp TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP,
+    temperature REAL,
+    humidity REAL,
+    motion INTEGER,
+    distance_cm REAL,
+    PRIMARY KEY (id, timestamp)
+);
+
+-- Only used by SQLite (reading_chunks.py); kept so queries work on both backends
+CREATE TABLE IF NOT EXISTS reading_chunks (
+    id SERIAL PRIMARY KEY,
+    bed_id INTEGER NOT NULL,
+    start_time TIMESTAMP NOT NULL,
+    end_time TIMESTAMP NOT NULL,
+    count INTEGER NOT NULL,
+    temp_sum DOUBLE PRECISION,
+    temp_count INTEGER NOT NULL DEFAULT 0,
+    data BYTEA NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS alerts (
+    id SERIAL PRIMARY KEY,
+    bed_id INTEGER NOT NULL,
+    alert_type TEXT NOT NULL,
+    category TEXT,
+    message TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'new',
+    created_at TIMESTAMP DEFAULT LOCALTIMESTAMP,
+    resolved_at TIMESTAMP
+);
+
+-- Added after the first release: upgrade existing databases
+ALTER TABLE alerts ADD COLUMN IF NOT EXISTS category TEXT;
+
+-- Alerts per creation hour, bed, type and current status (see alert_counters.py)
+CREATE TABLE IF NOT EXISTS alert_counters (
+    id SERIAL PRIMARY KEY,
+    hour TIMESTAMP NOT NULL,
+    bed_id INTEGER NOT NULL,
+    alert_type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    status TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    UNIQUE(hour, bed_id, alert_type, status)
+);
+
+CREATE TABLE IF NOT EXISTS devices (
+    id SERIAL PRIMARY KEY,
+    esp_id TEXT UNIQUE,
+    ip TEXT,
+    last_seen TIMESTAMP,
+    status TEXT
+);
+
+CREATE TABLE IF NOT EXISTS settings (
+    id SERIAL PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS audit_logs (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    username TEXT NOT NULL,
+    action TEXT NOT NULL,
+    target_type TEXT,
+    target_id INTEGER,
+    details TEXT,
+    ip_address TEXT,
+    timestamp TIMESTAMP DEFAULT LOCALTIMESTAMP
+);
+
+-- Background jobs for heavy admin operations (see jobs.py)
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    stage INTEGER NOT NULL DEFAULT 0,
+    progress INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    error TEXT,
+    created_by INTEGER,
+    created_at TIMESTAMP DEFAULT LOCALTIMESTAMP,
+    heartbeat TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Create indexes for better performance
+CREATE INDEX IF NOT EXISTS idx_readings_bed_timestamp ON readings(bed_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_reading_chunks_bed_end ON reading_chunks(bed_id, end_time);
+CREATE INDEX IF NOT EXISTS idx_alerts_bed_status ON alerts(bed_id, status);
+CREATE INDEX IF NOT EXISTS idx_alerts_status_id ON alerts(status, id);
+CREATE INDEX IF NOT EXISTS idx_alert_counters_category ON alert_counters(category, hour);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id);
+CREATE INDEX IF NOT EXISTS idx_nurse_assignments_nurse ON nurse_assignments(nurse_id);
+CREATE INDEX IF NOT EXISTS idx_nurse_assignments_bed ON nurse_assignments(bed_id);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_timestamp ON audit_logs(timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_user ON audit_logs(user_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_user_id ON audit_logs(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_target ON audit_logs(target_type, target_id, id);
+
+-- Insert default settings
+INSERT INTO settings (key, value) VALUES
+    ('temp_min', '18.0'),
+    ('temp_max', '24.0'),
+    ('humidity_min', '40.0'),
+    ('humidity_max', '60.0'),
+    ('distance_bed_exit_cm', '50.0'),
+    ('no_motion_timeout_minutes', '30'),
+    ('fall_drop_threshold_cm', '30.0'),
+    ('restlessness_motions_per_hour', '20.0'),
+    ('restlessness_start_time', '22:00'),
+    ('restlessness_end_time', '06:00'),
+    ('low_humidity_danger', '30.0'),
+    ('high_humidity_danger', '70.0')
+ON CONFLICT (key) DO NOTHING;
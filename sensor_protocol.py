@@ -0,0 +1,125 @@
+"""
+Compact binary sensor protocol for Patient Monitoring System
+Fixed-layout little-endian datagram sent by ESP8266 nodes over UDP
+
+Layout (21 bytes):
+    offset  size  field
+    0       2     magic 'PM'
+    2       1     protocol version (1)
+    3       1     flags (bit 0: first packet after boot)
+    4       2     bed_id          uint16
+    6       4     esp_id hash     uint32 (FNV-1a of the esp_id string)
+    10      4     sequence number uint32 (wraps)
+    14      2     temperature     int16, 0.01 degC
+    16      2     humidity        uint16, 0.01 %
+    18      2     distance        int16, 0.1 cm (negative = invalid)
+    20      1     motion          uint8 (0/1)
+"""
+
+import struct
+
+MAGIC = b'PM'
+VERSION = 1
+FLAG_BOOT = 0x01
+
+PACKET = struct.Struct('<2sBBHIIhHhB')
+PACKET_SIZE = PACKET.size
+
+SEQ_MOD = 1 << 32
+
+
+class ProtocolError(ValueError):
+    """Raised when a datagram cannot be decoded"""
+
+
+def esp_id_hash(esp_id):
+    """32-bit FNV-1a hash of a device identifier (matches the firmware)"""
+    h = 0x811c9dc5
+    for b in str(esp_id).encode():
+        h ^= b
+        h = (h * 0x01000193) & 0xffffffff
+    return h
+
+
+def encode_reading(bed_id, esp_id, seq, temperature, humidity, motion, distance_cm, flags=0):
+    """Pack a reading into a datagram"""
+    return PACKET.pack(
+        MAGIC, VERSION, flags,
+        int(bed_id),
+        esp_id if isinstance(esp_id, int) else esp_id_hash(esp_id),
+        int(seq) % SEQ_MOD,
+        int(round(temperature * 100)),
+        int(round(humidity * 100)),
+        int(round(distance_cm * 10)),
+        1 if motion else 0,
+    )
+
+
+def decode_reading(datagram):
+    """
+    Unpack a datagram
+    Returns dict with bed_id, esp_hash, seq, flags and sensor values
+    """
+    if len(datagram) != PACKET_SIZE:
+        raise ProtocolError(f'Bad datagram size: {len(datagram)}')
+    magic, version, flags, bed_id, esp_hash, seq, temp, hum, dist, motion = PACKET.unpack(datagram)
+    if magic != MAGIC:
+        raise ProtocolError('Bad magic')
+    if version != VERSION:
+        raise ProtocolError(f'Unsupported protocol version: {version}')
+    return {
+        'bed_id': bed_id,
+        'esp_hash': esp_hash,
+        'seq': seq,
+        'flags': flags,
+        'temperature': temp / 100.0,
+        'humidity': hum / 100.0,
+        'motion': motion,
+        'distance_cm': dist / 10.0 if dist >= 0 else -1.0,
+    }
+
+
+class SequenceTracker:
+    """Tracks per-device sequence numbers to report datagram loss"""
+
+    def __init__(self):
+        self.devices = {}
+
+    def observe(self, device, seq, reboot=False):
+        """
+        Record a sequence number for a device
+        Returns number of datagrams lost since the previous one (0 if none)
+        """
+        stats = self.devices.get(device)
+        if stats is None or reboot:
+            if stats is None:
+                stats = {'last_seq': seq, 'received': 0, 'lost': 0, 'late': 0}
+                self.devices[device] = stats
+            stats['last_seq'] = seq
+            stats['received'] += 1
+            return 0
+
+        stats['received'] += 1
+        diff = (seq - stats['last_seq']) % SEQ_MOD
+        if diff == 0 or diff >= SEQ_MOD // 2:
+            # Duplicate or arrived after a newer datagram
+            stats['late'] += 1
+            if stats['lost'] > 0 and diff != 0:
+                stats['lost'] -= 1
+            return 0
+
+        stats['last_seq'] = seq
+        gap = diff - 1
+        stats['lost'] += gap
+        return gap
+
+    def snapshot(self):
+        """Per-device counters plus totals"""
+        received = sum(s['received'] for s in self.devices.values())
+        lost = sum(s['lost'] for s in self.devices.values())
+        return {
+            'devices': len(self.devices),
+            'received': received,
+            'lost': lost,
+            'loss_ratio': round(lost / (received + lost), 6) if received + lost else 0.0,
+        }
@@ -2,14 +2,28 @@
 Flask server for Patient Room Environmental & Activity Monitoring System
 """
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, Response, g
 from functools import wraps
 from datetime import datetime
+import csv
+import io
 import json
+import os
 
-from database import init_db, get_db
+from database import init_db, get_db, get_read_db, get_snapshot_db
+import database
 import models
-import behavior_detection
+import admission
+import alert_counters
+import audit
+import aggregator
+import export
+import ingest
+import jobs
+import metrics
+import profiler
+import reading_chunks
+import thresholds
 import logging
 
 app = Flask(__name__)
@@ -18,10 +32,111 @@ app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['PERMANENT_SESSION_LIFETIME'] = 1800  # 30 minutes in seconds
 
+MAX_PAGE_SIZE = 500  # largest page for keyset-paginated list APIs
+MAX_BULK_IDS = jobs.BATCH_SIZE   # most alert ids accepted by one bulk resolve request
+
+# Audit events are committed in batches at most this many seconds apart (0 = per event)
+app.config['AUDIT_FLUSH_INTERVAL'] = float(os.environ.get('PMS_AUDIT_FLUSH_INTERVAL', audit.FLUSH_INTERVAL))
+audit.writer.flush_interval = app.config['AUDIT_FLUSH_INTERVAL']
+
+# Opt-in diagnostics (unset = off)
+app.config['SLOW_QUERY_MS'] = float(os.environ['PMS_SLOW_QUERY_MS']) if os.environ.get('PMS_SLOW_QUERY_MS') else None
+app.config['SLOW_ROUTE_MS'] = float(os.environ['PMS_SLOW_ROUTE_MS']) if os.environ.get('PMS_SLOW_ROUTE_MS') else None
+app.config['PROFILE_ON_SIGNAL'] = os.environ.get('PMS_PROFILE_ON_SIGNAL') == '1'
+database.SLOW_QUERY_MS = app.config['SLOW_QUERY_MS']
+if app.config['PROFILE_ON_SIGNAL']:
+    profiler.install_signal_handler()
+
+# Sharded deployments: PMS_SHARDS (JSON list or file) turns this instance into
+# an aggregator for the admin dashboard APIs, using a service account per shard
+app.config['SHARDS'] = os.environ.get('PMS_SHARDS')
+shard_aggregator = aggregator.Aggregator(aggregator.load_shards(
+    app.config['SHARDS'], os.environ.get('PMS_SHARD_USER'), os.environ.get('PMS_SHARD_PASSWORD')
+)) if app.config['SHARDS'] else None
+
+# Admission control: per-priority-class and total concurrency limits, e.g.
+# PMS_ADMISSION_LIMITS="interactive=4,background=1,total=24" (PMS_ADMISSION=0 turns it off)
+app.config['ADMISSION'] = os.environ.get('PMS_ADMISSION', '1') != '0'
+app.config['ADMISSION_LIMITS'] = admission.parse_limits(os.environ.get('PMS_ADMISSION_LIMITS'))
+admission_controller = admission.AdmissionController(
+    app.config['ADMISSION_LIMITS']
+) if app.config['ADMISSION'] else None
+
+# Compressed storage: seal closed hours of readings into chunks (SQLite only)
+app.config['READING_CHUNKS'] = os.environ.get('PMS_READING_CHUNKS') == '1'
+
 # Initialize database on startup
 with app.app_context():
     init_db()
 
+if app.config['READING_CHUNKS']:
+    reading_chunks.start_sealer()
+
+# Background jobs (bed deletion, large alert clears, purges) run in this process
+# unless PMS_JOBS=0, e.g. when a separate `python jobs.py` worker runs them
+app.config['JOBS'] = os.environ.get('PMS_JOBS', '1') != '0'
+if app.config['JOBS']:
+    jobs.start_worker()
+
+# ==================== REQUEST INSTRUMENTATION ====================
+
+@app.before_request
+def start_request_metrics():
+    """Start per-request query/commit accounting"""
+    metrics.begin_request()
+
+@app.after_request
+def record_request_metrics(response):
+    """Record latency and database work for the finished request"""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    stats = metrics.end_request(route, request.method, response.status_code)
+    slow_ms = app.config.get('SLOW_ROUTE_MS')
+    if stats and slow_ms is not None and stats['seconds'] * 1000 >= slow_ms:
+        logging.getLogger('slow_route').warning(
+            f"Slow request ({stats['seconds'] * 1000:.1f} ms): {request.method} {request.full_path.rstrip('?')} "
+            f"-> {response.status_code}; {stats['queries']} queries in {stats['query_seconds'] * 1000:.1f} ms, "
+            f"{stats['rows']} rows, commits {stats['commit_seconds'] * 1000:.1f} ms"
+        )
+    return response
+
+# ==================== ADMISSION CONTROL ====================
+
+@app.before_request
+def admit_request():
+    """Queue the request in its priority class; shed it with 503 when overloaded"""
+    if admission_controller is None:
+        return None
+    data = request.get_json(silent=True) if request.path == '/api/data' else None
+    cls = admission.classify(request.path, data)
+    if cls is None:
+        return None
+    ticket = admission_controller.acquire(cls)
+    if ticket is None:
+        response = jsonify({'error': 'Server busy, please retry'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1' if cls in (admission.CRITICAL, admission.INGEST) else '5'
+        return response
+    g.admission_ticket = ticket
+    return None
+
+@app.after_request
+def release_admission_after_response(response):
+    """Free the slot, or for a streamed response (e.g. an export) once it has been sent"""
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        if response.is_streamed:
+            response.response = admission.release_after(response.response, ticket)
+        else:
+            ticket.release()
+    return response
+
+@app.teardown_request
+def release_admission(exc):
+    """Free the slot of a request that never produced a response"""
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        ticket.release()
+
 # ==================== SESSION TIMEOUT MIDDLEWARE ====================
 
 @app.before_request
@@ -42,6 +157,21 @@ def check_session_timeout():
         # Update last activity time for every request
         session['last_activity'] = datetime.now().isoformat()
 
+# ==================== SHARD AGGREGATION ====================
+
+@app.before_request
+def aggregate_admin_dashboard():
+    """On an aggregator instance, answer admin dashboard APIs from all shards"""
+    if shard_aggregator is None or request.path not in aggregator.ROUTES:
+        return None
+    if session.get('role') != 'admin':
+        return None
+    payload, failed = shard_aggregator.handle(request.path, request.args)
+    response = jsonify(payload)
+    if failed:
+        response.headers['X-Shards-Failed'] = ','.join(failed)
+    return response
+
 # ==================== DECORATORS ====================
 
 def login_required(f):
@@ -287,14 +417,18 @@ def bed_management():
 def delete_bed(bed_id):
     """Delete a bed and related assignments/readings (admin only)"""
     try:
-        # remove readings for bed
+        # The bed disappears right away; its history is deleted by a background job
         db = get_db()
-        db.execute('DELETE FROM readings WHERE bed_id = ?', (bed_id,))
-        db.execute('DELETE FROM nurse_assignments WHERE bed_id = ?', (bed_id,))
-        db.execute('DELETE FROM alerts WHERE bed_id = ?', (bed_id,))
-        db.execute('DELETE FROM beds WHERE id = ?', (bed_id,))
-        db.commit()
-        db.close()
+        try:
+            db.execute('DELETE FROM nurse_assignments WHERE bed_id = ?', (bed_id,))
+            alert_counters.remove_bed(db, bed_id)
+            thresholds.remove_bed(db, bed_id)
+            db.execute('DELETE FROM beds WHERE id = ?', (bed_id,))
+            db.commit()
+        finally:
+            db.close()
+        thresholds.invalidate()
+        job_id = jobs.enqueue('delete_bed', {'bed_id': bed_id}, session['user_id'])
         # Log bed deletion
         models.log_event(
             session['user_id'],
@@ -302,10 +436,10 @@ def delete_bed(bed_id):
             'DELETE_BED',
             'bed',
             bed_id,
-            f"Deleted bed ID: {bed_id}",
+            f"Deleted bed ID: {bed_id} (history removed by job {job_id})",
             request.remote_addr
         )
-        flash('Bed and related data deleted', 'success')
+        flash('Bed deleted; its readings and alerts are being removed in the background', 'success')
     except Exception as e:
         flash('Failed to delete bed: ' + str(e), 'error')
     return redirect(url_for('bed_management'))
@@ -366,68 +500,16 @@ def api_data():
     """Receive sensor data from ESP8266"""
     try:
         data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'No JSON data provided'}), 400
-        
-        # Validate required fields
-        required = ['bed_id', 'temperature', 'humidity', 'motion', 'distance_cm', 'esp_id']
-        for field in required:
-            if field not in data:
-                return jsonify({'error': f'Missing field: {field}'}), 400
-        
-        bed_id = int(data['bed_id'])
-        temperature = float(data.get('temperature', 0))
-        humidity = float(data.get('humidity', 0))
-        motion = int(data.get('motion', 0))
-        distance_cm = float(data.get('distance_cm', 0))
-        esp_id = data['esp_id']
-        ip = request.remote_addr
-        
-        # Insert reading
-        models.insert_reading(bed_id, temperature, humidity, motion, distance_cm)
-        
-        # Update device status
-        models.update_device_status(esp_id, ip)
-        
-        # Check thresholds and create alerts
-        settings = models.get_all_settings()
-        
-        # Basic threshold checks
-        # Temperature check
-        if temperature < settings.get('temp_min', 18.0) or temperature > settings.get('temp_max', 24.0):
-            models.create_alert(
-                bed_id,
-                'temp_out_of_range',
-                f'Temperature {temperature:.1f}°C is outside safe range ({settings.get("temp_min", 18.0)}-{settings.get("temp_max", 24.0)}°C)'
-            )
-        
-        # Humidity check
-        if humidity < settings.get('humidity_min', 40.0) or humidity > settings.get('humidity_max', 60.0):
-            models.create_alert(
-                bed_id,
-                'humidity_out_of_range',
-                f'Humidity {humidity:.1f}% is outside safe range ({settings.get("humidity_min", 40.0)}-{settings.get("humidity_max", 60.0)}%)'
-            )
-        
-        # Advanced behavior detection
-        detected_behaviors = behavior_detection.detect_abnormal_behaviors(
-            bed_id, temperature, humidity, motion, distance_cm
-        )
-        
-        # Create alerts for detected behaviors
-        for alert_type, message, severity in detected_behaviors:
-            # Log the detection
-            behavior_detection.log_behavior_detection(bed_id, alert_type, message, severity)
-            
-            # Create alert in database
-            models.create_alert(bed_id, alert_type, message)
-            
-            # Log to console
-            logging.info(f"Behavior detected - Bed {bed_id}: {alert_type} - {message}")
-        
+        if ingest.is_batch(data):
+            result = ingest.process_batch(ingest.parse_batch(data), request.remote_addr)
+            return jsonify({'status': 'ok', 'accepted': result['accepted'], 'duplicates': result['duplicates']})
+
+        reading = ingest.parse_payload(data)
+        if ingest.process_reading(reading, request.remote_addr) is None:
+            return jsonify({'status': 'ok', 'duplicate': True})
         return jsonify({'status': 'ok'})
-    
+    except ingest.PayloadError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -447,6 +529,13 @@ def api_latest_readings():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def page_args():
+    """Parse keyset pagination query args: (limit, before_id, since_id)"""
+    limit = max(1, min(int(request.args.get('limit', 100)), MAX_PAGE_SIZE))
+    before_id = request.args.get('before_id')
+    since_id = request.args.get('since_id')
+    return limit, int(before_id) if before_id else None, int(since_id) if since_id else None
+
 @app.route('/api/alerts')
 @login_required
 def api_alerts():
@@ -454,8 +543,10 @@ def api_alerts():
     try:
         status = request.args.get('status')
         nurse_id = session['user_id'] if session.get('role') == 'nurse' else None
+        limit, before_id, since_id = page_args()
         
-        alerts = models.get_all_alerts(status=status, nurse_id=nurse_id)
+        alerts = models.get_all_alerts(status=status, nurse_id=nurse_id, limit=limit,
+                                       before_id=before_id, since_id=since_id)
         return jsonify(alerts)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -488,14 +579,15 @@ def api_stats_overview():
 
         # For admin clients, include legacy/admin-oriented keys expected by admin dashboard
         if session.get('role') == 'admin':
-            db = get_db()
+            db = get_read_db()
             try:
                 total_beds = db.execute("SELECT COUNT(*) as cnt FROM beds").fetchone()['cnt']
             except Exception:
                 total_beds = 0
 
             try:
-                new_alerts_today = db.execute("SELECT COUNT(*) as cnt FROM alerts WHERE status = 'new' AND date(created_at) = date('now')").fetchone()['cnt']
+                today = alert_counters.now()[:10] + ' 00:00:00'
+                new_alerts_today = alert_counters.count(db, today, status='new')
             except Exception:
                 new_alerts_today = 0
 
@@ -526,43 +618,26 @@ def api_stats_overview():
 def api_chart_temperature():
     """Get average temperature data for the last 24 hours by bed"""
     try:
-        db = get_db()
-        # Get average temperature per bed for last 24 hours
+        # Get average temperature per bed for last 24 hours (live, sealed and archived readings)
         # If nurse, limit to beds assigned to the nurse
+        nurse_beds = None
         if session.get('role') == 'nurse':
             nurse_beds = [b['id'] for b in models.get_nurse_beds(session['user_id'])]
             if not nurse_beds:
-                db.close()
                 return jsonify({'labels': [], 'temperatures': []})
-            placeholders = ','.join(['?'] * len(nurse_beds))
-            query = f'''
-                SELECT 
-                    b.id as bed_id, 
-                    b.bed_name,
-                    ROUND(AVG(r.temperature), 1) as avg_temp
-                FROM readings r
-                JOIN beds b ON r.bed_id = b.id
-                WHERE r.timestamp >= datetime('now', '-24 hours') AND r.bed_id IN ({placeholders})
-                GROUP BY r.bed_id
-                ORDER BY b.bed_name
-            '''
-            cursor = db.execute(query, tuple(nurse_beds))
-        else:
-            cursor = db.execute('''
-                SELECT 
-                    b.id as bed_id, 
-                    b.bed_name,
-                    ROUND(AVG(r.temperature), 1) as avg_temp
-                FROM readings r
-                JOIN beds b ON r.bed_id = b.id
-                WHERE r.timestamp >= datetime('now', '-24 hours')
-                GROUP BY r.bed_id
-                ORDER BY b.bed_name
-            ''')
-        rows = cursor.fetchall()
-        db.close()
+        db = get_snapshot_db()
+        try:
+            totals = models.get_temperature_sums(db, 24, nurse_beds)
+            names = {b['id']: b['bed_name'] for b in db.execute('SELECT id, bed_name FROM beds')}
+        finally:
+            db.close()
+        rows = sorted(
+            ({'bed_name': names[bed_id], 'avg_temp': round(s / n, 1) if n else None}
+             for bed_id, (s, n) in totals.items() if bed_id in names),
+            key=lambda row: row['bed_name']
+        )
         
-        if not rows:
+        if not rows and request.args.get('sample') != '0':
             # Return sample data if no readings available
             return jsonify({
                 'labels': ['Bed 1', 'Bed 2', 'Bed 3'],
@@ -579,31 +654,24 @@ def api_chart_temperature():
 @app.route('/api/charts/alerts')
 @login_required
 def api_chart_alerts():
-    """Get alert counts by type for the last 24 hours"""
+    """Get alert counts by type for the last 24 hours (counted in whole hours, so 24-25 hours)"""
     try:
-        db = get_db()
-        # Count alerts by type for last 24 hours
-        cursor = db.execute('''
-            SELECT 
-                alert_type,
-                COUNT(*) as count
-            FROM alerts
-            WHERE created_at >= datetime('now', '-24 hours')
-            GROUP BY alert_type
-            ORDER BY count DESC
-        ''')
-        rows = cursor.fetchall()
-        db.close()
+        db = get_snapshot_db()
+        try:
+            # Count alerts by type from the hourly counters, starting at the top of the hour 24 hours ago
+            rows = alert_counters.counts_by_type(db, alert_counters.hours_ago(24))
+        finally:
+            db.close()
         
-        if not rows:
+        if not rows and request.args.get('sample') != '0':
             # Return sample data if no alerts available
             return jsonify({
                 'labels': ['Bed Exit', 'Motion Alert', 'Humidity Alert'],
                 'counts': [5, 3, 2]
             })
         
-        labels = [row['alert_type'] for row in rows]
-        counts = [row['count'] for row in rows]
+        labels = [alert_type for alert_type, _ in rows]
+        counts = [count for _, count in rows]
         
         return jsonify({'labels': labels, 'counts': counts})
     except Exception as e:
@@ -616,9 +684,7 @@ def api_resolve_alert(alert_id):
     try:
         # Check nurse permissions
         if session.get('role') == 'nurse':
-            alert = models.get_all_alerts(nurse_id=session['user_id'])
-            alert_ids = [a['id'] for a in alert]
-            if alert_id not in alert_ids:
+            if not models.nurse_can_access_alert(session['user_id'], alert_id):
                 return jsonify({'error': 'Access denied'}), 403
         
         models.resolve_alert(alert_id)
@@ -637,6 +703,53 @@ def api_resolve_alert(alert_id):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/alerts/resolve', methods=['POST'])
+@login_required
+def api_resolve_alerts():
+    """Resolve new alerts in bulk, selected by id list, bed and/or alert type"""
+    try:
+        data = request.get_json(silent=True) or {}
+        ids = data.get('ids') or []
+        bed_id = data.get('bed_id')
+        alert_type = data.get('alert_type')
+        try:
+            ids = [int(i) for i in ids]
+            bed_id = int(bed_id) if bed_id is not None else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'ids and bed_id must be integers'}), 400
+        if not (ids or bed_id or alert_type):
+            return jsonify({'error': 'Give ids, bed_id or alert_type'}), 400
+        if len(ids) > MAX_BULK_IDS:
+            return jsonify({'error': f'At most {MAX_BULK_IDS} ids per request'}), 400
+
+        # Nurses only resolve alerts of their assigned beds; others are skipped
+        nurse_id = session['user_id'] if session.get('role') == 'nurse' else None
+        resolved = models.resolve_alerts(ids, bed_id, alert_type, nurse_id=nurse_id, limit=jobs.BATCH_SIZE)
+        if resolved is None:
+            # Too many for one short transaction: resolve them in batches
+            db = get_read_db()
+            try:
+                max_id = db.execute('SELECT MAX(id) AS max_id FROM alerts').fetchone()['max_id']
+            finally:
+                db.close()
+            # The job audits the alerts it resolves, batch by batch
+            job_id = jobs.enqueue('clear_alerts', {'max_id': max_id, 'ids': ids, 'bed_id': bed_id,
+                                                   'alert_type': alert_type, 'nurse_id': nurse_id,
+                                                   'user_id': session['user_id'],
+                                                   'username': session['username'],
+                                                   'ip_address': request.remote_addr}, session['user_id'])
+            return jsonify({'status': 'ok', 'job_id': job_id,
+                            'message': f'More than {jobs.BATCH_SIZE} alerts match; resolving them in the background'})
+        models.log_events([
+            (session['user_id'], session['username'], 'RESOLVE_ALERT', 'alert', alert_id,
+             f"Resolved alert ID: {alert_id} (bulk)", request.remote_addr)
+            for alert_id in resolved
+        ])
+        return jsonify({'status': 'ok', 'resolved': len(resolved), 'ids': resolved})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/alerts/clear/all', methods=['POST'])
 @login_required
 @permission_required('users')
@@ -644,17 +757,83 @@ def api_clear_all_alerts():
     """Clear all new alerts (mark as resolved)"""
     try:
         db = get_db()
-        db.execute('''
-            UPDATE alerts 
-            SET status = 'resolved', resolved_at = CURRENT_TIMESTAMP
-            WHERE status = 'new'
-        ''')
-        db.commit()
-        db.close()
+        try:
+            row = db.execute("SELECT COUNT(*) AS cnt, MAX(id) AS max_id FROM alerts WHERE status = 'new'").fetchone()
+            if row['cnt'] <= jobs.BATCH_SIZE:
+                alert_counters.set_status(db, "status = 'new'", (), 'resolved')
+                db.commit()
+        finally:
+            db.close()
+        if row['cnt'] > jobs.BATCH_SIZE:
+            # Too many for one short transaction: resolve them in batches
+            job_id = jobs.enqueue('clear_alerts', {'max_id': row['max_id']}, session['user_id'])
+            return jsonify({'status': 'ok', 'job_id': job_id,
+                            'message': f"Clearing {row['cnt']} alerts in the background"})
         return jsonify({'status': 'ok', 'message': 'All alerts cleared'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ==================== BACKGROUND JOBS API ====================
+
+@app.route('/api/jobs')
+@login_required
+@admin_required
+def api_jobs():
+    """Recent background jobs with status and progress (admin only)"""
+    try:
+        limit = min(int(request.args.get('limit', 50)), MAX_PAGE_SIZE)
+        return jsonify(jobs.list_jobs(limit))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+@admin_required
+def api_job(job_id):
+    """One background job (admin only)"""
+    try:
+        job = jobs.get_job(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+@admin_required
+def api_cancel_job(job_id):
+    """Cancel a queued or running job (admin only)"""
+    try:
+        if not jobs.cancel(job_id):
+            return jsonify({'error': 'Job is not queued or running'}), 409
+        models.log_event(session['user_id'], session['username'], 'CANCEL_JOB', 'job', job_id,
+                         f"Cancelled job ID: {job_id}", request.remote_addr)
+        return jsonify({'status': 'ok'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/purge', methods=['POST'])
+@login_required
+@admin_required
+def api_purge():
+    """Queue deletion of readings and resolved alerts older than `days` (admin only)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            days = int(data.get('days'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'days must be an integer'}), 400
+        if days < 1:
+            return jsonify({'error': 'days must be at least 1'}), 400
+        job_id = jobs.enqueue_purge(days, session['user_id'])
+        before = jobs.get_job(job_id)['params']['before']
+        models.log_event(session['user_id'], session['username'], 'PURGE_DATA', 'job', job_id,
+                         f"Queued purge of data older than {before}", request.remote_addr)
+        return jsonify({'status': 'ok', 'job_id': job_id})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ==================== USER MANAGEMENT API ====================
 
 @app.route('/users/create', methods=['POST'])
@@ -929,24 +1108,243 @@ def api_settings():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ==================== THRESHOLD PROFILES API ====================
+
+@app.route('/api/threshold_profiles')
+@login_required
+@admin_required
+def api_threshold_profiles():
+    """Threshold profiles with their values (admin only)"""
+    try:
+        return jsonify(thresholds.list_profiles())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/threshold_profiles', methods=['POST'])
+@login_required
+@admin_required
+def api_save_threshold_profile():
+    """Create or replace a threshold profile by name (admin only)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            profile_id = thresholds.save_profile(data.get('name'), data.get('values'))
+        except (TypeError, ValueError, AttributeError) as e:
+            return jsonify({'error': str(e)}), 400
+        models.log_event(session['user_id'], session['username'], 'SAVE_THRESHOLD_PROFILE',
+                         'threshold_profile', profile_id,
+                         f"Saved threshold profile {data.get('name')}: {json.dumps(data.get('values') or {})}",
+                         request.remote_addr)
+        return jsonify({'status': 'ok', 'id': profile_id})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/threshold_profiles/<int:profile_id>/delete', methods=['POST'])
+@login_required
+@admin_required
+def api_delete_threshold_profile(profile_id):
+    """Delete a threshold profile; its beds fall back to the global settings (admin only)"""
+    try:
+        if not thresholds.delete_profile(profile_id):
+            return jsonify({'error': 'Profile not found'}), 404
+        models.log_event(session['user_id'], session['username'], 'DELETE_THRESHOLD_PROFILE',
+                         'threshold_profile', profile_id, f"Deleted threshold profile ID: {profile_id}",
+                         request.remote_addr)
+        return jsonify({'status': 'ok'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/beds/<int:bed_id>/thresholds')
+@login_required
+@admin_required
+def api_bed_thresholds(bed_id):
+    """A bed's threshold profile, overrides and effective thresholds (admin only)"""
+    try:
+        result = thresholds.get_bed_thresholds(bed_id)
+        if result is None:
+            return jsonify({'error': 'Bed not found'}), 404
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/beds/<int:bed_id>/thresholds', methods=['POST'])
+@login_required
+@admin_required
+def api_set_bed_thresholds(bed_id):
+    """Set a bed's threshold profile and overrides (admin only)"""
+    try:
+        if not models.get_bed(bed_id):
+            return jsonify({'error': 'Bed not found'}), 404
+        data = request.get_json(silent=True) or {}
+        profile_id = data.get('profile_id')
+        try:
+            thresholds.set_bed_thresholds(bed_id, int(profile_id) if profile_id is not None else None,
+                                          data.get('overrides'))
+        except (TypeError, ValueError, AttributeError) as e:
+            return jsonify({'error': str(e)}), 400
+        models.log_event(session['user_id'], session['username'], 'UPDATE_BED_THRESHOLDS', 'bed', bed_id,
+                         f"Bed thresholds: profile {profile_id}, overrides {json.dumps(data.get('overrides') or {})}",
+                         request.remote_addr)
+        return jsonify({'status': 'ok'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/logs')
 @login_required
 @admin_required
 def api_logs():
     """Get audit logs"""
     try:
-        limit = int(request.args.get('limit', 100))
-        user_filter = request.args.get('user_id')
-        action_filter = request.args.get('action')
-        
+        limit, before_id, since_id = page_args()
         logs = models.get_audit_logs(
             limit=limit,
-            user_id=int(user_filter) if user_filter else None,
-            action_filter=action_filter
+            before_id=before_id,
+            since_id=since_id,
+            **audit_log_filters()
         )
         return jsonify(logs)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+AUDIT_EXPORT_COLUMNS = ['id', 'timestamp', 'user_id', 'username', 'action',
+                        'target_type', 'target_id', 'details', 'ip_address']
+
+def audit_log_filters():
+    """Parse audit log search/filter query args into get_audit_logs kwargs"""
+    user_filter = request.args.get('user_id')
+    target_id = request.args.get('target_id')
+    return {
+        'user_id': int(user_filter) if user_filter else None,
+        'action_filter': request.args.get('action') or None,
+        'search': request.args.get('q') or None,
+        'target_type': request.args.get('target_type') or None,
+        'target_id': int(target_id) if target_id else None,
+        'start': request.args.get('start') or None,
+        'end': request.args.get('end') or None,
+    }
+
+@app.route('/api/logs/export')
+@login_required
+@admin_required
+def api_logs_export():
+    """Stream all matching audit logs as CSV or JSON (admin only)"""
+    try:
+        fmt = request.args.get('format', 'csv')
+        if fmt not in ('csv', 'json'):
+            return jsonify({'error': 'format must be csv or json'}), 400
+        filters = audit_log_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    models.log_event(
+        session['user_id'],
+        session['username'],
+        'EXPORT_LOGS',
+        'audit_logs',
+        None,
+        f"Exported audit logs as {fmt}: {request.query_string.decode() or 'all'}",
+        request.remote_addr
+    )
+    
+    def generate_csv():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(AUDIT_EXPORT_COLUMNS)
+        for log in models.iter_audit_logs(**filters):
+            writer.writerow([log[c] for c in AUDIT_EXPORT_COLUMNS])
+            if buf.tell() > 65536:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+    
+    def generate_json():
+        chunk = ['[']
+        sep = '\n'
+        for log in models.iter_audit_logs(**filters):
+            chunk.append(sep + json.dumps(log))
+            sep = ',\n'
+            if len(chunk) >= 500:
+                yield ''.join(chunk)
+                chunk = []
+        chunk.append('\n]\n')
+        yield ''.join(chunk)
+    
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    return Response(
+        generate_csv() if fmt == 'csv' else generate_json(),
+        mimetype='text/csv' if fmt == 'csv' else 'application/json',
+        headers={'Content-Disposition': f'attachment; filename=audit-logs-{stamp}.{fmt}'}
+    )
+
+@app.route('/api/export/<dataset>')
+@login_required
+def api_export(dataset):
+    """Stream readings or alerts for a set of beds and a time range (CSV, NDJSON or Parquet)"""
+    if dataset not in export.DATASETS:
+        return jsonify({'error': 'Unknown export'}), 404
+    try:
+        fmt = request.args.get('format', 'csv')
+        beds = request.args.get('beds')
+        bed_ids = [int(b) for b in beds.split(',') if b.strip()] if beds else None
+        start = request.args.get('start') or None
+        end = request.args.get('end') or None
+        if session.get('role') == 'nurse':
+            allowed = [b['id'] for b in models.get_nurse_beds(session['user_id'])]
+            if bed_ids is None:
+                bed_ids = allowed
+            elif not set(bed_ids) <= set(allowed):
+                return jsonify({'error': 'Access denied to one or more beds'}), 403
+        elif bed_ids is None:
+            bed_ids = [b['id'] for b in models.list_beds()]
+        chunks = export.stream(dataset, fmt, bed_ids, start, end)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    models.log_event(
+        session['user_id'],
+        session['username'],
+        f'EXPORT_{dataset.upper()}',
+        dataset,
+        None,
+        f"Exported {dataset} as {fmt}: beds {','.join(map(str, bed_ids)) or 'none'}, "
+        f"{start or 'start'} to {end or 'now'}",
+        request.remote_addr
+    )
+    
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    return Response(
+        chunks,
+        mimetype=export.MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename={dataset}-{stamp}.{fmt}'}
+    )
+
+@app.route('/admin/profile')
+@login_required
+@admin_required
+def admin_profile():
+    """Capture a time-boxed sampling profile as collapsed stacks (admin only)"""
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval_ms', profiler.DEFAULT_INTERVAL * 1000)) / 1000
+        folded = profiler.capture(seconds, interval)
+    except profiler.ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return Response(folded, mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename=profile-{datetime.now().strftime("%Y%m%d-%H%M%S")}.folded'
+    })
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text-format metrics, for admins or scrapers sending PMS_METRICS_TOKEN"""
+    if not metrics.token_ok(request.headers.get('Authorization')):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Login or metrics token required'}), 401
+        if session.get('role') != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
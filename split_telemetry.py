@@ -0,0 +1,63 @@
+"""
+Migration script to move readings, alerts and devices out of the main
+database into the telemetry database (PMS_TELEMETRY_DB)
+Run this once after setting PMS_TELEMETRY_DB (and optionally
+PMS_TELEMETRY_PARTITION_MONTHS) for an existing installation
+"""
+
+import sqlite3
+from pathlib import Path
+
+import alert_counters
+import database
+
+TABLES = ('readings', 'reading_chunks', 'alerts', 'alert_counters', 'devices')
+
+def split_telemetry():
+    """Copy the telemetry tables into the telemetry database and drop them from the main one"""
+    if not database.TELEMETRY_DATABASE:
+        print("Set PMS_TELEMETRY_DB to the telemetry database path first")
+        return
+    if not Path(database.DATABASE).exists():
+        print(f"Database not found at {database.DATABASE}")
+        return
+
+    # Rename the old tables so they no longer shadow the attached ones
+    conn = sqlite3.connect(database.DATABASE)
+    existing = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'"
+    )]
+    for table in TABLES:
+        if table in existing and f'{table}_unsplit' not in existing:
+            conn.execute(f'ALTER TABLE {table} RENAME TO {table}_unsplit')
+            print(f"Renamed {table} -> {table}_unsplit")
+    conn.commit()
+    conn.close()
+
+    database.init_db()
+
+    db = database.get_db()
+    try:
+        for table in TABLES:
+            source = f'{table}_unsplit'
+            if not db.execute("SELECT 1 FROM main.sqlite_master WHERE name = ?", (source,)).fetchone():
+                continue
+            columns = ', '.join(r['name'] for r in db.execute(f"PRAGMA main.table_info('{source}')"))
+            # readings may be a partitioned view: its triggers route each row by timestamp
+            db.execute(f'INSERT INTO {table} ({columns}) SELECT {columns} FROM main.{source} ORDER BY id')
+            count = db.execute(f'SELECT COUNT(*) FROM main.{source}').fetchone()[0]
+            db.execute(f'DROP TABLE main.{source}')
+            db.commit()
+            print(f"Moved {count} rows from {table}")
+        # Alerts moved from before the counters existed still need categorizing and counting
+        alert_counters.backfill(db)
+    finally:
+        db.close()
+
+    conn = sqlite3.connect(database.DATABASE)
+    conn.execute('VACUUM')
+    conn.close()
+    print("✓ Telemetry moved to", database.TELEMETRY_DATABASE)
+
+if __name__ == '__main__':
+    split_telemetry()
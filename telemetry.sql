@@ -0,0 +1,64 @@
+-- Telemetry tables: high-volume sensor data and alerts
+-- Created in the main database, or in their own file when PMS_TELEMETRY_DB
+-- is set (see database.py). With monthly partitions, readings live in
+-- per-month files instead and the readings table here stays empty.
+
+CREATE TABLE IF NOT EXISTS readings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bed_id INTEGER NOT NULL REFERENCES beds(id),
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+    temperature REAL,
+    humidity REAL,
+    motion INTEGER,
+    distance_cm REAL
+);
+
+-- Sealed hours of readings, compressed (see reading_chunks.py)
+CREATE TABLE IF NOT EXISTS reading_chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bed_id INTEGER NOT NULL REFERENCES beds(id),
+    start_time DATETIME NOT NULL,
+    end_time DATETIME NOT NULL,
+    count INTEGER NOT NULL,
+    temp_sum REAL,
+    temp_count INTEGER NOT NULL DEFAULT 0,
+    data BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bed_id INTEGER NOT NULL REFERENCES beds(id),
+    alert_type TEXT NOT NULL,
+    category TEXT,              -- fall_risk, environmental, behavioral or other (alert_counters.py)
+    message TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'new',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    resolved_at DATETIME
+);
+
+-- Alerts per creation hour, bed, type and current status (see alert_counters.py)
+CREATE TABLE IF NOT EXISTS alert_counters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hour DATETIME NOT NULL,
+    bed_id INTEGER NOT NULL,
+    alert_type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    status TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    UNIQUE(hour, bed_id, alert_type, status)
+);
+
+CREATE TABLE IF NOT EXISTS devices (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    esp_id TEXT UNIQUE,
+    ip TEXT,
+    last_seen DATETIME,
+    status TEXT
+);
+
+-- Create indexes for better performance
+CREATE INDEX IF NOT EXISTS idx_readings_bed_timestamp ON readings(bed_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_reading_chunks_bed_end ON reading_chunks(bed_id, end_time);
+CREATE INDEX IF NOT EXISTS idx_alerts_bed_status ON alerts(bed_id, status);
+CREATE INDEX IF NOT EXISTS idx_alerts_status_id ON alerts(status, id);
+CREATE INDEX IF NOT EXISTS idx_alert_counters_category ON alert_counters(category, hour);
@@ -0,0 +1,39 @@
+"""
+Shared fixtures for the Patient Monitoring System tests
+Each test gets its own SQLite file; module-level state that outlives a
+database (read pool, compiled thresholds, detector and ingest state) is reset.
+"""
+
+import pytest
+
+import archive
+import behavior_detection
+import database
+import ingest
+import rules
+import thresholds
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Path of an empty database file (schema not created yet)"""
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'test.db'))
+    monkeypatch.setattr(database, 'DATABASE_URL', None)
+    monkeypatch.setattr(database, 'TELEMETRY_DATABASE', None)
+    monkeypatch.setattr(database, 'TELEMETRY_PARTITION_MONTHS', 0)
+    monkeypatch.setattr(archive, 'ARCHIVE_DIR', None)
+    monkeypatch.setattr(behavior_detection, 'detector', rules.Detector())
+    monkeypatch.setattr(ingest, 'sequence_window', ingest.SequenceWindow())
+    monkeypatch.setattr(ingest, 'event_orderer', behavior_detection.EventTimeOrderer())
+    database.read_pool.reset()
+    thresholds.invalidate()
+    yield database.DATABASE
+    database.read_pool.reset()
+    thresholds.invalidate()
+
+
+@pytest.fixture
+def db(db_path):
+    """A fresh database with every migration applied"""
+    database.init_db()
+    return db_path
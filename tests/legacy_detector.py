@@ -0,0 +1,142 @@
+"""
+The alert detection that rules.py replaced, kept as a reference for
+test_rules.py: the range checks formerly in ingest._detect and
+detect_abnormal_behaviors() from behavior_detection.py, unchanged except
+that per-bed state lives on an instance.
+"""
+
+from datetime import datetime
+
+import thresholds
+
+
+class LegacyDetector:
+
+    def __init__(self):
+        self.bed_state = {}
+
+    def check_reading(self, bed_id, temperature, humidity):
+        """Range checks ingest ran on every reading; (alert_type, message, severity) tuples"""
+        behaviors = []
+        limits = thresholds.for_bed(bed_id)
+        if temperature < limits[thresholds.TEMP_MIN] or temperature > limits[thresholds.TEMP_MAX]:
+            behaviors.append((
+                'temp_out_of_range',
+                f'Temperature {temperature:.1f}°C is outside safe range ({limits[thresholds.TEMP_MIN]}-{limits[thresholds.TEMP_MAX]}°C)',
+                'warning'
+            ))
+        if humidity < limits[thresholds.HUMIDITY_MIN] or humidity > limits[thresholds.HUMIDITY_MAX]:
+            behaviors.append((
+                'humidity_out_of_range',
+                f'Humidity {humidity:.1f}% is outside safe range ({limits[thresholds.HUMIDITY_MIN]}-{limits[thresholds.HUMIDITY_MAX]}%)',
+                'warning'
+            ))
+        return behaviors
+
+    def detect(self, bed_id, temperature, humidity, motion, distance_cm, event_time=None, update_state=True):
+        behaviors = []
+        limits = thresholds.for_bed(bed_id)
+        if bed_id not in self.bed_state:
+            self.bed_state[bed_id] = {
+                'last_motion_time': None,
+                'last_distance': None,
+                'motion_count_night': 0,
+                'night_start': None,
+                'last_humidity': None
+            }
+        state = self.bed_state[bed_id]
+        current_time = event_time or datetime.now()
+
+        # 1. Patient trying to get off bed (distance + motion)
+        if motion == 1 and distance_cm > limits[thresholds.DISTANCE_BED_EXIT_CM]:
+            behaviors.append((
+                'bed_exit',
+                f'Patient attempting to get off bed: Motion detected with distance {distance_cm:.1f}cm',
+                'critical'
+            ))
+
+        if not update_state:
+            self._detect_humidity_danger(behaviors, limits, humidity)
+            return behaviors
+
+        # 2. Possible fall (sudden large drop in distance)
+        if state['last_distance'] is not None and distance_cm > 0 and state['last_distance'] > 0:
+            distance_drop = state['last_distance'] - distance_cm
+            fall_threshold = limits[thresholds.FALL_DROP_THRESHOLD_CM]
+            if distance_drop > fall_threshold and distance_cm < 20:
+                behaviors.append((
+                    'possible_fall',
+                    f'Possible fall detected: Distance dropped from {state["last_distance"]:.1f}cm to {distance_cm:.1f}cm (drop: {distance_drop:.1f}cm)',
+                    'critical'
+                ))
+        if distance_cm > 0:
+            state['last_distance'] = distance_cm
+
+        # 3. Long inactivity (no motion for X minutes)
+        no_motion_timeout = limits[thresholds.NO_MOTION_TIMEOUT_MINUTES]
+        if motion == 1:
+            state['last_motion_time'] = current_time
+        elif state['last_motion_time'] is not None:
+            inactivity_duration = (current_time - state['last_motion_time']).total_seconds() / 60
+            if inactivity_duration > no_motion_timeout:
+                last_alert_time = state.get('last_inactivity_alert_time')
+                if last_alert_time is None or (current_time - last_alert_time).total_seconds() > 300:
+                    behaviors.append((
+                        'long_inactivity',
+                        f'No motion detected for {inactivity_duration:.1f} minutes (threshold: {no_motion_timeout} min)',
+                        'warning'
+                    ))
+                    state['last_inactivity_alert_time'] = current_time
+
+        # 4. Restlessness at night (frequent motion) - only during configured time window
+        current_minutes = current_time.hour * 60 + current_time.minute
+        start_minutes = limits[thresholds.RESTLESSNESS_START]
+        end_minutes = limits[thresholds.RESTLESSNESS_END]
+        if start_minutes < end_minutes:
+            is_in_window = start_minutes <= current_minutes < end_minutes
+        else:
+            is_in_window = current_minutes >= start_minutes or current_minutes < end_minutes
+
+        if is_in_window:
+            if state['night_start'] is None:
+                state['night_start'] = current_time
+                state['motion_count_night'] = 0
+            if (current_time - state['night_start']).total_seconds() > 28800:  # 8 hours
+                state['night_start'] = current_time
+                state['motion_count_night'] = 0
+            if motion == 1:
+                state['motion_count_night'] += 1
+            night_duration = (current_time - state['night_start']).total_seconds() / 3600
+            if night_duration > 0:
+                motion_rate = state['motion_count_night'] / night_duration
+                restlessness_threshold = limits[thresholds.RESTLESSNESS_MOTIONS_PER_HOUR]
+                if motion_rate > restlessness_threshold:
+                    behaviors.append((
+                        'restlessness_night',
+                        f'Restlessness detected: {state["motion_count_night"]} motions in {night_duration:.1f} hours (rate: {motion_rate:.1f}/hr, threshold: {restlessness_threshold}/hr)',
+                        'warning'
+                    ))
+        else:
+            state['night_start'] = None
+            state['motion_count_night'] = 0
+
+        # 5. Dangerous room humidity (breathing issues)
+        self._detect_humidity_danger(behaviors, limits, humidity)
+        return behaviors
+
+    @staticmethod
+    def _detect_humidity_danger(behaviors, limits, humidity):
+        low_humidity_threshold = limits[thresholds.LOW_HUMIDITY_DANGER]
+        if humidity < low_humidity_threshold:
+            behaviors.append((
+                'low_humidity_danger',
+                f'Dangerously low humidity: {humidity:.1f}% - May cause breathing discomfort (threshold: {low_humidity_threshold}%)',
+                'warning'
+            ))
+        high_humidity_threshold = limits[thresholds.HIGH_HUMIDITY_DANGER]
+        if humidity > high_humidity_threshold:
+            behaviors.append((
+                'high_humidity_danger',
+                f'Dangerously high humidity: {humidity:.1f}% - May cause breathing issues (threshold: {high_humidity_threshold}%)',
+                'warning'
+            ))
@@ -0,0 +1,113 @@
+"""Alert counters stay equal to counting the alerts table"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import alert_counters
+import database
+import jobs
+import migrations
+import models
+
+
+def _from_alerts(db):
+    hour = alert_counters.HOUR_SQL.format('created_at')
+    return {tuple(r[:4]): r[4] for r in db.execute(f'''
+        SELECT {hour}, bed_id, alert_type, status, COUNT(*) FROM alerts
+        WHERE created_at IS NOT NULL GROUP BY 1, 2, 3, 4
+    ''')}
+
+
+def _from_counters(db):
+    return {tuple(r[:4]): r[4] for r in db.execute('''
+        SELECT hour, bed_id, alert_type, status, SUM(count) FROM alert_counters
+        GROUP BY 1, 2, 3, 4 HAVING SUM(count) != 0
+    ''')}
+
+
+def assert_consistent():
+    db = database.get_db()
+    try:
+        assert _from_counters(db) == _from_alerts(db)
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def alerts(db, monkeypatch):
+    """{bed_id: [alert ids]} of alerts spread over the last 30 hours"""
+    start = datetime.utcnow() - timedelta(hours=30)
+    times = iter(start + timedelta(minutes=7 * i) for i in range(10000))
+    monkeypatch.setattr(alert_counters, 'now', lambda: next(times).strftime(alert_counters.TIME_FORMAT))
+    created = {}
+    for bed_id in (models.create_bed('A'), models.create_bed('B')):
+        created[bed_id] = [models.create_alert(bed_id, alert_type, 'test')
+                           for _ in range(40)
+                           for alert_type in ('bed_exit', 'long_inactivity', 'temp_out_of_range')]
+    return created
+
+
+def test_counts_follow_resolves(alerts):
+    first, second = alerts
+    models.resolve_alert(alerts[first][0])
+    models.resolve_alert(alerts[first][0])   # resolving twice changes nothing
+    models.resolve_alerts(bed_id=second, alert_type='bed_exit')
+    models.resolve_alerts(alert_ids=alerts[first][10:20])
+    assert_consistent()
+
+    db = database.get_db()
+    try:
+        since = alert_counters.hours_ago(48)
+        resolved = db.execute("SELECT COUNT(*) FROM alerts WHERE status = 'resolved'").fetchone()[0]
+        assert alert_counters.count(db, since, status='resolved') == resolved
+        assert alert_counters.count(db, since, category=alert_counters.FALL_RISK) == 80
+    finally:
+        db.close()
+
+
+def test_counts_follow_deletes(alerts):
+    first, second = alerts
+    models.resolve_alerts(bed_id=first)
+    db = database.get_db()
+    try:
+        alert_counters.delete(db, 'bed_id = ? AND alert_type = ?', (second, 'bed_exit'))
+        db.commit()
+    finally:
+        db.close()
+    assert_consistent()
+
+    jobs.enqueue('purge', {'before': '9999-01-01 00:00:00'})
+    jobs.run_pending('test')
+    db = database.get_db()
+    try:
+        assert db.execute("SELECT COUNT(*) FROM alerts WHERE status = 'resolved'").fetchone()[0] == 0
+    finally:
+        db.close()
+    assert_consistent()
+
+
+def test_uncounted_alerts_are_counted_once(db):
+    bed_id = models.create_bed('A')
+    # Alerts from before the counters existed: no category, not counted
+    conn = database.get_db()
+    try:
+        conn.executemany("INSERT INTO alerts (bed_id, alert_type, message, status, created_at) "
+                         "VALUES (?, 'bed_exit', 'old', 'new', datetime('now', ?))",
+                         [(bed_id, f'-{i} minutes') for i in range(10)])
+        conn.commit()
+    finally:
+        conn.close()
+    models.create_alert(bed_id, 'bed_exit', 'new')
+
+    # Resolving and deleting before the backfill reaches them leaves the counts alone
+    models.resolve_alerts(bed_id=bed_id)
+    conn = database.get_db()
+    try:
+        alert_counters.delete(conn, "message = 'old' AND id <= 2", ())
+        conn.commit()
+        assert migrations._count_alerts(conn, {}) == 8
+        conn.commit()
+    finally:
+        conn.close()
+    assert_consistent()
@@ -0,0 +1,88 @@
+"""Archived readings: reads see every row exactly once, also after an interrupted run"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('numpy')
+
+import archive
+import database
+import models
+import reading_chunks
+
+
+def _rows(rows):
+    return [(r['id'], r['timestamp'], r['temperature'], r['humidity'], r['motion'], r['distance_cm'])
+            for r in rows]
+
+
+def _snapshot(bed_ids):
+    db = database.get_read_db()
+    try:
+        sums = models.get_temperature_sums(db, 24 * 60)
+    finally:
+        db.close()
+    history = {b: _rows(models.get_readings_for_bed(b, hours=24 * 60, limit=100000)) for b in bed_ids}
+    return history, _rows(models.iter_readings(bed_ids)), {b: (round(s, 6), n) for b, (s, n) in sums.items()}
+
+
+@pytest.fixture
+def beds(db):
+    """Two beds with 40 days of readings, the older ones partly sealed into chunks"""
+    bed_ids = [models.create_bed('A'), models.create_bed('B')]
+    now = datetime.utcnow()
+    rows = []
+    for i in range(40 * 48):
+        for bed_id in bed_ids:
+            rows.append({'bed_id': bed_id, 'timestamp': now - timedelta(days=40) + timedelta(minutes=30 * i),
+                         'temperature': None if i % 97 == 0 else 20 + i % 50 / 10, 'humidity': 50.0,
+                         'motion': i % 3 == 0, 'distance_cm': 60.5})
+    models.insert_readings(rows)
+    reading_chunks.seal_readings(now - timedelta(days=20))
+    return bed_ids
+
+
+def _cutoff():
+    return (datetime.utcnow() - timedelta(days=10)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def test_archive_keeps_reads_unchanged(beds):
+    before = _snapshot(beds)
+    assert archive.archive_readings(_cutoff()) > 0
+    assert _snapshot(beds) == before
+    # Running again finds nothing new to move
+    assert archive.archive_readings(_cutoff()) == 0
+    assert _snapshot(beds) == before
+
+
+def test_interrupted_archive_reads_rows_once(beds, monkeypatch):
+    before = _snapshot(beds)
+
+    def crash(live_ids, chunk_ids):
+        raise RuntimeError('interrupted')
+
+    # Files and manifest are written, the database rows not yet deleted
+    with monkeypatch.context() as patch:
+        patch.setattr(archive, '_delete_archived', crash)
+        with pytest.raises(RuntimeError):
+            archive.archive_readings(_cutoff())
+    assert _snapshot(beds) == before
+
+    archive.archive_readings(_cutoff())
+    assert _snapshot(beds) == before
+    db = database.get_db()
+    try:
+        old = db.execute('SELECT COUNT(*) FROM readings WHERE timestamp < ?',
+                         (archive.archived_before(),)).fetchone()[0]
+    finally:
+        db.close()
+    assert old == 0
+
+
+def test_purge_drops_old_archived_rows(beds):
+    archive.archive_readings(_cutoff())
+    before = (datetime.utcnow() - timedelta(days=25)).strftime('%Y-%m-%d %H:%M:%S')
+    assert archive.purge(before) > 0
+    history = models.get_readings_for_bed(beds[0], hours=24 * 60, limit=100000)
+    assert history and min(r['timestamp'] for r in history) >= before
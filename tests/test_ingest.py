@@ -0,0 +1,155 @@
+"""Sensor ingest: duplicate suppression by sequence number and event-time ordered detection"""
+
+from datetime import datetime, timedelta
+
+import behavior_detection
+import database
+import ingest
+import models
+from sensor_protocol import SEQ_MOD
+
+
+# ==================== SEQUENCE WINDOW ====================
+
+def test_sequence_window_drops_retried_samples():
+    window = ingest.SequenceWindow(size=64)
+    assert [window.accept('esp', seq) for seq in (1, 2, 3)] == [True, True, True]
+    assert not window.accept('esp', 2)
+    assert not window.accept('esp', 3)
+    # Another device has its own numbers
+    assert window.accept('other', 2)
+
+
+def test_sequence_window_accepts_late_unseen_samples():
+    window = ingest.SequenceWindow(size=64)
+    for seq in (10, 12, 13):
+        window.accept('esp', seq)
+    assert window.accept('esp', 11)
+    assert not window.accept('esp', 11)
+
+
+def test_sequence_window_restarts_far_behind_or_on_reset():
+    window = ingest.SequenceWindow(size=64)
+    window.accept('esp', 1000)
+    # Far behind the window: the device restarted its counter
+    assert window.accept('esp', 1)
+    assert not window.accept('esp', 1)
+    assert window.accept('esp', 1, reset=True)
+
+
+def test_sequence_window_wraps_around():
+    window = ingest.SequenceWindow(size=64)
+    window.accept('esp', SEQ_MOD - 1)
+    assert window.accept('esp', 0)
+    assert not window.accept('esp', SEQ_MOD - 1)
+    assert not window.accept('esp', SEQ_MOD)
+
+
+def test_sequence_window_forget_allows_retry():
+    window = ingest.SequenceWindow(size=64)
+    window.accept('esp', 5)
+    window.forget('esp', 5)
+    assert window.accept('esp', 5)
+
+
+def _reading(bed_id, seq, timestamp=None, esp_id='esp-1', **values):
+    payload = {'bed_id': bed_id, 'temperature': 21.0, 'humidity': 50.0, 'motion': 0,
+               'distance_cm': 40.0, 'esp_id': esp_id, 'seq': seq}
+    payload.update(values)
+    if timestamp is not None:
+        payload['timestamp'] = timestamp.strftime('%Y-%m-%dT%H:%M:%SZ')
+    return ingest.parse_payload(payload)
+
+
+def _reading_count():
+    db = database.get_db()
+    try:
+        return db.execute('SELECT COUNT(*) FROM readings').fetchone()[0]
+    finally:
+        db.close()
+
+
+def test_process_reading_stores_a_retried_sample_once(db):
+    bed_id = models.create_bed('A')
+    assert ingest.process_reading(_reading(bed_id, 7)) is not None
+    assert ingest.process_reading(_reading(bed_id, 7)) is None
+    assert _reading_count() == 1
+
+
+def test_process_batch_counts_duplicates(db):
+    bed_id = models.create_bed('A')
+    start = datetime.utcnow() - timedelta(minutes=10)
+    batch = [_reading(bed_id, seq, start + timedelta(seconds=seq)) for seq in range(5)]
+    assert ingest.process_batch(batch)['accepted'] == 5
+    result = ingest.process_batch(batch[3:] + [_reading(bed_id, 5, start + timedelta(seconds=5))])
+    assert (result['accepted'], result['duplicates']) == (1, 2)
+    assert _reading_count() == 6
+
+
+# ==================== EVENT-TIME ORDERING ====================
+
+NOW = datetime(2026, 3, 1, 12, 0, 0)
+
+
+def _at(seconds_ago):
+    return NOW - timedelta(seconds=seconds_ago)
+
+
+def test_orderer_releases_real_time_samples_at_once():
+    orderer = behavior_detection.EventTimeOrderer()
+    assert orderer.push(1, _at(2), 'a', now=NOW) == ([(_at(2), 'a')], False)
+
+
+def test_orderer_reorders_delayed_samples():
+    orderer = behavior_detection.EventTimeOrderer()
+    assert orderer.push(1, _at(60), 'b', now=NOW, live=False) == ([], False)
+    assert orderer.push(1, _at(80), 'a', now=NOW, live=False) == ([], False)
+    # The watermark (newest delayed sample - reorder window) passes the older two
+    ready, late = orderer.push(1, _at(20), 'c', now=NOW, live=False)
+    assert [item for _, item in ready] == ['a', 'b'] and not late
+    assert [item for _, item in orderer.flush(1)] == ['c']
+
+
+def test_orderer_reports_samples_older_than_released_ones():
+    orderer = behavior_detection.EventTimeOrderer()
+    orderer.push(1, _at(2), 'a', now=NOW)
+    assert orderer.push(1, _at(40), 'old', now=NOW, live=False) == ([], True)
+    assert orderer.late_count == 1
+    # Other beds are ordered separately
+    assert orderer.push(2, _at(40), 'b', now=NOW, live=False) == ([], False)
+
+
+def test_orderer_flush_stale_releases_samples_of_a_quiet_bed():
+    orderer = behavior_detection.EventTimeOrderer(reorder_window=30)
+    orderer.push(1, _at(60), 'a', now=NOW, live=False)
+    assert orderer.flush_stale(now=NOW + timedelta(seconds=10)) == []
+    assert orderer.flush_stale(now=NOW + timedelta(seconds=30)) == [(_at(60), 'a')]
+
+
+def test_orderer_moves_a_slow_clock_forward():
+    orderer = behavior_detection.EventTimeOrderer(realtime_lag=15)
+    # A live device whose clock runs two minutes behind
+    for i in range(5):
+        now = NOW + timedelta(seconds=i)
+        ready, late = orderer.push(1, now - timedelta(seconds=120), i, now=now)
+        assert [item for _, item in ready] == [i] and not late
+        assert now - ready[0][0] <= timedelta(seconds=15)
+
+
+def test_batch_detection_runs_in_event_time_order(db, monkeypatch):
+    bed_id = models.create_bed('A')
+    seen = []
+    detect = behavior_detection.detect_abnormal_behaviors
+
+    def spy(*args, event_time=None, update_state=True):
+        seen.append((event_time, update_state))
+        return detect(*args, event_time=event_time, update_state=update_state)
+
+    monkeypatch.setattr(behavior_detection, 'detect_abnormal_behaviors', spy)
+    start = datetime.utcnow() - timedelta(minutes=10)
+    offsets = [30, 0, 90, 60, 120]
+    ingest.process_batch([_reading(bed_id, i, start + timedelta(seconds=s)) for i, s in enumerate(offsets)])
+    times = [event_time for event_time, _ in seen]
+    assert len(times) == len(offsets)
+    assert times == sorted(times)
+    assert all(update_state for _, update_state in seen)
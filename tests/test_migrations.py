@@ -0,0 +1,62 @@
+"""Schema migrations: fresh installs and upgrades from the schema before migrations existed"""
+
+import sqlite3
+from pathlib import Path
+
+import alert_counters
+import database
+import jobs
+import migrations
+
+# schema.sql as shipped before versioned migrations (no categories, counters or telemetry tables)
+BASELINE_SCHEMA = Path(__file__).parent / 'data' / 'baseline_schema.sql'
+
+
+def _pending():
+    return [version for version, _, _, applied, _ in migrations.status() if not applied]
+
+
+def test_fresh_database_is_fully_migrated(db):
+    assert _pending() == []
+    assert jobs.list_jobs() == []
+
+
+def test_upgrade_from_baseline_schema(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(BASELINE_SCHEMA.read_text())
+    conn.execute("INSERT INTO users (username, password_hash, role) VALUES ('admin', 'x', 'admin')")
+    conn.execute("INSERT INTO beds (bed_name, room_no) VALUES ('A', '1')")
+    conn.executemany("INSERT INTO readings (bed_id, timestamp, temperature, humidity, motion, distance_cm) "
+                     "VALUES (1, datetime('now', ?), 21.0, 50.0, 0, 60.0)",
+                     [(f'-{i} minutes',) for i in range(100)])
+    conn.executemany("INSERT INTO alerts (bed_id, alert_type, message, status, created_at) "
+                     "VALUES (1, ?, 'm', ?, datetime('now', ?))",
+                     [(('bed_exit', 'temp_out_of_range', 'custom_exit')[i % 3], ('new', 'resolved')[i % 2],
+                       f'-{i} minutes') for i in range(1200)])
+    conn.commit()
+    conn.close()
+
+    database.init_db()
+    # Startup applies the quick migrations; the alert backfills are left to a job
+    assert _pending() == [5, 6]
+    assert [job['kind'] for job in jobs.list_jobs()] == ['migrate']
+    assert jobs.run_pending('test') == 1
+    assert _pending() == []
+
+    db = database.get_db()
+    try:
+        assert db.execute('SELECT COUNT(*) FROM alerts WHERE category IS NULL').fetchone()[0] == 0
+        assert db.execute("SELECT COUNT(*) FROM alerts WHERE category = ?",
+                          (alert_counters.FALL_RISK,)).fetchone()[0] == 800
+        counted = {tuple(r) for r in db.execute(
+            'SELECT status, SUM(count) FROM alert_counters GROUP BY status')}
+        assert counted == {('new', 600), ('resolved', 600)}
+        assert db.execute('SELECT COUNT(*) FROM readings').fetchone()[0] == 100
+        columns = [r['name'] for r in db.execute("PRAGMA table_info('users')")]
+        assert 'failed_login_attempts' in columns
+    finally:
+        db.close()
+
+    # Starting again finds nothing to do
+    database.init_db()
+    assert len(jobs.list_jobs()) == 1
@@ -0,0 +1,56 @@
+"""Compressed reading chunks: encoding round trip and sealing"""
+
+from datetime import datetime, timedelta
+
+import database
+import models
+import reading_chunks
+
+
+def _decoded(rows, bed_id=3):
+    return [tuple(r[k] for k in ('id', 'timestamp', 'temperature', 'humidity', 'motion', 'distance_cm'))
+            for r in reading_chunks.decode(reading_chunks.encode(rows), bed_id)]
+
+
+def test_round_trip_of_decimal_values():
+    rows = [(10, '2026-03-01 10:00:00', 21.5, 48.25, 0, 60.1),
+            (11, '2026-03-01 10:00:30', 21.6, 48.0, 1, 59.9),
+            (15, '2026-03-01 10:01:00', 19.0, 51.75, 0, 120.0)]
+    assert _decoded(rows) == rows
+
+
+def test_round_trip_of_inexact_and_missing_values():
+    rows = [(1, '2026-03-01 10:00:00', 0.1 + 0.2, None, None, 1e-7),
+            (2, '2026-03-01 10:00:01', 1 / 3, 50.0, 1, -1.0)]
+    assert _decoded(rows) == rows
+
+
+def test_round_trip_of_unparsable_timestamps():
+    rows = [(1, '2026-03-01T10:00:00', 20.0, 50.0, 0, 40.0),
+            (2, None, 20.0, 50.0, 0, 40.0)]
+    assert _decoded(rows) == rows
+
+
+def test_decode_sets_the_bed():
+    rows = [(1, '2026-03-01 10:00:00', 20.0, 50.0, 0, 40.0)]
+    assert reading_chunks.decode(reading_chunks.encode(rows), 7)[0]['bed_id'] == 7
+
+
+def test_sealed_readings_read_back_unchanged(db):
+    bed_id = models.create_bed('A')
+    start = (datetime.utcnow() - timedelta(hours=5)).replace(minute=0, second=0, microsecond=0)
+    models.insert_readings([
+        {'bed_id': bed_id, 'timestamp': start + timedelta(minutes=i), 'temperature': 20 + i % 7 / 10,
+         'humidity': 45.5, 'motion': i % 2, 'distance_cm': 60.0 + i}
+        for i in range(180)
+    ])
+    before = models.get_readings_for_bed(bed_id, hours=24, limit=1000)
+
+    assert reading_chunks.seal_readings() >= 2
+    db_conn = database.get_db()
+    try:
+        live = db_conn.execute('SELECT COUNT(*) FROM readings').fetchone()[0]
+    finally:
+        db_conn.close()
+    assert live < 180
+    assert models.get_readings_for_bed(bed_id, hours=24, limit=1000) == before
@@ -0,0 +1,58 @@
+"""Rule engine (rules.py) against the detector it replaced"""
+
+import random
+from datetime import datetime, timedelta
+
+import models
+import rules
+import thresholds
+from legacy_detector import LegacyDetector
+
+
+def _samples(bed_ids, count, seed=1):
+    """(bed_id, temperature, humidity, motion, distance_cm, event_time, update_state) tuples"""
+    rng = random.Random(seed)
+    event_time = datetime(2026, 3, 1, 18, 0)
+    for _ in range(count):
+        event_time += timedelta(seconds=rng.choice([5, 30, 60, 240]))
+        yield (rng.choice(bed_ids), round(rng.uniform(15, 27), 2), round(rng.uniform(20, 80), 2),
+               int(rng.random() < 0.2), rng.choice([0, 5, 10, 45, 60, 80]), event_time,
+               rng.random() > 0.05)
+
+
+def test_rules_match_legacy_detector(db):
+    default_bed, rehab_bed = models.create_bed('A'), models.create_bed('B')
+    profile = thresholds.save_profile('rehab', {'no_motion_timeout_minutes': 5,
+                                                'restlessness_start_time': '20:00',
+                                                'restlessness_motions_per_hour': 4})
+    thresholds.set_bed_thresholds(rehab_bed, profile, {})
+
+    legacy, detector = LegacyDetector(), rules.Detector()
+    fired = set()
+    for bed_id, temperature, humidity, motion, distance_cm, event_time, update_state in _samples(
+            [default_bed, rehab_bed], 20000):
+        expected = legacy.check_reading(bed_id, temperature, humidity)
+        assert detector.evaluate(rules.READING, bed_id, temperature, humidity, motion, distance_cm) == expected
+        fired.update(alert[0] for alert in expected)
+
+        expected = legacy.detect(bed_id, temperature, humidity, motion, distance_cm,
+                                 event_time=event_time, update_state=update_state)
+        assert detector.evaluate(rules.BEHAVIOR, bed_id, temperature, humidity, motion, distance_cm,
+                                 event_time=event_time, update_state=update_state) == expected
+        fired.update(alert[0] for alert in expected)
+
+    # The stream exercises every rule
+    assert fired == {rule.alert_type for rule in rules.RULES}
+
+
+def test_replay_reports_stored_readings(db):
+    bed_id = models.create_bed('A')
+    start = datetime.utcnow() - timedelta(hours=2)
+    models.insert_readings([
+        {'bed_id': bed_id, 'timestamp': start + timedelta(minutes=i), 'temperature': 22.0, 'humidity': 50.0,
+         'motion': 1 if i == 0 else 0, 'distance_cm': 40.0}
+        for i in range(60)
+    ])
+    alerts = list(rules.replay(models.iter_readings([bed_id])))
+    assert [alert[2] for alert in alerts] == ['long_inactivity'] * len(alerts)
+    assert alerts
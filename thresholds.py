@@ -0,0 +1,225 @@
+"""
+Per-bed alert thresholds for Patient Monitoring System
+A bed's thresholds come from the global settings, then its threshold
+profile (e.g. post-op, rehab), then its own overrides. They are compiled
+into one tuple per bed, indexed by the slot constants below, so the ingest
+and detection path reads `limits[TEMP_MIN]` instead of fetching and
+converting settings for every reading. The compiled table is rebuilt only
+after a change: at once in the process that made it, within CHECK_INTERVAL
+seconds in the others (async ingest server, other workers).
+"""
+
+import threading
+import time
+import uuid
+
+from database import get_db, get_read_db
+
+# Slots of a compiled threshold row
+(TEMP_MIN, TEMP_MAX, HUMIDITY_MIN, HUMIDITY_MAX, DISTANCE_BED_EXIT_CM, NO_MOTION_TIMEOUT_MINUTES,
+ FALL_DROP_THRESHOLD_CM, RESTLESSNESS_MOTIONS_PER_HOUR, RESTLESSNESS_START, RESTLESSNESS_END,
+ LOW_HUMIDITY_DANGER, HIGH_HUMIDITY_DANGER) = range(12)
+
+# Setting key and default of each slot, in slot order
+KEYS = (
+    'temp_min', 'temp_max', 'humidity_min', 'humidity_max', 'distance_bed_exit_cm',
+    'no_motion_timeout_minutes', 'fall_drop_threshold_cm', 'restlessness_motions_per_hour',
+    'restlessness_start_time', 'restlessness_end_time', 'low_humidity_danger', 'high_humidity_danger',
+)
+DEFAULTS = (18.0, 24.0, 40.0, 60.0, 50.0, 30.0, 30.0, 20.0, '22:00', '06:00', 30.0, 70.0)
+
+# 'HH:MM' settings; compiled to minutes after midnight
+TIME_KEYS = ('restlessness_start_time', 'restlessness_end_time')
+
+# Settings key bumped on every threshold change, so other processes notice
+VERSION_KEY = 'thresholds_version'
+
+CHECK_INTERVAL = 5.0   # seconds between checks for changes made by other processes
+
+_lock = threading.Lock()
+_table = None          # (version, default row, {bed_id: row})
+_next_check = 0.0
+
+def parse(key, value):
+    """Compiled value of a threshold setting; raises ValueError if the key or value is invalid"""
+    if key not in KEYS:
+        raise ValueError(f'Unknown threshold: {key}')
+    if key in TIME_KEYS:
+        hours, minutes = str(value).split(':')
+        hours, minutes = int(hours), int(minutes)
+        if not (0 <= hours < 24 and 0 <= minutes < 60):
+            raise ValueError(f'{key} must be a time HH:MM')
+        return hours * 60 + minutes
+    return float(value)
+
+def _apply(row, values):
+    row = list(row)
+    for key, value in values:
+        try:
+            row[KEYS.index(key)] = parse(key, value)
+        except ValueError:
+            pass   # unusable stored value: keep the inherited one
+    return tuple(row)
+
+# ==================== COMPILED TABLE ====================
+
+def _compile(db):
+    settings = {r['key']: r['value'] for r in db.execute('SELECT key, value FROM settings')}
+    default = _apply(tuple(parse(k, d) for k, d in zip(KEYS, DEFAULTS)),
+                     [(k, settings[k]) for k in KEYS if k in settings])
+    profiles = {}
+    for r in db.execute('SELECT profile_id, key, value FROM profile_thresholds ORDER BY profile_id'):
+        profiles.setdefault(r['profile_id'], []).append((r['key'], r['value']))
+    profiles = {pid: _apply(default, values) for pid, values in profiles.items()}
+    overrides = {}
+    for r in db.execute('SELECT bed_id, key, value FROM bed_thresholds ORDER BY bed_id'):
+        overrides.setdefault(r['bed_id'], []).append((r['key'], r['value']))
+    beds = {}
+    for r in db.execute('SELECT id, threshold_profile_id FROM beds'):
+        row = profiles.get(r['threshold_profile_id'], default)
+        if r['id'] in overrides:
+            row = _apply(row, overrides[r['id']])
+        if row is not default:
+            beds[r['id']] = row
+    return settings.get(VERSION_KEY), default, beds
+
+def _refresh():
+    global _table, _next_check
+    with _lock:
+        db = get_read_db()
+        try:
+            if _table is not None:
+                row = db.execute('SELECT value FROM settings WHERE key = ?', (VERSION_KEY,)).fetchone()
+                if (row['value'] if row else None) == _table[0]:
+                    _next_check = time.monotonic() + CHECK_INTERVAL
+                    return _table
+            _table = _compile(db)
+            _next_check = time.monotonic() + CHECK_INTERVAL
+            return _table
+        finally:
+            db.close()
+
+def for_bed(bed_id):
+    """Compiled threshold row of a bed (index it with the slot constants)"""
+    table = _table
+    if table is None or time.monotonic() >= _next_check:
+        table = _refresh()
+    return table[2].get(bed_id, table[1])
+
+def invalidate():
+    """Drop the compiled table; the next lookup recompiles it"""
+    global _table
+    _table = None
+
+def changed(db):
+    """Mark thresholds as changed (call in the change's transaction)"""
+    db.execute('''
+        INSERT INTO settings (key, value) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    ''', (VERSION_KEY, uuid.uuid4().hex))
+
+# ==================== PROFILES AND OVERRIDES ====================
+
+def _values(values):
+    """Validated {key: value} as stored (times as 'HH:MM' text)"""
+    stored = {}
+    for key, value in (values or {}).items():
+        parse(key, value)
+        stored[key] = str(value) if key in TIME_KEYS else str(float(value))
+    return stored
+
+def list_profiles():
+    """Threshold profiles with their values and the number of beds using each"""
+    db = get_read_db()
+    try:
+        profiles = [dict(r) for r in db.execute('''
+            SELECT p.id, p.name,
+                   (SELECT COUNT(*) FROM beds b WHERE b.threshold_profile_id = p.id) AS beds
+            FROM threshold_profiles p ORDER BY p.name
+        ''')]
+        values = {}
+        for r in db.execute('SELECT profile_id, key, value FROM profile_thresholds'):
+            values.setdefault(r['profile_id'], {})[r['key']] = r['value']
+        for profile in profiles:
+            profile['values'] = values.get(profile['id'], {})
+        return profiles
+    finally:
+        db.close()
+
+def save_profile(name, values):
+    """Create or replace the profile `name` with `values` ({setting key: value}); returns its id"""
+    name = (name or '').strip()
+    if not name:
+        raise ValueError('Profile name is required')
+    values = _values(values)
+    db = get_db()
+    try:
+        row = db.execute('SELECT id FROM threshold_profiles WHERE name = ?', (name,)).fetchone()
+        profile_id = row['id'] if row else db.execute(
+            'INSERT INTO threshold_profiles (name) VALUES (?)', (name,)).lastrowid
+        db.execute('DELETE FROM profile_thresholds WHERE profile_id = ?', (profile_id,))
+        db.executemany('INSERT INTO profile_thresholds (profile_id, key, value) VALUES (?, ?, ?)',
+                       [(profile_id, k, v) for k, v in values.items()])
+        changed(db)
+        db.commit()
+    finally:
+        db.close()
+    invalidate()
+    return profile_id
+
+def delete_profile(profile_id):
+    """Delete a profile; its beds fall back to the global settings. Returns False if it doesn't exist"""
+    db = get_db()
+    try:
+        db.execute('UPDATE beds SET threshold_profile_id = NULL WHERE threshold_profile_id = ?', (profile_id,))
+        db.execute('DELETE FROM profile_thresholds WHERE profile_id = ?', (profile_id,))
+        deleted = db.execute('DELETE FROM threshold_profiles WHERE id = ?', (profile_id,)).rowcount
+        changed(db)
+        db.commit()
+    finally:
+        db.close()
+    invalidate()
+    return deleted > 0
+
+def get_bed_thresholds(bed_id):
+    """A bed's profile, own overrides and effective thresholds, or None if the bed doesn't exist"""
+    db = get_read_db()
+    try:
+        bed = db.execute('SELECT threshold_profile_id FROM beds WHERE id = ?', (bed_id,)).fetchone()
+        if bed is None:
+            return None
+        overrides = {r['key']: r['value'] for r in db.execute(
+            'SELECT key, value FROM bed_thresholds WHERE bed_id = ?', (bed_id,))}
+    finally:
+        db.close()
+    row = for_bed(bed_id)
+    effective = {}
+    for slot, key in enumerate(KEYS):
+        value = row[slot]
+        effective[key] = f'{value // 60:02d}:{value % 60:02d}' if key in TIME_KEYS else value
+    return {'bed_id': bed_id, 'profile_id': bed['threshold_profile_id'],
+            'overrides': overrides, 'effective': effective}
+
+def set_bed_thresholds(bed_id, profile_id, overrides):
+    """Give a bed a profile (None = global settings) and replace its own overrides"""
+    overrides = _values(overrides)
+    db = get_db()
+    try:
+        if profile_id is not None and not db.execute(
+                'SELECT 1 FROM threshold_profiles WHERE id = ?', (profile_id,)).fetchone():
+            raise ValueError(f'Unknown threshold profile: {profile_id}')
+        if not db.execute('UPDATE beds SET threshold_profile_id = ? WHERE id = ?', (profile_id, bed_id)).rowcount:
+            raise ValueError(f'Unknown bed: {bed_id}')
+        db.execute('DELETE FROM bed_thresholds WHERE bed_id = ?', (bed_id,))
+        db.executemany('INSERT INTO bed_thresholds (bed_id, key, value) VALUES (?, ?, ?)',
+                       [(bed_id, k, v) for k, v in overrides.items()])
+        changed(db)
+        db.commit()
+    finally:
+        db.close()
+    invalidate()
+
+def remove_bed(db, bed_id):
+    """Drop a deleted bed's overrides (the caller commits)"""
+    db.execute('DELETE FROM bed_thresholds WHERE bed_id = ?', (bed_id,))
+    changed(db)